@@ -0,0 +1,199 @@
+# === AGRUPADOR DE SOLICITUDES (MICRO-BATCHING) ===
+"""
+Agrupa llamadas individuales que llegan casi a la vez en una sola llamada
+por lotes al servicio remoto.
+
+Cada llamada a `enviar` espera como mucho `ventana_ms` desde la llegada de la
+primera solicitud del lote (o hasta completar `max_lote`), y recibe su propio
+resultado cuando el lote termina. El lote se procesa con el plazo más amplio
+de las peticiones que contiene, y cada llamada deja de esperar cuando vence
+el plazo de su propia petición.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as TiempoAgotado
+
+from resiliencia import plazo, vencimiento, tiempo_restante, PlazoAgotado
+
+# Límites superiores (en ms) de los buckets del histograma de espera
+_BUCKETS_ESPERA_MS = (1, 2, 5, 10, 20, 50, 100)
+
+_agrupadores = {}
+
+
+class AgrupadorSolicitudes:
+    """
+    Coalescedor en proceso de solicitudes individuales.
+
+    Args:
+        nombre (str): Nombre con el que se publican las métricas
+        procesar_lote (callable): Recibe una lista de elementos y devuelve una
+            lista de resultados en el mismo orden
+        ventana_ms (float): Tiempo máximo de espera para completar un lote.
+            Con 0 el agrupador se desactiva y cada llamada se procesa sola
+        max_lote (int): Tamaño máximo de un lote
+        concurrencia (int): Lotes que pueden estar en vuelo a la vez
+    """
+
+    def __init__(self, nombre, procesar_lote, ventana_ms=0, max_lote=10, concurrencia=4):
+        self.nombre = nombre
+        self.procesar_lote = procesar_lote
+        self.ventana = ventana_ms / 1000.0
+        self.max_lote = max(1, max_lote)
+        self.concurrencia = max(1, concurrencia)
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cola = None
+        self._executor = None
+        self._reiniciar_metricas()
+
+        _agrupadores[nombre] = self
+
+    @property
+    def activo(self):
+        return self.ventana > 0 and self.max_lote > 1
+
+    def enviar(self, elemento):
+        """
+        Encola un elemento y espera su resultado.
+
+        Args:
+            elemento: Elemento a procesar
+
+        Returns:
+            El resultado correspondiente a `elemento`
+
+        Raises:
+            PlazoAgotado: Si vence el plazo de la petición antes de tener el resultado
+        """
+        if not self.activo:
+            return self.procesar_lote([elemento])[0]
+
+        self._asegurar_hilo()
+        futuro = Future()
+        self._cola.put((elemento, futuro, time.perf_counter(), vencimiento()))
+        restante = tiempo_restante()
+        try:
+            return futuro.result(timeout=None if restante is None else max(restante, 0))
+        except TiempoAgotado:
+            raise PlazoAgotado(self.nombre) from None
+
+    def metricas(self):
+        """
+        Devuelve la distribución de tamaños de lote y el retraso añadido.
+
+        Returns:
+            dict: Contadores y histogramas del agrupador
+        """
+        with self._lock:
+            solicitudes = self._solicitudes
+            return {
+                'activo': self.activo,
+                'ventana_ms': self.ventana * 1000,
+                'max_lote': self.max_lote,
+                'solicitudes': solicitudes,
+                'lotes': self._lotes,
+                'tamano_lote': {str(tamano): total for tamano, total in sorted(self._tamanos.items())},
+                'espera_ms': {
+                    'promedio': (self._espera_total / solicitudes * 1000) if solicitudes else 0.0,
+                    'maxima': self._espera_maxima * 1000,
+                    'buckets': dict(zip(
+                        [f'<={limite}' for limite in _BUCKETS_ESPERA_MS] + ['+Inf'],
+                        self._buckets_espera
+                    ))
+                }
+            }
+
+    def _reiniciar_metricas(self):
+        self._solicitudes = 0
+        self._lotes = 0
+        self._tamanos = {}
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+        self._buckets_espera = [0] * (len(_BUCKETS_ESPERA_MS) + 1)
+
+    def _asegurar_hilo(self):
+        # Tras un fork el hilo despachador no existe en el hijo: se recrea
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._cola = queue.Queue()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrencia,
+                thread_name_prefix=f'agrupador-{self.nombre}'
+            )
+            hilo = threading.Thread(
+                target=self._despachar,
+                args=(self._cola, self._executor),
+                name=f'agrupador-{self.nombre}',
+                daemon=True
+            )
+            hilo.start()
+            self._pid = os.getpid()
+
+    def _despachar(self, cola, executor):
+        while True:
+            lote = [cola.get()]
+            limite = lote[0][2] + self.ventana
+
+            while len(lote) < self.max_lote:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            self._registrar_lote(lote)
+            executor.submit(self._ejecutar, lote)
+
+    def _registrar_lote(self, lote):
+        ahora = time.perf_counter()
+        with self._lock:
+            self._lotes += 1
+            self._solicitudes += len(lote)
+            self._tamanos[len(lote)] = self._tamanos.get(len(lote), 0) + 1
+            for _, _, llegada, _ in lote:
+                espera = ahora - llegada
+                self._espera_total += espera
+                self._espera_maxima = max(self._espera_maxima, espera)
+                for i, limite in enumerate(_BUCKETS_ESPERA_MS):
+                    if espera * 1000 <= limite:
+                        self._buckets_espera[i] += 1
+                        break
+                else:
+                    self._buckets_espera[-1] += 1
+
+    def _ejecutar(self, lote):
+        vencimientos = [limite for _, _, _, limite in lote]
+        hasta = None if None in vencimientos else max(vencimientos)
+        try:
+            with plazo(hasta=hasta):
+                resultados = self.procesar_lote([elemento for elemento, _, _, _ in lote])
+            if len(resultados) != len(lote):
+                raise RuntimeError(
+                    f"El lote devolvió {len(resultados)} resultados para {len(lote)} solicitudes"
+                )
+        except Exception as e:
+            for _, futuro, _, _ in lote:
+                futuro.set_exception(e)
+            return
+
+        for (_, futuro, _, _), resultado in zip(lote, resultados):
+            futuro.set_result(resultado)
+
+
+def metricas_agrupadores():
+    """
+    Devuelve las métricas de todos los agrupadores del proceso.
+
+    Returns:
+        dict: Métricas indexadas por nombre del agrupador
+    """
+    return {nombre: agrupador.metricas() for nombre, agrupador in _agrupadores.items()}
@@ -0,0 +1,146 @@
+"""
+Mide el arranque de un worker: importa la aplicación en un intérprete nuevo
+con `python -X importtime` y resume el tiempo de importación, los módulos
+cargados y si alguno de los SDK pesados se importa antes de la primera
+petición.
+
+Uso:
+    python benchmarks/benchmark_arranque.py [--modulo main] [--repeticiones N]
+        [--salida arranque.json] [--comparar base.json] [--tolerancia 0.2]
+
+Con --comparar termina con código 1 si la mediana del tiempo de importación
+empeora más que la tolerancia respecto al archivo base o si se importa algún
+módulo prohibido, de modo que puede usarse en CI.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deben importarse al arrancar: se cargan con la primera petición
+PROHIBIDOS = ('azure', 'msrest', 'PIL')
+
+_LINEA = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def importar(modulo):
+    """
+    Importa el módulo en un intérprete nuevo con -X importtime.
+
+    Returns:
+        tuple: (segundos de reloj, lista de (módulo, propio_us, acumulado_us, nivel))
+    """
+    inicio = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=RAIZ, capture_output=True, text=True
+    )
+    reloj = time.perf_counter() - inicio
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+
+    modulos = []
+    for linea in proceso.stderr.splitlines():
+        coincidencia = _LINEA.match(linea)
+        if coincidencia:
+            propio, acumulado, sangria, nombre = coincidencia.groups()
+            modulos.append((nombre, int(propio), int(acumulado), len(sangria) // 2))
+    return reloj, modulos
+
+
+def medir(modulo, repeticiones):
+    # La primera ejecución compila los .pyc y no se cuenta
+    importar(modulo)
+
+    relojes, totales, ultima = [], [], None
+    for _ in range(repeticiones):
+        reloj, modulos = importar(modulo)
+        relojes.append(reloj)
+        totales.append(sum(propio for _, propio, _, _ in modulos))
+        ultima = modulos
+
+    # Hijos directos del módulo medido, por tiempo acumulado
+    directos = sorted(
+        ((nombre, acumulado) for nombre, _, acumulado, nivel in ultima if nivel == 1),
+        key=lambda par: par[1], reverse=True
+    )
+    prohibidos = sorted({
+        nombre for nombre, _, _, _ in ultima
+        if nombre.split('.')[0] in PROHIBIDOS
+    })
+
+    return {
+        'modulo': modulo,
+        'python': platform.python_version(),
+        'repeticiones': repeticiones,
+        'importacion_ms': {
+            'mediana': round(statistics.median(totales) / 1000, 1),
+            'minima': round(min(totales) / 1000, 1),
+            'maxima': round(max(totales) / 1000, 1),
+        },
+        'proceso_ms': {
+            'mediana': round(statistics.median(relojes) * 1000, 1),
+            'minima': round(min(relojes) * 1000, 1),
+        },
+        'modulos_importados': len(ultima),
+        'mas_lentos': [{'modulo': nombre, 'ms': round(us / 1000, 1)} for nombre, us in directos[:10]],
+        'prohibidos_importados': prohibidos,
+    }
+
+
+def comparar(resultado, base, tolerancia):
+    """Devuelve la lista de regresiones respecto a una medición anterior"""
+    problemas = []
+    actual = resultado['importacion_ms']['mediana']
+    anterior = base['importacion_ms']['mediana']
+    if actual > anterior * (1 + tolerancia):
+        problemas.append(
+            f"importación {actual} ms frente a {anterior} ms (+{(actual / anterior - 1) * 100:.0f}%)"
+        )
+    if resultado['prohibidos_importados']:
+        problemas.append(f"módulos importados al arrancar: {', '.join(resultado['prohibidos_importados'])}")
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modulo', default='main')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--salida')
+    parser.add_argument('--comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    resultado = medir(args.modulo, args.repeticiones)
+
+    print(f"Arranque de '{args.modulo}' (Python {resultado['python']}, {args.repeticiones} repeticiones)")
+    print(f"  importación: mediana {resultado['importacion_ms']['mediana']} ms "
+          f"(mín {resultado['importacion_ms']['minima']}, máx {resultado['importacion_ms']['maxima']})")
+    print(f"  proceso completo: mediana {resultado['proceso_ms']['mediana']} ms")
+    print(f"  módulos importados: {resultado['modulos_importados']}")
+    for entrada in resultado['mas_lentos']:
+        print(f"    {entrada['ms']:>8.1f} ms  {entrada['modulo']}")
+    if resultado['prohibidos_importados']:
+        print(f"  ⚠️ importados al arrancar: {', '.join(resultado['prohibidos_importados'])}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            problemas = comparar(resultado, json.load(archivo), args.tolerancia)
+        for problema in problemas:
+            print(f"REGRESIÓN: {problema}")
+        sys.exit(1 if problemas else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Prueba de carga de la aplicación contra el servidor Azure simulado
+(`stub_azure.py`), sin llamar a Azure.
+
+Arranca el servidor simulado y gunicorn con gunicorn.conf.py apuntando a él,
+y lanza contra cada ruta un número fijo de peticiones con la concurrencia
+indicada (cada hilo cliente reutiliza su conexión). Para cada ruta informa
+de peticiones por segundo, latencias p50/p95/p99, respuestas con error y
+llamadas a Azure por petición (reintentos incluidos), contadas por el
+servidor simulado. Las respuestas 200 que llevan un error en el cuerpo
+(por ejemplo un sentimiento que no se pudo calcular) cuentan como errores
+('200_con_error'). Los textos e imágenes son distintos en cada petición,
+así que la caché de resultados no evita llamadas.
+
+Uso:
+    python benchmarks/benchmark_carga.py [--concurrencia 16] [--peticiones 200]
+        [--rutas sentimiento,traducir] [--workers 2] [--modo wsgi|asgi]
+        [--latencia-ms 80] [--jitter-ms 40] [--tasa-error 0] [--tasa-429 0] [--tps 0]
+        [--entorno SENTIMIENTO_VENTANA_MS=5] [--salida carga.json]
+        [--comparar base.json] [--tolerancia 0.2]
+
+Con --comparar termina con código 1 si en alguna ruta el p95 o las llamadas
+a Azure por petición empeoran, o las peticiones por segundo bajan, más que
+la tolerancia respecto al archivo base.
+"""
+import os
+import io
+import sys
+import json
+import time
+import signal
+import socket
+import uuid
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+import urllib.request
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _esperar(url, timeout=60):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"No respondió {url}")
+
+
+def _leer_json(url):
+    with urllib.request.urlopen(url, timeout=10) as respuesta:
+        return json.load(respuesta)
+
+
+# --- Peticiones de cada ruta -------------------------------------------------
+
+_imagenes = {}
+
+
+def _imagen(numero):
+    """PNG de 64x64 de un color distinto para cada número"""
+    if numero not in _imagenes:
+        from PIL import Image
+        salida = io.BytesIO()
+        color = (numero % 256, numero // 256 % 256, numero // 65536 % 256)
+        Image.new('RGB', (64, 64), color).save(salida, 'PNG')
+        _imagenes[numero] = salida.getvalue()
+    return _imagenes[numero]
+
+
+def _multipart(archivos):
+    limite = 'limite-benchmark'
+    cuerpo = io.BytesIO()
+    for campo, nombre, contenido in archivos:
+        cuerpo.write(f'--{limite}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nombre}"\r\n'
+                     f'Content-Type: image/png\r\n\r\n'.encode())
+        cuerpo.write(contenido)
+        cuerpo.write(b'\r\n')
+    cuerpo.write(f'--{limite}--\r\n'.encode())
+    return cuerpo.getvalue(), {'Content-Type': f'multipart/form-data; boundary={limite}'}
+
+
+def _json(datos):
+    return json.dumps(datos).encode('utf-8'), {'Content-Type': 'application/json'}
+
+
+def _conversacion(hilo):
+    # Cada hilo cliente mantiene una conversación: solo su primer mensaje es el saludo
+    return hilo.setdefault('conversacion', uuid.uuid4().hex)
+
+
+# nombre -> función (número de petición, estado del hilo) -> (método, ruta, cuerpo, cabeceras)
+RUTAS = {
+    'inicio': lambda n, hilo: ('GET', '/', None, {}),
+    'sentimiento': lambda n, hilo: ('POST', '/api/analizar-sentimiento',
+                                    *_json({'texto': f'Me encanta el producto número {n}'})),
+    'sentimiento_lote': lambda n, hilo: ('POST', '/api/analizar-sentimiento/lote',
+                                         *_json({'textos': [f'Reseña {n}-{i}: todo bien' for i in range(10)]})),
+    'traducir': lambda n, hilo: ('POST', '/api/traducir', *_json({'texto': f'Hola, pedido {n}', 'idioma': 'en'})),
+    'traducir_matriz': lambda n, hilo: ('POST', '/api/traducir', *_json({
+        'textos': [f'Frase {n}-{i}' for i in range(5)], 'idiomas': ['en', 'fr']
+    })),
+    'imagen': lambda n, hilo: ('POST', '/api/analizar-imagen', *_multipart([('imagen', f'{n}.png', _imagen(n))])),
+    'imagen_lote': lambda n, hilo: ('POST', '/api/analizar-imagen/lote', *_multipart([
+        ('imagenes', f'{n}-{i}.png', _imagen(1_000_000 + n * 4 + i)) for i in range(4)
+    ])),
+    'chat': lambda n, hilo: ('POST', '/api/chat', *_json({
+        'message': f'Tengo una duda sobre el artículo {n}', 'conversation_id': _conversacion(hilo)
+    })),
+    'chat_stream': lambda n, hilo: ('POST', '/api/chat/stream', *_json({
+        'message': f'Tengo una duda sobre el artículo {n}', 'conversation_id': _conversacion(hilo)
+    })),
+    'directline_token': lambda n, hilo: ('GET', '/api/directline/token', None, {}),
+}
+
+
+# --- Carga ----------------------------------------------------------------------
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def lanzar(puerto, nombre, peticiones, concurrencia, inicio_numeracion=0):
+    """
+    Lanza `peticiones` contra una ruta desde `concurrencia` hilos.
+
+    Returns:
+        tuple: (segundos totales, latencias en ms, {estado: cuenta})
+    """
+    crear = RUTAS[nombre]
+    siguiente = iter(range(inicio_numeracion, inicio_numeracion + peticiones))
+    lock = threading.Lock()
+    latencias, estados = [], {}
+
+    def cliente():
+        conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=120)
+        hilo = {}
+        while True:
+            with lock:
+                numero = next(siguiente, None)
+            if numero is None:
+                break
+            metodo, ruta, cuerpo, cabeceras = crear(numero, hilo)
+            inicio = time.perf_counter()
+            try:
+                conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                datos = respuesta.read()
+                estado = respuesta.status
+                if estado == 200 and b'"error":' in datos:
+                    # La ruta respondió 200 pero con el error de Azure en el cuerpo
+                    estado = '200_con_error'
+            except (OSError, http.client.HTTPException):
+                conexion.close()
+                conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=120)
+                estado = 'conexion'
+            ms = (time.perf_counter() - inicio) * 1000
+            with lock:
+                latencias.append(ms)
+                estados[estado] = estados.get(estado, 0) + 1
+        conexion.close()
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return time.perf_counter() - inicio, latencias, estados
+
+
+def medir_ruta(puerto, url_simulado, nombre, peticiones, concurrencia, calentamiento):
+    lanzar(puerto, nombre, calentamiento, concurrencia, inicio_numeracion=10_000_000)
+    antes = _leer_json(f'{url_simulado}/estadisticas')
+    segundos, latencias, estados = lanzar(puerto, nombre, peticiones, concurrencia)
+    despues = _leer_json(f'{url_simulado}/estadisticas')
+
+    llamadas = {
+        servicio: despues[servicio]['llamadas'] - antes[servicio]['llamadas']
+        for servicio in despues
+        if despues[servicio]['llamadas'] != antes[servicio]['llamadas']
+    }
+    limitadas = sum(despues[s]['429'] - antes[s]['429'] for s in despues)
+    return {
+        'peticiones': peticiones,
+        'rps': round(peticiones / segundos, 1),
+        'p50_ms': round(_percentil(latencias, 50), 1),
+        'p95_ms': round(_percentil(latencias, 95), 1),
+        'p99_ms': round(_percentil(latencias, 99), 1),
+        'max_ms': round(max(latencias), 1),
+        'errores': {str(estado): cuenta for estado, cuenta in sorted(estados.items(), key=str) if estado != 200},
+        'llamadas_azure_por_peticion': round(sum(llamadas.values()) / peticiones, 2),
+        'llamadas_por_servicio': llamadas,
+        'respuestas_429_simuladas': limitadas,
+    }
+
+
+def ejecutar(args):
+    puerto_simulado, puerto = _puerto_libre(), _puerto_libre()
+    url_simulado = f'http://127.0.0.1:{puerto_simulado}'
+    simulado = subprocess.Popen(
+        [sys.executable, 'stub_azure.py', '--puerto', str(puerto_simulado),
+         '--latencia-ms', str(args.latencia_ms), '--jitter-ms', str(args.jitter_ms),
+         '--tasa-error', str(args.tasa_error), '--tasa-429', str(args.tasa_429),
+         '--retry-after', str(args.retry_after), '--tps', str(args.tps)],
+        cwd=RAIZ, stdout=subprocess.DEVNULL
+    )
+    entorno = dict(
+        os.environ,
+        PORT=str(puerto),
+        APP_MODO=args.modo,
+        GUNICORN_WORKERS=str(args.workers),
+        TEXT_ANALYTICS_KEY='simulada', TEXT_ANALYTICS_ENDPOINT=url_simulado,
+        LANGUAGE_KEY='simulada', LANGUAGE_ENDPOINT=url_simulado,
+        TRANSLATOR_KEY='simulada', TRANSLATOR_ENDPOINT=url_simulado, TRANSLATOR_REGION='local',
+        VISION_KEY='simulada', VISION_ENDPOINT=url_simulado,
+        DIRECTLINE_URL=f'{url_simulado}/v3/directline', DIRECT_LINE_SECRET='DLSECRET_simulado',
+        LOG_NIVEL='WARNING',
+        LIMITE_CLIENTES='0',  # todas las peticiones llegan desde la misma IP
+    )
+    for asignacion in args.entorno:
+        clave, _, valor = asignacion.partition('=')
+        entorno[clave] = valor
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{puerto}',
+         '--access-logfile', '/dev/null'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _esperar(f'{url_simulado}/configuracion')
+        _esperar(f'http://127.0.0.1:{puerto}/api/estado/backends')
+        rutas = {}
+        for nombre in args.rutas:
+            rutas[nombre] = medir_ruta(puerto, url_simulado, nombre, args.peticiones, args.concurrencia, args.calentamiento)
+            resultado = rutas[nombre]
+            errores = ', '.join(f'{estado}: {cuenta}' for estado, cuenta in resultado['errores'].items())
+            print(f"  {nombre:<18} {resultado['rps']:>8.1f} rps  p50 {resultado['p50_ms']:>7.1f} ms  "
+                  f"p95 {resultado['p95_ms']:>7.1f} ms  p99 {resultado['p99_ms']:>7.1f} ms  "
+                  f"azure/petición {resultado['llamadas_azure_por_peticion']:>5}"
+                  + (f"  errores {errores}" if errores else ''), flush=True)
+    finally:
+        servidor.send_signal(signal.SIGTERM)
+        servidor.wait(timeout=30)
+        simulado.terminate()
+        simulado.wait(timeout=10)
+
+    return {
+        'python': platform.python_version(),
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'configuracion': {
+            'modo': args.modo,
+            'workers': args.workers,
+            'concurrencia': args.concurrencia,
+            'peticiones_por_ruta': args.peticiones,
+            'simulado': {
+                'latencia_ms': args.latencia_ms,
+                'jitter_ms': args.jitter_ms,
+                'tasa_error': args.tasa_error,
+                'tasa_429': args.tasa_429,
+                'tps': args.tps,
+            },
+            'entorno': args.entorno,
+        },
+        'rutas': rutas,
+    }
+
+
+def comparar(resultado, base, tolerancia):
+    """Devuelve la lista de regresiones respecto a una medición anterior"""
+    problemas = []
+    for nombre, actual in resultado['rutas'].items():
+        anterior = base.get('rutas', {}).get(nombre)
+        if anterior is None:
+            continue
+        if actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            problemas.append(f"{nombre}: p95 {actual['p95_ms']} ms frente a {anterior['p95_ms']} ms")
+        if actual['rps'] < anterior['rps'] * (1 - tolerancia):
+            problemas.append(f"{nombre}: {actual['rps']} rps frente a {anterior['rps']} rps")
+        if actual['llamadas_azure_por_peticion'] > anterior['llamadas_azure_por_peticion'] * (1 + tolerancia):
+            problemas.append(
+                f"{nombre}: {actual['llamadas_azure_por_peticion']} llamadas a Azure por petición "
+                f"frente a {anterior['llamadas_azure_por_peticion']}"
+            )
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--peticiones', type=int, default=200, help='peticiones medidas por ruta')
+    parser.add_argument('--calentamiento', type=int, default=20, help='peticiones previas no medidas por ruta')
+    parser.add_argument('--rutas', type=lambda valor: valor.split(','), default=list(RUTAS),
+                        help=f"separadas por comas (por defecto todas: {','.join(RUTAS)})")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--modo', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--latencia-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=40)
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--tasa-429', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--tps', type=float, default=0, help='cuota por segundo de cada servicio simulado')
+    parser.add_argument('--entorno', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='variable de entorno adicional para la aplicación (repetible)')
+    parser.add_argument('--salida')
+    parser.add_argument('--comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    desconocidas = [nombre for nombre in args.rutas if nombre not in RUTAS]
+    if desconocidas:
+        parser.error(f"rutas desconocidas: {', '.join(desconocidas)}")
+
+    print(f"Carga ({args.modo}, {args.workers} workers, concurrencia {args.concurrencia}, "
+          f"{args.peticiones} peticiones por ruta, Azure simulado {args.latencia_ms}+{args.jitter_ms} ms):")
+    resultado = ejecutar(args)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            problemas = comparar(resultado, json.load(archivo), args.tolerancia)
+        for problema in problemas:
+            print(f"  ⚠️ regresión: {problema}")
+        if problemas:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compara el comparador compilado de intenciones con el bucle original de
+generate_response (recorrer el diccionario y buscar cada frase como
+subcadena del mensaje) a medida que crece la tabla de FAQ.
+
+Uso:
+    python benchmarks/benchmark_intenciones.py [--repeticiones N]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intenciones import FAQS, ComparadorIntenciones
+
+MENSAJES = [
+    '¿Cuáles son las formas de pago?',
+    'Quiero saber el estado de mi pedido número 12345',
+    'Mi televisor se apagó y no enciende, necesito ayuda urgente por favor',
+    'Me encanta la tienda, todo llegó muy rápido',
+    'adios',
+    'Tengo una consulta sobre una devolución que hice la semana pasada',
+]
+
+
+def tabla_sintetica(tamano, semilla=42):
+    """Añade frases inventadas a la tabla real hasta alcanzar `tamano` entradas"""
+    aleatorio = random.Random(semilla)
+    letras = 'abcdefghijklmnopqrstuvwxyz'
+    tabla = dict(FAQS)
+    while len(tabla) < tamano:
+        palabras = [''.join(aleatorio.choice(letras) for _ in range(aleatorio.randint(4, 9)))
+                    for _ in range(aleatorio.randint(1, 3))]
+        tabla[' '.join(palabras)] = 'respuesta'
+    # Las frases reales van al final para que el bucle original las recorra todas
+    reales = {frase: tabla.pop(frase) for frase in FAQS}
+    tabla.update(reales)
+    return tabla
+
+
+def bucle_original(tabla, mensaje):
+    message_lower = mensaje.lower()
+    for pregunta, respuesta in tabla.items():
+        if pregunta in message_lower:
+            return pregunta, respuesta
+    return None
+
+
+def medir(funcion, repeticiones):
+    total = timeit.timeit(lambda: [funcion(m) for m in MENSAJES], number=repeticiones)
+    return total / (repeticiones * len(MENSAJES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'frases':>8} {'bucle (µs)':>12} {'trie (µs)':>12} {'compilar (ms)':>14}")
+    for tamano in (len(FAQS), 100, 1000, 5000, 20000):
+        tabla = tabla_sintetica(tamano)
+
+        inicio = timeit.default_timer()
+        comparador = ComparadorIntenciones(tabla.items())
+        compilar_ms = (timeit.default_timer() - inicio) * 1000
+
+        bucle = medir(lambda m: bucle_original(tabla, m), max(1, args.repeticiones * 23 // tamano))
+        trie = medir(comparador.buscar, args.repeticiones)
+        print(f"{tamano:>8} {bucle:>12.2f} {trie:>12.2f} {compilar_ms:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Mide el coste de la instrumentación de métricas: cuánto añade a cada
+petición de Flask, cuánto cuesta una observación y cuánto tarda /metrics en
+generar la exposición.
+
+La sobrecarga por petición se mide con dos aplicaciones Flask idénticas en
+el mismo intérprete, una instrumentada y otra no, que atienden una ruta
+trivial con el cliente de pruebas (sin red). Se alternan muchos bloques
+cortos de peticiones y se toma la mediana de la diferencia entre bloques
+consecutivos, de modo que el ruido de la máquina afecta por igual a ambas.
+
+Uso:
+    python benchmarks/benchmark_metricas.py [--peticiones 500] [--rondas 40]
+        [--salida metricas.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _aplicacion(instrumentada):
+    from flask import Flask, jsonify
+    import metricas
+
+    app = Flask(f'benchmark_{instrumentada}')
+
+    @app.route('/api/prueba/<int:numero>')
+    def prueba(numero):
+        return jsonify({'numero': numero})
+
+    if instrumentada:
+        metricas.instrumentar_flask(app)
+    return app.test_client()
+
+
+def medir_peticiones(peticiones, rondas):
+    """
+    Returns:
+        tuple: µs por petición sin y con métricas, y mediana de la diferencia
+    """
+    clientes = {False: _aplicacion(False), True: _aplicacion(True)}
+    tiempos = {False: [], True: []}
+    for cliente in clientes.values():
+        for i in range(200):
+            cliente.get(f'/api/prueba/{i}').close()
+    for _ in range(rondas):
+        for instrumentada, cliente in clientes.items():
+            inicio = time.perf_counter()
+            for i in range(peticiones):
+                cliente.get(f'/api/prueba/{i}').close()
+            tiempos[instrumentada].append((time.perf_counter() - inicio) / peticiones * 1e6)
+    observadas = sum(sum(serie[:-1]) for serie in metricas_peticiones().values())
+    assert observadas >= peticiones * rondas, "La aplicación instrumentada no registró las peticiones"
+    diferencias = [con - sin for sin, con in zip(tiempos[False], tiempos[True])]
+    return statistics.median(tiempos[False]), statistics.median(tiempos[True]), statistics.median(diferencias)
+
+
+def metricas_peticiones():
+    import metricas
+    return metricas.PETICIONES.muestras()
+
+
+def medir_observacion(repeticiones=200000):
+    import metricas
+
+    histograma = metricas.PETICIONES
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        histograma.observar(0.0123, '/api/prueba', 'GET', '200')
+    return (time.perf_counter() - inicio) / repeticiones * 1e9
+
+
+def medir_exposicion(procesos=4, series=60):
+    """Tiempo de /metrics sumando `procesos` volcados con `series` series por histograma"""
+    import metricas
+
+    with tempfile.TemporaryDirectory() as directorio:
+        os.environ['METRICAS_DIR'] = directorio
+        for i in range(series):
+            metricas.PETICIONES.observar(0.01 * (i % 7), f'/ruta/{i}', 'GET', '200')
+            metricas.LLAMADAS_AZURE.observar(0.1, f'backend{i % 4}', str(200 + i % 3))
+        ruta = metricas.volcar()
+        with open(ruta, encoding='utf-8') as archivo:
+            datos = archivo.read()
+        for pid in range(1, procesos):
+            with open(os.path.join(directorio, f'{pid}.json'), 'w', encoding='utf-8') as archivo:
+                archivo.write(datos)
+
+        tiempos = []
+        for _ in range(20):
+            inicio = time.perf_counter()
+            cuerpo = metricas.exposicion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        del os.environ['METRICAS_DIR']
+    return statistics.median(tiempos), len(cuerpo)
+
+
+def main():
+    os.environ.pop('METRICAS_DIR', None)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--peticiones', type=int, default=500, help='peticiones por bloque')
+    parser.add_argument('--rondas', type=int, default=40, help='bloques de cada variante')
+    parser.add_argument('--salida')
+    args = parser.parse_args()
+
+    sin, con, sobrecarga = medir_peticiones(args.peticiones, args.rondas)
+    observacion_ns = medir_observacion()
+    exposicion_ms, tamano = medir_exposicion()
+
+    resultado = {
+        'python': platform.python_version(),
+        'peticiones': args.peticiones * args.rondas,
+        'us_por_peticion_sin_metricas': round(sin, 1),
+        'us_por_peticion_con_metricas': round(con, 1),
+        'sobrecarga_us_por_peticion': round(sobrecarga, 1),
+        'ns_por_observacion': round(observacion_ns),
+        'exposicion_ms_4_workers': round(exposicion_ms, 2),
+        'exposicion_bytes': tamano,
+    }
+
+    print(f"Petición Flask (cliente de pruebas, Python {resultado['python']}):")
+    print(f"  sin métricas: {resultado['us_por_peticion_sin_metricas']} µs")
+    print(f"  con métricas: {resultado['us_por_peticion_con_metricas']} µs "
+          f"(+{resultado['sobrecarga_us_por_peticion']} µs)")
+    print(f"Observación de un histograma: {resultado['ns_por_observacion']} ns")
+    print(f"/metrics con 4 workers volcados: {resultado['exposicion_ms_4_workers']} ms "
+          f"({resultado['exposicion_bytes']} bytes)")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Mide la memoria residente de cada worker de gunicorn con y sin preload_app.
+
+Arranca gunicorn con gunicorn.conf.py, lanza peticiones que obligan a cada
+worker a cargar los SDK de Azure, Pillow y la plantilla principal (los
+servicios de Azure apuntan a un puerto local cerrado, así que no se llama a
+Azure) y lee /proc/<pid>/smaps_rollup de cada worker:
+
+    RSS  memoria residente (cuenta entera la memoria compartida)
+    PSS  RSS con la memoria compartida repartida entre los procesos
+    USS  memoria privada del worker (lo que se libera si el worker muere)
+
+Solo funciona en Linux.
+
+Uso:
+    python benchmarks/medir_memoria_workers.py [--workers 4] [--peticiones 40]
+        [--modo ambos|preload|sin-preload] [--salida memoria.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 1x1 PNG para forzar la carga de Pillow
+_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _esperar(url, timeout=60):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn no respondió en {url}")
+
+
+def _peticion(url, datos=None, tipo='application/json'):
+    solicitud = urllib.request.Request(url, data=datos, headers={'Content-Type': tipo} if datos else {})
+    try:
+        urllib.request.urlopen(solicitud, timeout=60).read()
+    except Exception:
+        pass
+
+
+def _multipart(campo, nombre, contenido):
+    limite = 'limite-medicion'
+    cuerpo = io.BytesIO()
+    cuerpo.write(f'--{limite}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nombre}"\r\n'
+                 f'Content-Type: image/png\r\n\r\n'.encode())
+    cuerpo.write(contenido)
+    cuerpo.write(f'\r\n--{limite}--\r\n'.encode())
+    return cuerpo.getvalue(), f'multipart/form-data; boundary={limite}'
+
+
+def _memoria(pid):
+    valores = {}
+    with open(f'/proc/{pid}/smaps_rollup') as archivo:
+        for linea in archivo:
+            partes = linea.split()
+            if len(partes) == 3 and partes[2] == 'kB':
+                valores[partes[0].rstrip(':')] = int(partes[1])
+    return {
+        'rss_mb': round(valores.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(valores.get('Pss', 0) / 1024, 1),
+        'uss_mb': round((valores.get('Private_Clean', 0) + valores.get('Private_Dirty', 0)) / 1024, 1),
+    }
+
+
+def _workers(pid_maestro):
+    with open(f'/proc/{pid_maestro}/task/{pid_maestro}/children') as archivo:
+        return [int(pid) for pid in archivo.read().split()]
+
+
+def medir(preload, num_workers, peticiones):
+    puerto = _puerto_libre()
+    entorno = dict(
+        os.environ,
+        PORT=str(puerto),
+        GUNICORN_WORKERS=str(num_workers),
+        GUNICORN_PRELOAD='1' if preload else '0',
+        TEXT_ANALYTICS_KEY='x', TEXT_ANALYTICS_ENDPOINT='http://127.0.0.1:9',
+        LANGUAGE_KEY='x', LANGUAGE_ENDPOINT='http://127.0.0.1:9',
+        TRANSLATOR_KEY='x', TRANSLATOR_ENDPOINT='http://127.0.0.1:9', TRANSLATOR_REGION='local',
+        VISION_KEY='x', VISION_ENDPOINT='http://127.0.0.1:9',
+        CACHE_BACKEND='ninguno', CONVERSACION_BACKEND='memoria', DIRECT_LINE_SECRET='',
+        LIMITE_CLIENTES='0',
+    )
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{puerto}',
+         '--access-logfile', '/dev/null'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{puerto}'
+    try:
+        _esperar(f'{base}/api/estado/configuracion')
+        imagen, tipo_imagen = _multipart('imagen', 'punto.png', _PNG)
+        tareas = [
+            (f'{base}/', None, None),
+            (f'{base}/api/chat', json.dumps({'message': 'me encanta'}).encode(), 'application/json'),
+            (f'{base}/api/traducir', json.dumps({'texto': 'hola', 'idioma': 'en'}).encode(), 'application/json'),
+            (f'{base}/api/analizar-sentimiento', json.dumps({'texto': 'hola'}).encode(), 'application/json'),
+            (f'{base}/api/analizar-imagen', imagen, tipo_imagen),
+        ]
+        # Varias rondas en paralelo para que todas las peticiones lleguen a todos los workers
+        with ThreadPoolExecutor(max_workers=num_workers * 4) as executor:
+            list(executor.map(lambda t: _peticion(*t), tareas * peticiones))
+        time.sleep(1)
+
+        workers = {pid: _memoria(pid) for pid in _workers(proceso.pid)}
+        return {
+            'preload': preload,
+            'maestro': _memoria(proceso.pid),
+            'workers': workers,
+            'media_worker': {
+                clave: round(statistics.mean(w[clave] for w in workers.values()), 1)
+                for clave in ('rss_mb', 'pss_mb', 'uss_mb')
+            },
+            'pss_total_mb': round(_memoria(proceso.pid)['pss_mb'] + sum(w['pss_mb'] for w in workers.values()), 1),
+        }
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--peticiones', type=int, default=40, help='rondas de peticiones de calentamiento')
+    parser.add_argument('--modo', choices=['ambos', 'preload', 'sin-preload'], default='ambos')
+    parser.add_argument('--salida')
+    args = parser.parse_args()
+
+    modos = {'ambos': [False, True], 'preload': [True], 'sin-preload': [False]}[args.modo]
+    resultados = []
+    for preload in modos:
+        resultado = medir(preload, args.workers, args.peticiones)
+        resultados.append(resultado)
+        media = resultado['media_worker']
+        print(f"{'preload_app' if preload else 'sin preload'}: "
+              f"por worker RSS {media['rss_mb']} MB, PSS {media['pss_mb']} MB, USS {media['uss_mb']} MB; "
+              f"PSS total (maestro + {args.workers} workers) {resultado['pss_total_mb']} MB")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+# === CACHÉ DE RESULTADOS ===
+"""
+Caché direccionada por contenido para los resultados de los servicios de Azure.
+
+Las claves son un hash SHA-256 del servicio, la entrada normalizada y los
+parámetros que afectan al resultado, por lo que la misma consulta devuelve
+siempre la misma clave.
+
+Variables de entorno:
+    CACHE_BACKEND: 'memoria' (por proceso), 'sqlite' (compartida entre
+        workers del mismo host) o 'ninguno' (por defecto: memoria)
+    CACHE_TTL: Segundos de vida de cada entrada (por defecto: 86400)
+    CACHE_MAX_ENTRADAS: Entradas máximas antes de expulsar las menos usadas
+        (por defecto: 10000)
+    CACHE_RUTA: Archivo de la base SQLite (por defecto: cache_resultados.sqlite3
+        en el directorio temporal)
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_texto(texto, conservar_formato=False):
+    """
+    Normaliza un texto para que variaciones triviales compartan clave.
+
+    Args:
+        texto (str): Texto original
+        conservar_formato (bool): Solo pasa el texto a NFC, sin tocar espacios,
+            tabuladores ni saltos de línea. Para las traducciones, que los
+            conservan: un texto de varias líneas y su versión en una sola no
+            pueden compartir la traducción guardada
+
+    Returns:
+        str: Texto en forma NFC, con los espacios colapsados salvo con `conservar_formato`
+    """
+    texto = unicodedata.normalize('NFC', texto)
+    if conservar_formato:
+        return texto
+    return ' '.join(texto.split())
+
+
+def hash_bytes(datos):
+    """Devuelve el SHA-256 hexadecimal de un bloque de bytes"""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def clave_cache(servicio, *partes):
+    """
+    Construye la clave de caché para una consulta.
+
+    Args:
+        servicio (str): Nombre del servicio ('sentimiento', 'traduccion', ...)
+        *partes: Entrada normalizada y parámetros de la consulta
+
+    Returns:
+        str: Clave hexadecimal
+    """
+    contenido = json.dumps([servicio, *partes], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class _Contadores:
+    """Aciertos y fallos por servicio dentro del proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def sumar(self, servicio, campo):
+        with self._lock:
+            valores = self._valores.setdefault(servicio, {'aciertos': 0, 'fallos': 0})
+            valores[campo] += 1
+
+    def obtener(self):
+        with self._lock:
+            return {servicio: dict(valores) for servicio, valores in self._valores.items()}
+
+
+class CacheMemoria:
+    """
+    Caché LRU en memoria del proceso con expiración por TTL.
+    """
+
+    bloqueante = False
+
+    def __init__(self, ttl, max_entradas):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.contadores = _Contadores()
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+
+    def obtener(self, servicio, clave):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._datos.move_to_end(clave)
+                valor = entrada[1]
+            else:
+                if entrada is not None:
+                    del self._datos[clave]
+                valor = None
+
+        self.contadores.sumar(servicio, 'aciertos' if valor is not None else 'fallos')
+        return valor
+
+    def guardar(self, servicio, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.time() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def metricas(self):
+        with self._lock:
+            entradas = len(self._datos)
+        return {
+            'backend': 'memoria',
+            'entradas': entradas,
+            'max_entradas': self.max_entradas,
+            'ttl': self.ttl,
+            'servicios': self.contadores.obtener()
+        }
+
+
+class CacheSQLite:
+    """
+    Caché LRU en un archivo SQLite compartido por todos los workers del host.
+    """
+
+    # Cada consulta puede esperar al disco: servicio_async la hace en un hilo
+    bloqueante = True
+
+    # Cada cuántas escrituras se comprueba el límite de entradas
+    _INTERVALO_EXPULSION = 64
+
+    def __init__(self, ruta, ttl, max_entradas):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.contadores = _Contadores()
+        self._local = threading.local()
+        self._escrituras = 0
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'clave TEXT PRIMARY KEY, valor TEXT NOT NULL, '
+                'expira REAL NOT NULL, acceso REAL NOT NULL)'
+            )
+            conexion.execute('CREATE INDEX IF NOT EXISTS cache_acceso ON cache (acceso)')
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def obtener(self, servicio, clave):
+        ahora = time.time()
+        valor = None
+        try:
+            conexion = self._conexion()
+            fila = conexion.execute(
+                'SELECT valor, expira FROM cache WHERE clave = ?', (clave,)
+            ).fetchone()
+            if fila is not None:
+                if fila[1] > ahora:
+                    valor = json.loads(fila[0])
+                    conexion.execute('UPDATE cache SET acceso = ? WHERE clave = ?', (ahora, clave))
+                else:
+                    conexion.execute('DELETE FROM cache WHERE clave = ?', (clave,))
+        except sqlite3.Error as e:
+            logger.warning("Error al leer la caché: %s", e)
+
+        self.contadores.sumar(servicio, 'aciertos' if valor is not None else 'fallos')
+        return valor
+
+    def guardar(self, servicio, clave, valor):
+        ahora = time.time()
+        try:
+            conexion = self._conexion()
+            conexion.execute(
+                'INSERT OR REPLACE INTO cache (clave, valor, expira, acceso) VALUES (?, ?, ?, ?)',
+                (clave, json.dumps(valor, ensure_ascii=False), ahora + self.ttl, ahora)
+            )
+            self._escrituras += 1
+            if self._escrituras % self._INTERVALO_EXPULSION == 0:
+                self._expulsar(conexion, ahora)
+        except sqlite3.Error as e:
+            logger.warning("Error al escribir en la caché: %s", e)
+
+    def _expulsar(self, conexion, ahora):
+        conexion.execute('DELETE FROM cache WHERE expira <= ?', (ahora,))
+        total = conexion.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if total > self.max_entradas:
+            conexion.execute(
+                'DELETE FROM cache WHERE clave IN '
+                '(SELECT clave FROM cache ORDER BY acceso LIMIT ?)',
+                (total - self.max_entradas,)
+            )
+
+    def metricas(self):
+        try:
+            entradas = self._conexion().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        except sqlite3.Error:
+            entradas = None
+        return {
+            'backend': 'sqlite',
+            'ruta': self.ruta,
+            'entradas': entradas,
+            'max_entradas': self.max_entradas,
+            'ttl': self.ttl,
+            'servicios': self.contadores.obtener()
+        }
+
+
+class CacheNula:
+    """Backend que no guarda nada (caché desactivada)"""
+
+    bloqueante = False
+
+    def __init__(self):
+        self.contadores = _Contadores()
+
+    def obtener(self, servicio, clave):
+        return None
+
+    def guardar(self, servicio, clave, valor):
+        pass
+
+    def metricas(self):
+        return {'backend': 'ninguno'}
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obtener_cache():
+    """
+    Devuelve el backend de caché configurado, creándolo la primera vez.
+
+    Returns:
+        CacheMemoria, CacheSQLite o CacheNula
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _lock_cache:
+        if _cache is None:
+            backend = os.getenv('CACHE_BACKEND', 'memoria').lower()
+            ttl = float(os.getenv('CACHE_TTL', '86400'))
+            max_entradas = int(os.getenv('CACHE_MAX_ENTRADAS', '10000'))
+
+            if backend == 'sqlite':
+                ruta = os.getenv('CACHE_RUTA') or os.path.join(tempfile.gettempdir(), 'cache_resultados.sqlite3')
+                _cache = CacheSQLite(ruta, ttl, max_entradas)
+            elif backend in ('ninguno', 'none', '0'):
+                _cache = CacheNula()
+            else:
+                _cache = CacheMemoria(ttl, max_entradas)
+    return _cache
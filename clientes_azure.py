@@ -0,0 +1,300 @@
+# === REGISTRO DE CLIENTES DE AZURE ===
+"""
+Registro de clientes de Azure compartidos dentro de cada proceso.
+
+Cada worker de gunicorn crea un único cliente por servicio y lo reutiliza en
+todas sus peticiones e hilos, de modo que el pool de conexiones HTTP (y las
+sesiones TLS ya negociadas) se mantienen vivos entre peticiones.
+
+Variables de entorno:
+    AZURE_POOL_CONEXIONES: Conexiones mantenidas por host (por defecto: 10)
+    AZURE_TIMEOUT_CONEXION: Timeout de conexión en segundos (por defecto: 5)
+    AZURE_TIMEOUT_LECTURA: Timeout de lectura en segundos (por defecto: 30)
+"""
+import os
+import sys
+import hashlib
+import importlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_lock = threading.Lock()
+
+# (servicio, endpoint) -> (huella de credenciales, cliente, sesión HTTP)
+_clientes = {}
+
+
+def configuracion_red():
+    """
+    Devuelve la configuración de red compartida por todos los clientes.
+
+    Returns:
+        dict: Tamaño del pool y timeouts de conexión y lectura
+    """
+    return {
+        'pool': int(os.getenv('AZURE_POOL_CONEXIONES', '10')),
+        'timeout_conexion': float(os.getenv('AZURE_TIMEOUT_CONEXION', '5')),
+        'timeout_lectura': float(os.getenv('AZURE_TIMEOUT_LECTURA', '30')),
+    }
+
+
+def _crear_sesion(config):
+    """Crea una sesión de requests con keep-alive y un pool del tamaño configurado"""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(
+        pool_connections=config['pool'],
+        pool_maxsize=config['pool'],
+        max_retries=0
+    )
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    return sesion
+
+
+def _crear_language(endpoint, clave, config):
+    from azure.ai.textanalytics import TextAnalyticsClient
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import RequestsTransport
+
+    sesion = _crear_sesion(config)
+    transporte = RequestsTransport(
+        session=sesion,
+        session_owner=False,
+        connection_timeout=config['timeout_conexion'],
+        read_timeout=config['timeout_lectura']
+    )
+    cliente = TextAnalyticsClient(
+        endpoint=endpoint,
+        credential=AzureKeyCredential(clave),
+        transport=transporte,
+        retry_total=0  # Los reintentos los gestiona resiliencia.llamar
+    )
+    return cliente, sesion
+
+
+def _crear_translator(endpoint, clave, config):
+    from azure.ai.translation.text import TextTranslationClient
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import RequestsTransport
+
+    sesion = _crear_sesion(config)
+    transporte = RequestsTransport(
+        session=sesion,
+        session_owner=False,
+        connection_timeout=config['timeout_conexion'],
+        read_timeout=config['timeout_lectura']
+    )
+    cliente = TextTranslationClient(
+        endpoint=endpoint,
+        credential=AzureKeyCredential(clave),
+        transport=transporte,
+        retry_total=0  # Los reintentos los gestiona resiliencia.llamar
+    )
+    return cliente, sesion
+
+
+def _crear_vision(endpoint, clave, config):
+    from azure.cognitiveservices.vision.computervision import ComputerVisionClient
+    from msrest.authentication import CognitiveServicesCredentials
+
+    cliente = ComputerVisionClient(endpoint, CognitiveServicesCredentials(clave))
+
+    # msrest cierra la sesión tras cada petición salvo que se active keep_alive.
+    # Su sesión es por hilo, así que el pool se monta la primera vez que cada
+    # hilo la usa.
+    cliente.config.keep_alive = True
+    cliente.config.connection.timeout = (config['timeout_conexion'], config['timeout_lectura'])
+    cliente.config.retry_policy.retries = 0  # Los reintentos los gestiona resiliencia.llamar
+
+    def configurar_sesion(sesion, global_config, local_config, **kwargs):
+        if not getattr(sesion, '_pool_configurado', False):
+            reintentos = sesion.adapters['https://'].max_retries
+            adaptador = HTTPAdapter(
+                pool_connections=config['pool'],
+                pool_maxsize=config['pool'],
+                max_retries=reintentos
+            )
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            sesion._pool_configurado = True
+        return kwargs
+
+    cliente.config.session_configuration_callback = configurar_sesion
+    return cliente, None
+
+
+def _crear_directline(endpoint, clave, config):
+    # Direct Line no tiene SDK: el "cliente" es la propia sesión HTTP
+    sesion = _crear_sesion(config)
+    return sesion, None
+
+
+_FABRICAS = {
+    'language': _crear_language,
+    'translator': _crear_translator,
+    'vision': _crear_vision,
+    'directline': _crear_directline,
+}
+
+
+def _huella(endpoint, clave):
+    return hashlib.sha256(f"{endpoint}|{clave}".encode('utf-8')).hexdigest()
+
+
+def _cerrar(cliente, sesion):
+    try:
+        cliente.close()
+    except Exception:
+        pass
+    if sesion is not None:
+        sesion.close()
+
+
+def obtener_cliente(servicio, endpoint, clave):
+    """
+    Devuelve el cliente compartido de un servicio, creándolo si hace falta.
+
+    Si la clave o el endpoint cambian respecto al cliente existente, el cliente
+    anterior se cierra y se crea uno nuevo.
+
+    Args:
+        servicio (str): 'language', 'translator', 'vision' o 'directline'
+        endpoint (str): Endpoint del recurso de Azure
+        clave (str): Clave del recurso de Azure
+
+    Returns:
+        Cliente del SDK de Azure listo para usarse desde varios hilos
+    """
+    if servicio not in _FABRICAS:
+        raise ValueError(f"Servicio desconocido: {servicio}")
+
+    llave = (servicio, endpoint)
+    huella = _huella(endpoint, clave)
+
+    entrada = _clientes.get(llave)
+    if entrada is not None and entrada[0] == huella:
+        return entrada[1]
+
+    with _lock:
+        entrada = _clientes.get(llave)
+        if entrada is not None and entrada[0] == huella:
+            return entrada[1]
+
+        cliente, sesion = _FABRICAS[servicio](endpoint, clave, configuracion_red())
+        _clientes[llave] = (huella, cliente, sesion)
+
+    if entrada is not None:
+        # Credenciales rotadas: cerrar el cliente anterior fuera del lock
+        _cerrar(entrada[1], entrada[2])
+
+    return cliente
+
+
+def invalidar_cliente(servicio):
+    """
+    Descarta los clientes de un servicio para que se recreen en la siguiente
+    petición. Se usa cuando una conexión queda en mal estado.
+
+    Args:
+        servicio (str): Nombre del servicio a invalidar
+    """
+    with _lock:
+        llaves = [llave for llave in _clientes if llave[0] == servicio]
+        entradas = [_clientes.pop(llave) for llave in llaves]
+
+    for _, cliente, sesion in entradas:
+        _cerrar(cliente, sesion)
+
+
+def es_error_de_conexion(error):
+    """
+    Indica si una excepción se debe a un fallo de red o de conexión, en cuyo
+    caso conviene recrear el cliente.
+
+    Args:
+        error (Exception): Excepción capturada
+
+    Returns:
+        bool: True si el error es de conexión
+    """
+    tipos = [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+    try:
+        from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+        tipos += [ServiceRequestError, ServiceResponseError]
+    except ImportError:
+        pass
+    # aiohttp solo lo usa el modo ASGI: si no está cargado, no puede haber lanzado nada
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None:
+        tipos += [aiohttp.ClientConnectionError, aiohttp.ClientPayloadError]
+
+    # msrest envuelve el error de requests en ClientRequestError.inner_exception
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        if isinstance(error, tuple(tipos)):
+            return True
+        vistos.add(id(error))
+        error = getattr(error, 'inner_exception', None) or error.__cause__
+
+    return False
+
+
+def cerrar_clientes():
+    """Cierra todos los clientes del proceso actual."""
+    with _lock:
+        entradas = list(_clientes.values())
+        _clientes.clear()
+
+    for _, cliente, sesion in entradas:
+        _cerrar(cliente, sesion)
+
+
+# Módulos de los SDK que usan las fábricas de clientes
+MODULOS_SDK = (
+    'azure.core.pipeline.transport',
+    'azure.ai.textanalytics',
+    'azure.ai.translation.text',
+    'azure.ai.translation.text.models',
+    'azure.cognitiveservices.vision.computervision',
+    'msrest.authentication',
+)
+
+
+def precargar_sdk():
+    """
+    Importa los SDK de Azure sin crear clientes.
+
+    Los workers los importan en la primera petición que los necesita; con
+    gunicorn --preload el proceso maestro puede importarlos una sola vez para
+    que todos los workers compartan esas páginas de memoria.
+
+    Returns:
+        list[str]: Módulos importados (se omiten los que no están instalados)
+    """
+    importados = []
+    for modulo in MODULOS_SDK:
+        try:
+            importlib.import_module(modulo)
+            importados.append(modulo)
+        except ImportError:
+            pass
+    return importados
+
+
+def reiniciar_tras_fork():
+    """
+    Descarta en el proceso hijo los clientes heredados del padre.
+
+    Las conexiones heredadas no deben reutilizarse ni cerrarse en el hijo: se
+    olvidan sin tocarlas y cada worker crea las suyas. Se ejecuta
+    automáticamente tras cada fork y desde el hook post_fork de gunicorn.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _clientes.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reiniciar_tras_fork)
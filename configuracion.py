@@ -0,0 +1,71 @@
+# === CONFIGURACIÓN ===
+"""
+Carga única de la configuración de la aplicación.
+
+El archivo .env se busca junto a la aplicación, en el directorio de trabajo
+y en el directorio del usuario, y se carga una sola vez por proceso aunque
+varios módulos llamen a `cargar_entorno()`. Sus valores tienen prioridad
+sobre las variables ya definidas en el entorno.
+"""
+import os
+import threading
+from pathlib import Path
+
+_lock = threading.Lock()
+_ruta_cargada = None
+_cargado = False
+
+# Variables que necesita cada servicio de Azure
+VARIABLES_SERVICIOS = {
+    'language': ['TEXT_ANALYTICS_KEY', 'TEXT_ANALYTICS_ENDPOINT'],
+    'chatbot': ['LANGUAGE_KEY', 'LANGUAGE_ENDPOINT'],
+    'translator': ['TRANSLATOR_KEY', 'TRANSLATOR_ENDPOINT', 'TRANSLATOR_REGION'],
+    'vision': ['VISION_KEY', 'VISION_ENDPOINT'],
+    'directline': ['DIRECT_LINE_SECRET'],
+}
+
+
+def cargar_entorno():
+    """
+    Carga el archivo .env la primera vez que se llama.
+
+    Returns:
+        Path o None: Ruta del archivo .env cargado
+    """
+    global _ruta_cargada, _cargado
+    if _cargado:
+        return _ruta_cargada
+
+    with _lock:
+        if not _cargado:
+            from dotenv import load_dotenv
+
+            rutas = [
+                Path(__file__).parent.absolute() / '.env',  # Mismo directorio que la aplicación
+                Path.cwd() / '.env',  # Directorio de trabajo actual
+                Path.home() / '.env',  # Directorio home del usuario
+            ]
+            for ruta in rutas:
+                if ruta.exists():
+                    load_dotenv(ruta, override=True)
+                    _ruta_cargada = ruta
+                    break
+            _cargado = True
+    return _ruta_cargada
+
+
+def resumen_configuracion():
+    """
+    Indica qué variables de cada servicio están definidas, sin mostrar sus valores.
+
+    Returns:
+        dict: Archivo .env cargado y, por servicio, variable -> bool
+    """
+    ruta = cargar_entorno()
+    return {
+        'env': str(ruta) if ruta else None,
+        'servicios': {
+            servicio: {variable: bool(os.getenv(variable)) for variable in variables}
+            for servicio, variables in VARIABLES_SERVICIOS.items()
+        }
+    }
@@ -0,0 +1,46 @@
+# === FIXTURES DE LAS PRUEBAS ===
+"""
+Fixtures compartidas por las pruebas. Ninguna llama a Azure: los servicios
+se sustituyen por `stub_azure` en un puerto libre y los almacenes usan
+archivos temporales o memoria.
+"""
+import pytest
+
+import resiliencia
+import cache_resultados
+import limite_clientes
+from trabajos import AlmacenTrabajos
+
+
+def apuntar_a_servidor(monkeypatch, servidor):
+    """Hace que todos los servicios de Azure usen el servidor simulado indicado"""
+    url = f'http://127.0.0.1:{servidor.server_address[1]}'
+    for servicio in ('TEXT_ANALYTICS', 'LANGUAGE', 'TRANSLATOR', 'VISION'):
+        monkeypatch.setenv(f'{servicio}_ENDPOINT', url)
+        monkeypatch.setenv(f'{servicio}_KEY', 'clave-de-prueba')
+    monkeypatch.setenv('TRANSLATOR_REGION', 'westeurope')
+
+
+@pytest.fixture
+def azure_simulado(monkeypatch):
+    """Arranca stub_azure y apunta a él todos los servicios; devuelve su EstadoAzure"""
+    import stub_azure
+
+    servidor, estado = stub_azure.iniciar(0)
+    apuntar_a_servidor(monkeypatch, servidor)
+    # Sin reintentos ni esperas: cada fallo del simulador se ve al momento
+    monkeypatch.setenv('REINTENTOS_MAX', '0')
+    monkeypatch.setenv('CUOTA_TPS', '0')
+    # Backends, caché y límites nuevos: nada pasa de una prueba a otra
+    monkeypatch.setattr(resiliencia, '_backends', {})
+    monkeypatch.setattr(cache_resultados, '_cache', cache_resultados.CacheNula())
+    monkeypatch.setattr(limite_clientes, '_almacen', limite_clientes.LimitesMemoria(1000))
+    yield estado
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def almacen_trabajos(tmp_path):
+    """Cola de trabajos vacía en un archivo temporal"""
+    return AlmacenTrabajos(str(tmp_path / 'trabajos.sqlite3'))
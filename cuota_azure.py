@@ -0,0 +1,215 @@
+# === CUOTA DE LLAMADAS A AZURE ===
+"""
+Cubetas de tokens (token bucket) con la cuota de llamadas por segundo de
+cada servicio de Azure.
+
+Cada recurso de Azure tiene un límite fijo de transacciones por segundo. Si
+cada worker lo controlase por su cuenta, entre todos lo superarían y
+recibirían 429 a la vez; por eso el estado de las cubetas se guarda en un
+archivo SQLite compartido por todos los workers del host, y todos gastan de
+la misma cuota.
+
+Cada llamada reserva un token. Si no queda ninguno, la reserva deja la
+cubeta en negativo y devuelve cuánto hay que esperar hasta que ese token se
+haya repuesto, de modo que las llamadas en espera salen en orden y sin
+consultar la cubeta una y otra vez. Si la espera supera el máximo permitido
+no se reserva nada.
+
+La tasa y la ráfaga de cada backend las decide `resiliencia.Backend`
+(variables CUOTA_TPS y CUOTA_RAFAGA).
+
+Variables de entorno:
+    CUOTA_BACKEND: 'sqlite' (compartida entre workers del host) o
+        'memoria' (por proceso) (por defecto: sqlite)
+    CUOTA_RUTA: Archivo SQLite de las cubetas (por defecto:
+        cuota_azure.sqlite3 en el directorio temporal)
+"""
+import os
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+
+from metricas import Indicador
+
+logger = logging.getLogger(__name__)
+
+
+def _repartir(tokens, actualizado, ahora, tasa, capacidad, espera_max):
+    """
+    Repone la cubeta hasta `ahora` e intenta reservar un token.
+
+    Returns:
+        tuple: (tokens tras la reserva o None si no se reserva, segundos de espera)
+    """
+    tokens = min(capacidad, tokens + max(ahora - actualizado, 0.0) * tasa)
+    espera = 0.0 if tokens >= 1 else (1 - tokens) / tasa
+    if espera > espera_max:
+        return None, espera
+    return tokens - 1, espera
+
+
+class CuotaMemoria:
+    """Cubetas en memoria del proceso (cada worker tiene su propia cuota)"""
+
+    bloqueante = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # backend -> [tokens, actualizado, tasa, capacidad]
+        self._cubetas = {}
+
+    def reservar(self, backend, tasa, capacidad, espera_max):
+        """
+        Reserva un token de la cuota de un backend.
+
+        Args:
+            backend (str): Nombre del backend
+            tasa (float): Tokens repuestos por segundo
+            capacidad (float): Tokens máximos acumulables (ráfaga)
+            espera_max (float): Segundos que se está dispuesto a esperar
+
+        Returns:
+            tuple: (reservado, segundos de espera hasta poder llamar)
+        """
+        ahora = time.time()
+        with self._lock:
+            cubeta = self._cubetas.get(backend) or [capacidad, ahora, tasa, capacidad]
+            tokens, espera = _repartir(cubeta[0], cubeta[1], ahora, tasa, capacidad, espera_max)
+            if tokens is None:
+                return False, espera
+            self._cubetas[backend] = [tokens, ahora, tasa, capacidad]
+        return True, espera
+
+    def niveles(self):
+        """Devuelve {backend: (tokens disponibles ahora, capacidad)}"""
+        ahora = time.time()
+        with self._lock:
+            return {
+                backend: (min(capacidad, tokens + max(ahora - actualizado, 0.0) * tasa), capacidad)
+                for backend, (tokens, actualizado, tasa, capacidad) in self._cubetas.items()
+            }
+
+
+class CuotaSQLite:
+    """Cubetas en un archivo SQLite compartido por todos los workers del host"""
+
+    # reservar() abre una transacción: en modo ASGI se ejecuta en un hilo
+    bloqueante = True
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS cubetas ('
+                'backend TEXT PRIMARY KEY, tokens REAL NOT NULL, actualizado REAL NOT NULL, '
+                'tasa REAL NOT NULL, capacidad REAL NOT NULL)'
+            )
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=1, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def reservar(self, backend, tasa, capacidad, espera_max):
+        """Igual que `CuotaMemoria.reservar`, con la cubeta compartida entre workers"""
+        try:
+            conexion = self._conexion()
+            # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer: dos
+            # workers no pueden gastar el mismo token
+            conexion.execute('BEGIN IMMEDIATE')
+            try:
+                ahora = time.time()
+                fila = conexion.execute(
+                    'SELECT tokens, actualizado FROM cubetas WHERE backend = ?', (backend,)
+                ).fetchone()
+                tokens, actualizado = fila if fila is not None else (capacidad, ahora)
+                tokens, espera = _repartir(tokens, actualizado, ahora, tasa, capacidad, espera_max)
+                if tokens is None:
+                    conexion.execute('ROLLBACK')
+                    return False, espera
+                conexion.execute(
+                    'INSERT OR REPLACE INTO cubetas (backend, tokens, actualizado, tasa, capacidad) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (backend, tokens, ahora, tasa, capacidad)
+                )
+                conexion.execute('COMMIT')
+                return True, espera
+            except BaseException:
+                conexion.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            # Sin acceso a la cuota compartida se deja pasar la llamada: el
+            # limitador de concurrencia y los reintentos siguen protegiendo a Azure
+            logger.warning("Error al leer la cuota de '%s': %s", backend, e)
+            return True, 0.0
+
+    def niveles(self):
+        """Devuelve {backend: (tokens disponibles ahora, capacidad)}"""
+        ahora = time.time()
+        try:
+            filas = self._conexion().execute(
+                'SELECT backend, tokens, actualizado, tasa, capacidad FROM cubetas'
+            ).fetchall()
+        except sqlite3.Error:
+            return {}
+        return {
+            backend: (min(capacidad, tokens + max(ahora - actualizado, 0.0) * tasa), capacidad)
+            for backend, tokens, actualizado, tasa, capacidad in filas
+        }
+
+
+_cuota = None
+_lock_cuota = threading.Lock()
+
+
+def _ruta():
+    return os.getenv('CUOTA_RUTA') or os.path.join(tempfile.gettempdir(), 'cuota_azure.sqlite3')
+
+
+def _compartida():
+    return os.getenv('CUOTA_BACKEND', 'sqlite').lower() != 'memoria'
+
+
+def obtener_cuota():
+    """
+    Devuelve el almacén de cubetas configurado, creándolo la primera vez.
+
+    Returns:
+        CuotaSQLite o CuotaMemoria
+    """
+    global _cuota
+    if _cuota is not None:
+        return _cuota
+
+    with _lock_cuota:
+        if _cuota is None:
+            _cuota = CuotaSQLite(_ruta()) if _compartida() else CuotaMemoria()
+    return _cuota
+
+
+def _niveles():
+    # /metrics no crea el almacén si ningún worker ha usado todavía la cuota
+    if _cuota is None and not (_compartida() and os.path.exists(_ruta())):
+        return {}
+    return obtener_cuota().niveles()
+
+
+# Se leen al generar /metrics; con SQLite dan el nivel del host, lo atienda el worker que lo atienda
+Indicador(
+    'azure_cuota_tokens', 'Tokens disponibles en la cuota de cada servicio de Azure', ('backend',),
+    lambda: {(backend,): tokens for backend, (tokens, _) in _niveles().items()}
+)
+Indicador(
+    'azure_cuota_capacidad', 'Tokens máximos (ráfaga) de la cuota de cada servicio de Azure', ('backend',),
+    lambda: {(backend,): capacidad for backend, (_, capacidad) in _niveles().items()}
+)
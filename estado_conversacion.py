@@ -0,0 +1,270 @@
+# === ESTADO DE LAS CONVERSACIONES DEL CHATBOT ===
+"""
+Estado por conversación del chatbot (bienvenida mostrada, número de mensajes,
+última intención y último sentimiento), identificado por un id de conversación.
+
+Variables de entorno:
+    CONVERSACION_BACKEND: 'sqlite' (compartido entre los workers del host) o
+        'memoria' (por proceso) (por defecto: sqlite)
+    CONVERSACION_TTL: Segundos de inactividad tras los que se olvida una
+        conversación (por defecto: 1800)
+    CONVERSACION_MAX: Conversaciones máximas guardadas; al superarlo se
+        expulsan las de menor actividad reciente (por defecto: 50000)
+    CONVERSACION_RUTA: Archivo de la base SQLite (por defecto:
+        conversaciones.sqlite3 en el directorio temporal, que es local al host)
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cookie con la que el navegador conserva su conversación
+COOKIE_CONVERSACION = 'conversacion_id'
+
+_ID_VALIDO = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def nuevo_id():
+    """Genera un id de conversación aleatorio"""
+    return uuid.uuid4().hex
+
+
+def id_valido(valor):
+    """Indica si un id de conversación recibido del cliente es aceptable"""
+    return isinstance(valor, str) and bool(_ID_VALIDO.match(valor))
+
+
+class EstadoConversacion:
+    """
+    Registro compacto del estado de una conversación.
+    """
+
+    __slots__ = ('id', 'bienvenida', 'mensajes', 'ultima_intencion', 'ultimo_sentimiento', 'creado', 'acceso')
+
+    def __init__(self, id, bienvenida=False, mensajes=0, ultima_intencion=None,
+                 ultimo_sentimiento=None, creado=None, acceso=None):
+        ahora = time.time()
+        self.id = id
+        self.bienvenida = bienvenida
+        self.mensajes = mensajes
+        self.ultima_intencion = ultima_intencion
+        self.ultimo_sentimiento = ultimo_sentimiento
+        self.creado = creado or ahora
+        self.acceso = acceso or ahora
+
+    def registrar(self, intencion, sentimiento=None):
+        """
+        Anota un mensaje respondido en la conversación.
+
+        Args:
+            intencion (str): Intención de la respuesta ('welcome', 'faq', ...)
+            sentimiento (str): Sentimiento del mensaje, si se calculó
+        """
+        self.mensajes += 1
+        self.ultima_intencion = intencion
+        if sentimiento is not None:
+            self.ultimo_sentimiento = sentimiento
+        if intencion == 'welcome':
+            self.bienvenida = True
+
+
+class AlmacenMemoria:
+    """
+    Estado en memoria del proceso, repartido en particiones con su propio lock
+    para que conversaciones distintas no compitan por el mismo lock.
+    """
+
+    bloqueante = False
+    _PARTICIONES = 16
+
+    def __init__(self, ttl, max_conversaciones):
+        self.ttl = ttl
+        self.max_conversaciones = max_conversaciones
+        self._max_por_particion = max(1, max_conversaciones // self._PARTICIONES)
+        self._particiones = [(threading.Lock(), OrderedDict()) for _ in range(self._PARTICIONES)]
+
+    def _particion(self, id):
+        return self._particiones[hash(id) % self._PARTICIONES]
+
+    def obtener(self, id):
+        """
+        Devuelve el estado de una conversación, o uno nuevo si no existe o expiró.
+
+        Args:
+            id (str): Id de la conversación
+
+        Returns:
+            EstadoConversacion
+        """
+        ahora = time.time()
+        lock, datos = self._particion(id)
+        with lock:
+            estado = datos.get(id)
+            if estado is not None and estado.acceso + self.ttl > ahora:
+                return estado
+        return EstadoConversacion(id)
+
+    def guardar(self, estado):
+        estado.acceso = time.time()
+        lock, datos = self._particion(estado.id)
+        with lock:
+            datos[estado.id] = estado
+            datos.move_to_end(estado.id)
+            if len(datos) > self._max_por_particion:
+                self._expulsar(datos, estado.acceso)
+
+    def _expulsar(self, datos, ahora):
+        # Primero las expiradas (las más antiguas están al principio)
+        while datos:
+            estado = next(iter(datos.values()))
+            if estado.acceso + self.ttl > ahora and len(datos) <= self._max_por_particion:
+                break
+            datos.popitem(last=False)
+
+    def metricas(self):
+        conversaciones = 0
+        for lock, datos in self._particiones:
+            with lock:
+                conversaciones += len(datos)
+        return {
+            'backend': 'memoria',
+            'conversaciones': conversaciones,
+            'max_conversaciones': self.max_conversaciones,
+            'ttl': self.ttl
+        }
+
+
+class AlmacenSQLite:
+    """
+    Estado en un archivo SQLite compartido por todos los workers del host, de
+    modo que una conversación ve el mismo estado sea cual sea el worker que la
+    atienda.
+    """
+
+    # En modo ASGI el bot lee y guarda el estado en un hilo
+    bloqueante = True
+
+    # Cada cuántas escrituras se expulsan las conversaciones inactivas
+    _INTERVALO_EXPULSION = 256
+
+    def __init__(self, ruta, ttl, max_conversaciones):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_conversaciones = max_conversaciones
+        self._local = threading.local()
+        self._escrituras = 0
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS conversaciones ('
+                'id TEXT PRIMARY KEY, bienvenida INTEGER NOT NULL, mensajes INTEGER NOT NULL, '
+                'ultima_intencion TEXT, ultimo_sentimiento TEXT, '
+                'creado REAL NOT NULL, acceso REAL NOT NULL)'
+            )
+            conexion.execute('CREATE INDEX IF NOT EXISTS conversaciones_acceso ON conversaciones (acceso)')
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def obtener(self, id):
+        try:
+            fila = self._conexion().execute(
+                'SELECT bienvenida, mensajes, ultima_intencion, ultimo_sentimiento, creado, acceso '
+                'FROM conversaciones WHERE id = ? AND acceso > ?',
+                (id, time.time() - self.ttl)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Error al leer el estado de la conversación: %s", e)
+            fila = None
+
+        if fila is None:
+            return EstadoConversacion(id)
+        return EstadoConversacion(id, bool(fila[0]), *fila[1:])
+
+    def guardar(self, estado):
+        estado.acceso = time.time()
+        try:
+            conexion = self._conexion()
+            conexion.execute(
+                'INSERT OR REPLACE INTO conversaciones '
+                '(id, bienvenida, mensajes, ultima_intencion, ultimo_sentimiento, creado, acceso) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (estado.id, int(estado.bienvenida), estado.mensajes, estado.ultima_intencion,
+                 estado.ultimo_sentimiento, estado.creado, estado.acceso)
+            )
+            self._escrituras += 1
+            if self._escrituras % self._INTERVALO_EXPULSION == 0:
+                self._expulsar(conexion, estado.acceso)
+        except sqlite3.Error as e:
+            logger.warning("Error al guardar el estado de la conversación: %s", e)
+
+    def _expulsar(self, conexion, ahora):
+        conexion.execute('DELETE FROM conversaciones WHERE acceso <= ?', (ahora - self.ttl,))
+        total = conexion.execute('SELECT COUNT(*) FROM conversaciones').fetchone()[0]
+        if total > self.max_conversaciones:
+            conexion.execute(
+                'DELETE FROM conversaciones WHERE id IN '
+                '(SELECT id FROM conversaciones ORDER BY acceso LIMIT ?)',
+                (total - self.max_conversaciones,)
+            )
+
+    def metricas(self):
+        try:
+            conversaciones = self._conexion().execute(
+                'SELECT COUNT(*) FROM conversaciones WHERE acceso > ?', (time.time() - self.ttl,)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            conversaciones = None
+        return {
+            'backend': 'sqlite',
+            'ruta': self.ruta,
+            'conversaciones': conversaciones,
+            'max_conversaciones': self.max_conversaciones,
+            'ttl': self.ttl
+        }
+
+
+_almacen = None
+_lock_almacen = threading.Lock()
+
+
+def obtener_almacen():
+    """
+    Devuelve el almacén de conversaciones configurado, creándolo la primera vez.
+
+    Returns:
+        AlmacenSQLite o AlmacenMemoria
+    """
+    global _almacen
+    if _almacen is not None:
+        return _almacen
+
+    with _lock_almacen:
+        if _almacen is None:
+            backend = os.getenv('CONVERSACION_BACKEND', 'sqlite').lower()
+            ttl = float(os.getenv('CONVERSACION_TTL', '1800'))
+            max_conversaciones = int(os.getenv('CONVERSACION_MAX', '50000'))
+
+            if backend == 'memoria':
+                _almacen = AlmacenMemoria(ttl, max_conversaciones)
+            else:
+                ruta = os.getenv('CONVERSACION_RUTA') or os.path.join(
+                    tempfile.gettempdir(), 'conversaciones.sqlite3'
+                )
+                _almacen = AlmacenSQLite(ruta, ttl, max_conversaciones)
+    return _almacen
@@ -0,0 +1,100 @@
+# === CONFIGURACIÓN DE GUNICORN ===
+"""
+Configuración de gunicorn para Azure App Service (`gunicorn -c gunicorn.conf.py`).
+
+Con preload_app la aplicación se importa una sola vez en el proceso maestro:
+los SDK, el comparador de FAQ, las listas de sugerencias y la plantilla
+compilada se crean antes del fork y los workers los comparten copy-on-write.
+Los recursos de cada worker (pools HTTP, conexiones SQLite, hilos) se crean
+de nuevo en cada worker.
+
+Variables de entorno:
+    PORT: Puerto de escucha (por defecto: 8000)
+    APP_MODO: 'asgi' sirve main_async:app con workers de uvicorn
+    GUNICORN_WORKERS: Número de workers (por defecto: 4)
+    GUNICORN_THREADS: Hilos por worker en modo WSGI (por defecto: 2)
+    GUNICORN_PRELOAD: '0' importa la aplicación en cada worker (por defecto: '1')
+    METRICAS_DIR: Directorio donde los workers vuelcan sus métricas para
+        que /metrics las sume (por defecto: metricas_<PORT> en el directorio
+        temporal)
+"""
+import gc
+import os
+import sys
+import tempfile
+
+# Los módulos de la aplicación están junto a este archivo
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_ASGI = os.getenv('APP_MODO') == 'asgi'
+_MODULO_APP = 'main_async' if _ASGI else 'main'
+
+wsgi_app = f'{_MODULO_APP}:app'
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = 600
+accesslog = '-'
+errorlog = '-'
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+# Los workers heredan la variable del maestro
+os.environ.setdefault('METRICAS_DIR', os.path.join(tempfile.gettempdir(), f"metricas_{os.getenv('PORT', '8000')}"))
+
+if _ASGI:
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    threads = int(os.getenv('GUNICORN_THREADS', '2'))
+
+
+def on_starting(server):
+    # Las métricas de una ejecución anterior no se suman a las de esta
+    from metricas import limpiar_directorio
+    limpiar_directorio()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    # La aplicación ya está importada en el maestro: precargar lo que
+    # comparten los workers
+    modulo = sys.modules.get(_MODULO_APP)
+    precalentar = getattr(modulo, 'precalentar', None)
+    if precalentar is not None:
+        precalentar()
+
+    # Mover los objetos creados hasta ahora a la generación permanente: el
+    # recolector de basura de los workers no los recorre ni escribe en ellos,
+    # así que sus páginas siguen compartidas con el maestro
+    gc.freeze()
+    server.log.info("Aplicación precargada en el maestro (%d objetos congelados)", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    # Cada worker crea sus propios clientes HTTP: nunca reutiliza los
+    # sockets heredados del maestro
+    from clientes_azure import reiniciar_tras_fork
+    reiniciar_tras_fork()
+
+    # Pregenerar tokens de Direct Line antes de recibir tráfico
+    secreto = os.getenv('DIRECT_LINE_SECRET')
+    if secreto and int(os.getenv('DIRECTLINE_PREGENERADOS', '2')) > 0:
+        from servicio_directline import gestor_tokens
+        gestor_tokens.precalentar(secreto)
+
+    # Hilos que procesan la cola de trabajos (las rutas /api/jobs solo
+    # existen en la aplicación WSGI)
+    if not _ASGI:
+        from trabajos import iniciar_procesador
+        iniciar_procesador()
+
+
+def worker_exit(server, worker):
+    # Último volcado para que /metrics conserve lo que midió este worker
+    from metricas import volcar
+    volcar()
+
+    # Los trabajos a medias vuelven a la cola para que los tome otro worker
+    if not _ASGI:
+        from trabajos import detener_procesador
+        detener_procesador()
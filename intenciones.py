@@ -0,0 +1,154 @@
+# === COMPARADOR DE INTENCIONES DEL CHATBOT ===
+"""
+Tabla de preguntas frecuentes del chatbot y su comparador compilado.
+
+La tabla se carga una sola vez al importar el módulo y se compila en un
+trie de palabras. Buscar una intención cuesta O(palabras del mensaje x
+palabras de la frase más larga), sin importar cuántas frases haya.
+
+Las frases se comparan por palabras completas ("pago" no coincide con
+"apagó") sobre texto sin acentos ni mayúsculas ("adios" coincide con
+"adiós").
+"""
+import re
+import unicodedata
+
+# Preguntas y respuestas frecuentes. Si un mensaje contiene varias frases,
+# gana la que aparece antes en la tabla.
+FAQS = {
+    # Saludos
+    'hola': '¡Hola! Soy tu asistente virtual. ¿En qué puedo ayudarte hoy?',
+    'buenos días': '¡Buenos días! ¿Cómo puedo ayudarte hoy?',
+    'buenas tardes': '¡Buenas tardes! ¿En qué puedo asistirte?',
+    'buenas noches': '¡Buenas noches! ¿En qué te puedo ayudar?',
+    
+    # Preguntas generales
+    'quién eres': 'Soy un asistente virtual diseñado para ayudarte con tus consultas. Estoy aquí para hacerte la vida más fácil.',
+    'qué puedes hacer': 'Puedo ayudarte con información sobre productos, seguimiento de pedidos, asistencia técnica y más. ¿En qué necesitas ayuda?',
+    'ayuda': '¡Claro! Estoy aquí para ayudarte. ¿Necesitas información sobre productos, seguimiento de pedidos o asistencia técnica?',
+    
+    # Información de contacto
+    'contacto': '📧 Email: contacto@innovventas.com\n📞 Teléfono: +1 234 567 890\n🏢 Dirección: Av. Principal 123, Ciudad',
+    'horario': '⏰ Horario de atención:\nLunes a Viernes: 9:00 AM - 6:00 PM\nSábados: 9:00 AM - 1:00 PM',
+    
+    # Productos y servicios
+    'productos': 'Ofrecemos una amplia gama de productos. ¿Te gustaría saber sobre electrónicos, electrodomésticos o tecnología?',
+    'servicios': 'Nuestros servicios incluyen envíos a domicilio, garantía extendida y soporte técnico. ¿Sobre cuál necesitas información?',
+    
+    # Agradecimientos
+    'gracias': '¡De nada! 😊 ¿Hay algo más en lo que pueda ayudarte hoy?',
+    
+    # Despedidas
+    'adiós': '¡Hasta luego! Que tengas un excelente día. 😊',
+    'hasta luego': '¡Hasta pronto! Si tienes más preguntas, aquí estaré para ayudarte.',
+    
+    # Estado de pedidos
+    'seguimiento': 'Para dar seguimiento a tu pedido, necesitaré el número de orden. ¿Lo tienes a la mano?',
+    'pedido': 'Para ayudarte con tu pedido, necesitaré el número de orden. También puedo ayudarte a realizar un nuevo pedido si lo deseas.',
+    
+    # Devoluciones y garantías
+    'devolución': 'Nuestra política de devoluciones permite devoluciones hasta 30 días después de la compra. ¿Necesitas ayuda para iniciar una devolución?',
+    'garantía': 'La mayoría de nuestros productos tienen una garantía de 1 año. ¿Podrías indicarme el producto sobre el que necesitas información de garantía?',
+    
+    # Formas de pago
+    'pago': 'Aceptamos diferentes métodos de pago: tarjetas de crédito/débito, transferencias bancarias y billeteras digitales. ¿Neitas ayuda con algún método en particular?',
+    
+    # Envíos
+    'envío': 'Realizamos envíos a todo el país. El tiempo y costo de envío varían según la ubicación. ¿Podrías indicarme tu código postal?',
+    
+    # Ofertas
+    'oferta': '¡Claro! Actualmente tenemos promociones especiales. ¿Te interesa alguna categoría en particular?',
+    
+    # Soporte técnico
+    'soporte': 'Para asistencia técnica, por favor describe el problema que estás experimentando y con gusto te ayudaré a resolverlo.',
+    'problema': 'Lamento escuchar que tienes un problema. Por favor, cuéntame más detalles para poder ayudarte mejor.'
+}
+
+_PALABRA = re.compile(r'\w+')
+
+# Clave del trie que marca el final de una frase
+_FIN = ''
+
+
+def normalizar(texto):
+    """
+    Elimina acentos y mayúsculas de un texto.
+
+    Args:
+        texto (str): Texto original
+
+    Returns:
+        str: Texto normalizado
+    """
+    if texto.isascii():
+        return texto.lower()
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def tokenizar(texto):
+    """Devuelve las palabras normalizadas de un texto"""
+    return _PALABRA.findall(normalizar(texto))
+
+
+class ComparadorIntenciones:
+    """
+    Comparador multipatrón de frases sobre un trie de palabras.
+
+    Args:
+        frases: Iterable de pares (frase, respuesta) en orden de prioridad
+    """
+
+    def __init__(self, frases):
+        self._raiz = {}
+        self._entradas = []
+        self._profundidad = 0
+
+        for frase, respuesta in frases:
+            palabras = tokenizar(frase)
+            if not palabras:
+                continue
+
+            nodo = self._raiz
+            for palabra in palabras:
+                nodo = nodo.setdefault(palabra, {})
+
+            # Ante frases repetidas se conserva la primera
+            if _FIN not in nodo:
+                nodo[_FIN] = len(self._entradas)
+                self._entradas.append((frase, respuesta))
+                self._profundidad = max(self._profundidad, len(palabras))
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def buscar(self, mensaje):
+        """
+        Busca la frase de mayor prioridad contenida en el mensaje.
+
+        Args:
+            mensaje (str): Mensaje del usuario
+
+        Returns:
+            tuple: (frase, respuesta) o None si no hay coincidencia
+        """
+        palabras = tokenizar(mensaje)
+        mejor = None
+
+        for inicio in range(len(palabras)):
+            nodo = self._raiz
+            for palabra in palabras[inicio:inicio + self._profundidad]:
+                nodo = nodo.get(palabra)
+                if nodo is None:
+                    break
+                indice = nodo.get(_FIN)
+                if indice is not None and (mejor is None or indice < mejor):
+                    mejor = indice
+                    if mejor == 0:
+                        return self._entradas[0]
+
+        return self._entradas[mejor] if mejor is not None else None
+
+
+# Comparador compilado una sola vez por proceso
+COMPARADOR_FAQ = ComparadorIntenciones(FAQS.items())
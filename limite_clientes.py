@@ -0,0 +1,466 @@
+# === LÍMITES POR CLIENTE ===
+"""
+Límite de peticiones por cliente en las rutas /api/*.
+
+Cada llamada a una ruta /api/* acaba en un servicio de Azure de pago, así
+que un solo cliente no debe poder agotar la cuota de todos. Cada cliente
+(su clave de API si envía una conocida en X-API-Key, o si no su IP) tiene
+en cada ruta:
+
+- un límite de peticiones en una ventana deslizante (LIMITE_VENTANA_S), que
+  se estima con dos contadores: los de la ventana actual y la anterior,
+  ponderados por el tiempo transcurrido. Es O(1) y guarda tres números por
+  cliente y ruta.
+- una cuota diaria, que se reinicia a las 00:00 UTC.
+
+El estado se guarda en un archivo SQLite compartido por los workers del
+host (o en memoria del proceso). Las respuestas llevan las cabeceras
+RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset y RateLimit-Policy, y
+las rechazadas responden 429 con Retry-After.
+
+Límites por defecto (peticiones por ventana / al día; 0 sin límite):
+    /api/analizar-imagen             20 / 1000
+    /api/analizar-imagen/lote         2 / 50
+    /api/traducir                    30 / 2000
+    /api/analizar-sentimiento        60 / 5000
+    /api/analizar-sentimiento/lote    6 / 200
+    /api/chat, /api/chat/stream      30 / 2000
+    /api/directline/token            10 / 200
+    resto de /api/*                 120 / 0
+
+Variables de entorno:
+    LIMITE_CLIENTES: '0' desactiva los límites (por defecto: '1')
+    LIMITE_VENTANA_S: Duración de la ventana deslizante (por defecto: 60)
+    LIMITES_RUTAS: Cambia los límites de algunas rutas, p. ej.
+        '/api/traducir=10/500,/api/chat=60/0'
+    LIMITE_CLAVES_API: Claves de API aceptadas en X-API-Key, separadas por
+        comas; cada una tiene sus propios contadores
+    LIMITE_PROXIES: Proxies de confianza delante de la aplicación; la IP del
+        cliente es la que añadió el último de ellos a X-Forwarded-For
+        (por defecto: 1, el front-end de App Service)
+    LIMITE_BACKEND: 'sqlite' (compartido entre workers) o 'memoria'
+        (por defecto: sqlite)
+    LIMITE_RUTA: Archivo SQLite de los contadores (por defecto:
+        limite_clientes.sqlite3 en el directorio temporal)
+    LIMITE_MAX_CLAVES: Contadores guardados como máximo con el backend
+        'memoria' (por defecto: 100000)
+"""
+import os
+import math
+import time
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ACTIVOS = os.getenv('LIMITE_CLIENTES', '1') != '0'
+
+SEGUNDOS_DIA = 86400
+
+# ruta -> (peticiones por ventana, peticiones al día)
+LIMITES_POR_DEFECTO = {
+    '/api/analizar-imagen': (20, 1000),
+    '/api/analizar-imagen/lote': (2, 50),
+    '/api/traducir': (30, 2000),
+    '/api/analizar-sentimiento': (60, 5000),
+    '/api/analizar-sentimiento/lote': (6, 200),
+    '/api/chat': (30, 2000),
+    '/api/chat/stream': (30, 2000),
+    '/api/directline/token': (10, 200),
+    '/api/jobs': (10, 500),
+    '/api/masivo/sentimiento': (2, 20),
+    '/api/masivo/traducir': (2, 20),
+}
+LIMITE_GENERICO = (120, 0)
+
+
+def _leer_limites():
+    limites = dict(LIMITES_POR_DEFECTO)
+    for regla in filter(None, (parte.strip() for parte in os.getenv('LIMITES_RUTAS', '').split(','))):
+        try:
+            ruta, valores = regla.rsplit('=', 1)
+            por_ventana, diario = valores.split('/')
+            limites[ruta.strip()] = (int(por_ventana), int(diario))
+        except ValueError:
+            logger.warning("Regla de LIMITES_RUTAS no válida: %r", regla)
+    return limites
+
+
+def limite_de_ruta(ruta):
+    """
+    Devuelve el límite de una ruta, o None si no se limita.
+
+    Args:
+        ruta (str): Patrón de la ruta ('/api/traducir')
+
+    Returns:
+        tuple o None: (peticiones por ventana, peticiones al día)
+    """
+    if not ruta.startswith('/api/'):
+        return None
+    return _limites.get(ruta, LIMITE_GENERICO)
+
+
+# --- Ventana deslizante y cuota diaria --------------------------------------------
+
+def _espera_ventana(actual, anterior, fraccion, limite, ventana):
+    """Segundos hasta que la estimación de la ventana deje sitio a una petición más"""
+    if actual + 1 <= limite and anterior > 0:
+        # Basta con que la ventana anterior pese menos
+        objetivo = 1 - (limite - 1 - actual) / anterior
+        return max(objetivo - fraccion, 0.0) * ventana
+    # Hay que esperar a la siguiente ventana, en la que la actual pasa a ser la anterior
+    objetivo = max(1 - (limite - 1) / actual, 0.0) if actual > 0 else 0.0
+    return (1 - fraccion + objetivo) * ventana
+
+
+def evaluar(contadores, ahora, limite, ventana):
+    """
+    Decide si se admite una petición y actualiza los contadores.
+
+    Args:
+        contadores (tuple o None): (índice de ventana, actual, anterior, día, diario)
+        ahora (float): Instante actual (time.time)
+        limite (tuple): (peticiones por ventana, peticiones al día)
+        ventana (float): Duración de la ventana en segundos
+
+    Returns:
+        tuple: (admitida, contadores nuevos, cabeceras RateLimit-*)
+    """
+    por_ventana, por_dia = limite
+    indice, hoy = int(ahora // ventana), int(ahora // SEGUNDOS_DIA)
+    indice_guardado, actual, anterior, dia, diario = contadores or (indice, 0, 0, hoy, 0)
+
+    if indice != indice_guardado:
+        anterior = actual if indice == indice_guardado + 1 else 0
+        actual = 0
+    if dia != hoy:
+        diario = 0
+
+    fraccion = (ahora % ventana) / ventana
+    hasta_fin_dia = SEGUNDOS_DIA - ahora % SEGUNDOS_DIA
+    espera = 0.0
+    if por_ventana and anterior * (1 - fraccion) + actual + 1 > por_ventana:
+        espera = _espera_ventana(actual, anterior, fraccion, por_ventana, ventana)
+    if por_dia and diario + 1 > por_dia:
+        espera = max(espera, hasta_fin_dia)
+
+    admitida = espera == 0
+    if admitida:
+        actual += 1
+        diario += 1
+
+    # Se anuncia el límite que está más cerca de agotarse
+    restantes = []
+    if por_ventana:
+        restantes.append((
+            max(int(por_ventana - (anterior * (1 - fraccion) + actual)), 0),
+            por_ventana, (1 - fraccion) * ventana
+        ))
+    if por_dia:
+        restantes.append((max(por_dia - diario, 0), por_dia, hasta_fin_dia))
+    cabeceras = {}
+    if restantes:
+        restante, total, reinicio = min(restantes)
+        cabeceras = {
+            'RateLimit-Limit': str(total),
+            'RateLimit-Remaining': str(restante),
+            'RateLimit-Reset': str(math.ceil(espera or reinicio)),
+            'RateLimit-Policy': ', '.join(
+                f'{valor};w={segundos}'
+                for valor, segundos in ((por_ventana, int(ventana)), (por_dia, SEGUNDOS_DIA)) if valor
+            ),
+        }
+        if not admitida:
+            cabeceras['Retry-After'] = str(math.ceil(espera))
+    return admitida, (indice, actual, anterior, hoy, diario), cabeceras
+
+
+# --- Almacenes de contadores ------------------------------------------------------
+
+class LimitesMemoria:
+    """Contadores en memoria del proceso, con un máximo de entradas (LRU)"""
+
+    bloqueante = False
+
+    def __init__(self, max_claves):
+        self.max_claves = max_claves
+        self._lock = threading.Lock()
+        self._contadores = OrderedDict()
+
+    def consumir(self, clave, limite, ventana):
+        """
+        Cuenta una petición de un cliente en una ruta.
+
+        Args:
+            clave (str): Cliente y ruta
+            limite (tuple): (peticiones por ventana, peticiones al día)
+            ventana (float): Duración de la ventana en segundos
+
+        Returns:
+            tuple: (admitida, cabeceras RateLimit-*)
+        """
+        with self._lock:
+            admitida, contadores, cabeceras = evaluar(self._contadores.get(clave), time.time(), limite, ventana)
+            self._contadores[clave] = contadores
+            self._contadores.move_to_end(clave)
+            while len(self._contadores) > self.max_claves:
+                self._contadores.popitem(last=False)
+        return admitida, cabeceras
+
+
+class LimitesSQLite:
+    """Contadores en un archivo SQLite compartido por todos los workers del host"""
+
+    # consumir() abre una transacción: MiddlewareLimites la ejecuta en un hilo
+    bloqueante = True
+
+    # Cada cuántas escrituras se borran los contadores de días anteriores
+    _INTERVALO_LIMPIEZA = 256
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._escrituras = 0
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS limites ('
+                'clave TEXT PRIMARY KEY, indice INTEGER NOT NULL, actual INTEGER NOT NULL, '
+                'anterior INTEGER NOT NULL, dia INTEGER NOT NULL, diario INTEGER NOT NULL)'
+            )
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=1, isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def consumir(self, clave, limite, ventana):
+        """Igual que `LimitesMemoria.consumir`, con los contadores compartidos entre workers"""
+        try:
+            conexion = self._conexion()
+            conexion.execute('BEGIN IMMEDIATE')
+            try:
+                ahora = time.time()
+                fila = conexion.execute(
+                    'SELECT indice, actual, anterior, dia, diario FROM limites WHERE clave = ?', (clave,)
+                ).fetchone()
+                admitida, contadores, cabeceras = evaluar(fila, ahora, limite, ventana)
+                if contadores != fila:
+                    conexion.execute(
+                        'INSERT OR REPLACE INTO limites (clave, indice, actual, anterior, dia, diario) '
+                        'VALUES (?, ?, ?, ?, ?, ?)', (clave, *contadores)
+                    )
+                self._escrituras += 1
+                if self._escrituras % self._INTERVALO_LIMPIEZA == 0:
+                    conexion.execute('DELETE FROM limites WHERE dia < ?', (int(ahora // SEGUNDOS_DIA),))
+                conexion.execute('COMMIT')
+                return admitida, cabeceras
+            except BaseException:
+                conexion.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            # Sin acceso a los contadores la petición se atiende
+            logger.warning("Error al leer los límites de '%s': %s", clave, e)
+            return True, {}
+
+
+_limites = _leer_limites()
+_almacen = None
+_lock_almacen = threading.Lock()
+
+
+def obtener_almacen():
+    """
+    Devuelve el almacén de contadores configurado, creándolo la primera vez.
+
+    Returns:
+        LimitesSQLite o LimitesMemoria
+    """
+    global _almacen
+    if _almacen is not None:
+        return _almacen
+
+    with _lock_almacen:
+        if _almacen is None:
+            if os.getenv('LIMITE_BACKEND', 'sqlite').lower() == 'memoria':
+                _almacen = LimitesMemoria(int(os.getenv('LIMITE_MAX_CLAVES', '100000')))
+            else:
+                ruta = os.getenv('LIMITE_RUTA') or os.path.join(tempfile.gettempdir(), 'limite_clientes.sqlite3')
+                _almacen = LimitesSQLite(ruta)
+    return _almacen
+
+
+# --- Identificación del cliente ---------------------------------------------------
+
+_CLAVES_API = {
+    hashlib.sha256(clave.strip().encode('utf-8')).hexdigest()[:16]
+    for clave in os.getenv('LIMITE_CLAVES_API', '').split(',') if clave.strip()
+}
+
+
+def _quitar_puerto(salto):
+    """
+    Quita el puerto que App Service añade a cada salto de X-Forwarded-For:
+    "203.0.113.7:52144" o "[2001:db8::1]:52144". Una IPv6 sin corchetes no lo lleva.
+    """
+    if salto.startswith('['):
+        fin = salto.find(']')
+        return salto[1:fin] if fin > 0 else salto
+    if salto.count(':') == 1:
+        return salto.split(':')[0]
+    return salto
+
+
+def identificar_cliente(clave_api, reenviado_por, ip_remota):
+    """
+    Identifica al cliente de una petición.
+
+    Args:
+        clave_api (str): Cabecera X-API-Key, si la hay
+        reenviado_por (str): Cabecera X-Forwarded-For, si la hay
+        ip_remota (str): IP de la conexión
+
+    Returns:
+        str: 'clave:<huella>' para una clave de API conocida, si no 'ip:<ip>'
+    """
+    if clave_api:
+        huella = hashlib.sha256(clave_api.strip().encode('utf-8')).hexdigest()[:16]
+        # Una clave desconocida no cuenta: si no, bastaría con cambiarla para saltarse el límite
+        if huella in _CLAVES_API:
+            return f'clave:{huella}'
+
+    proxies = int(os.getenv('LIMITE_PROXIES', '1'))
+    if proxies and reenviado_por:
+        saltos = [salto.strip() for salto in reenviado_por.split(',') if salto.strip()]
+        if saltos:
+            ip_remota = _quitar_puerto(saltos[-min(proxies, len(saltos))])
+    return f'ip:{ip_remota}'
+
+
+def comprobar(cliente, ruta):
+    """
+    Cuenta una petición de un cliente a una ruta.
+
+    Args:
+        cliente (str): Identificador devuelto por `identificar_cliente`
+        ruta (str): Patrón de la ruta
+
+    Returns:
+        tuple: (admitida, cabeceras para la respuesta)
+    """
+    limite = limite_de_ruta(ruta)
+    if limite is None or not any(limite):
+        return True, {}
+    return obtener_almacen().consumir(f'{cliente}|{ruta}', limite, float(os.getenv('LIMITE_VENTANA_S', '60')))
+
+
+def cuerpo_rechazo(cabeceras):
+    """Cuerpo JSON de una respuesta 429"""
+    return {
+        'estado': 'error',
+        'mensaje': 'Demasiadas peticiones: se ha superado el límite de este cliente',
+        'reintentar_en': int(cabeceras.get('Retry-After', '1'))
+    }
+
+
+# --- Integración con las aplicaciones ---------------------------------------------
+
+def limitar_flask(app):
+    """
+    Aplica los límites por cliente a las rutas /api/* de una aplicación Flask.
+
+    Args:
+        app (Flask): Aplicación a proteger
+    """
+    if not ACTIVOS:
+        return
+
+    from flask import g, request, jsonify
+
+    @app.before_request
+    def _comprobar_limite():
+        if request.url_rule is None:
+            return None
+        cliente = identificar_cliente(
+            request.headers.get('X-API-Key'), request.headers.get('X-Forwarded-For'), request.remote_addr
+        )
+        admitida, cabeceras = comprobar(cliente, request.url_rule.rule)
+        g.cabeceras_limite = cabeceras
+        if not admitida:
+            logger.debug("Petición limitada", extra={'muestreo': 0.01, 'cliente': cliente, 'ruta': request.url_rule.rule})
+            return jsonify(cuerpo_rechazo(cabeceras)), 429
+        return None
+
+    @app.after_request
+    def _cabeceras_limite(respuesta):
+        for nombre, valor in g.get('cabeceras_limite', {}).items():
+            respuesta.headers[nombre] = valor
+        return respuesta
+
+
+class MiddlewareLimites:
+    """
+    Middleware ASGI equivalente a `limitar_flask` para Starlette:
+
+        Starlette(routes=..., middleware=[Middleware(MiddlewareLimites)])
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._rutas = {}
+
+    def _ruta(self, scope):
+        # Patrón de la ruta de Starlette que atenderá la petición
+        ruta = self._rutas.get(scope['path'])
+        if ruta is None:
+            from starlette.routing import Match
+
+            ruta = ''
+            for candidata in getattr(scope.get('app'), 'routes', []):
+                if candidata.matches(scope)[0] != Match.NONE:
+                    ruta = getattr(candidata, 'path', '')
+                    break
+            if ruta.startswith('/api/') and len(self._rutas) < 1000:
+                self._rutas[scope['path']] = ruta
+        return ruta
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ACTIVOS or not scope['path'].startswith('/api/'):
+            return await self.app(scope, receive, send)
+
+        cabeceras_peticion = {nombre.decode('latin-1').lower(): valor.decode('latin-1') for nombre, valor in scope['headers']}
+        cliente = identificar_cliente(
+            cabeceras_peticion.get('x-api-key'), cabeceras_peticion.get('x-forwarded-for'),
+            (scope.get('client') or ('desconocido', 0))[0]
+        )
+        ruta = self._ruta(scope)
+        if obtener_almacen().bloqueante:
+            # La transacción SQLite no debe parar el event loop
+            from starlette.concurrency import run_in_threadpool
+            admitida, cabeceras = await run_in_threadpool(comprobar, cliente, ruta)
+        else:
+            admitida, cabeceras = comprobar(cliente, ruta)
+        extra = [(nombre.lower().encode('latin-1'), valor.encode('latin-1')) for nombre, valor in cabeceras.items()]
+
+        if not admitida:
+            from starlette.responses import JSONResponse
+            respuesta = JSONResponse(cuerpo_rechazo(cabeceras), status_code=429, headers=cabeceras)
+            return await respuesta(scope, receive, send)
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start' and extra:
+                mensaje = dict(mensaje, headers=list(mensaje.get('headers', [])) + extra)
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
@@ -1,59 +1,64 @@
 # Módulos estándar
 import os
-import sys
+import io
+import csv
 import json
-from pathlib import Path
+import time
+import shutil
+import logging
+import tempfile
+import importlib
+import zipfile
 
 # Módulos de terceros
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
-from dotenv import load_dotenv
 import requests
 
-print("=== Módulos importados correctamente ===", file=sys.stderr)
-print(f"Python version: {sys.version}", file=sys.stderr)
-print(f"JSON module: {json.__file__ if hasattr(json, '__file__') else 'built-in'}", file=sys.stderr)
-
-# Importar los servicios
-from servicio_language import analizar_sentimiento, conectar_language
-from servicio_translator import traducir_texto
-from servicio_vision import describir_imagen
+# Importar los servicios (los SDK de Azure se importan en la primera petición que los usa)
+from configuracion import cargar_entorno, resumen_configuracion
+from registro import configurar_registro
+from servicio_language import analizar_sentimiento, analizar_sentimiento_lote, conectar_language
+from servicio_translator import traducir_texto, traducir_textos
+from servicio_vision import describir_imagen, describir_imagenes
 from servicio_bot import bot as chat_bot
+from servicio_directline import respuesta_token, gestor_tokens
+from agrupador import metricas_agrupadores
+from clientes_azure import precargar_sdk
+from cache_resultados import obtener_cache
+from estado_conversacion import COOKIE_CONVERSACION, id_valido, nuevo_id
+from resiliencia import BackendNoDisponible, PlazoAgotado, con_plazo, estado_backends
+from metricas import instrumentar_flask, exposicion, fase, TIPO_CONTENIDO
+from limite_clientes import limitar_flask
+from subidas import SolicitudSubida, FlujoContado, modo_subida
+from trabajos import ColaLlena, encolar, obtener_almacen, iniciar_procesador
+from masivo import FORMATOS, TIPOS_CONTENIDO, LoteFallido, preparar, procesar, saltar
 
-# Obtener la ruta absoluta del directorio actual
-current_dir = Path(__file__).parent.absolute()
-dotenv_path = current_dir / '.env'
-
-# Cargar variables de entorno
-load_dotenv(dotenv_path=dotenv_path, override=True)
-
-# Mensajes de depuración
-print(f"\n=== main.py ===")
-print(f"Directorio actual: {current_dir}")
-print(f"Ruta del archivo .env: {dotenv_path}")
-print(f"¿Existe .env? {dotenv_path.exists()}")
-print(f"LANGUAGE_KEY: {'Configurada' if os.getenv('LANGUAGE_KEY') else 'No configurada'}")
-print(f"LANGUAGE_ENDPOINT: {'Configurado' if os.getenv('LANGUAGE_ENDPOINT') else 'No configurado'}")
-print(f"VISION_KEY: {'Configurada' if os.getenv('VISION_KEY') else 'No configurada'}")
-print(f"VISION_ENDPOINT: {'Configurado' if os.getenv('VISION_ENDPOINT') else 'No configurado'}")
-print(f"TRANSLATOR_KEY: {'Configurada' if os.getenv('TRANSLATOR_KEY') else 'No configurada'}")
-print(f"TRANSLATOR_ENDPOINT: {'Configurado' if os.getenv('TRANSLATOR_ENDPOINT') else 'No configurado'}")
-print(f"TRANSLATOR_REGION: {'Configurada' if os.getenv('TRANSLATOR_REGION') else 'No configurada'}")
+cargar_entorno()
+configurar_registro()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+app.request_class = SolicitudSubida  # Las subidas se reciben en memoria, sin archivos temporales
 app.config['MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024  # 4MB max-limit
-
-# Crear carpeta de subidas si no existe
-try:
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    print(f"✓ Carpeta de subidas: {app.config['UPLOAD_FOLDER']}")
-except Exception as e:
-    print(f"✗ Error al crear carpeta de subidas: {str(e)}")
-    raise
+app.config['SENTIMIENTO_LOTE_MAX'] = int(os.getenv('SENTIMIENTO_LOTE_MAX', '1000'))  # textos por petición
+app.config['IMAGEN_LOTE_MAX_ARCHIVOS'] = int(os.getenv('IMAGEN_LOTE_MAX_ARCHIVOS', '500'))
+app.config['IMAGEN_LOTE_CONCURRENCIA'] = int(os.getenv('IMAGEN_LOTE_CONCURRENCIA', '4'))
+app.config['IMAGEN_LOTE_TIMEOUT'] = float(os.getenv('IMAGEN_LOTE_TIMEOUT', '30'))  # segundos por imagen
+app.config['MAX_CONTENT_LENGTH_POR_RUTA'] = {
+    '/api/analizar-imagen/lote': int(os.getenv('IMAGEN_LOTE_MAX_BYTES', str(64 * 1024 * 1024))),
+    '/api/jobs': int(os.getenv('TRABAJOS_MAX_BYTES', str(64 * 1024 * 1024))),
+    '/api/masivo/sentimiento': int(os.getenv('MASIVO_MAX_BYTES', str(1024 * 1024 * 1024))),
+    '/api/masivo/traducir': int(os.getenv('MASIVO_MAX_BYTES', str(1024 * 1024 * 1024)))
+}
+app.config['TRABAJOS_MAX_ELEMENTOS'] = int(os.getenv('TRABAJOS_MAX_ELEMENTOS', '50000'))  # textos (x idiomas) por trabajo
+app.config['TRADUCCION_CELDAS_MAX'] = int(os.getenv('TRADUCCION_CELDAS_MAX', '5000'))  # textos x idiomas por petición
+instrumentar_flask(app)  # Histogramas de latencia por ruta, expuestos en /metrics
+limitar_flask(app)  # Límites por cliente en /api/* (ver limite_clientes.py)
 
 # 1. Servicio de Análisis de Sentimiento
 @app.route('/api/analizar-sentimiento', methods=['POST'])
+@con_plazo()
 def analizar_sentimiento_endpoint():
     try:
         datos = request.get_json()
@@ -74,11 +79,61 @@ def analizar_sentimiento_endpoint():
             'mensaje': str(e)
         }), 500
 
+# 1b. Análisis de Sentimiento por lotes
+@app.route('/api/analizar-sentimiento/lote', methods=['POST'])
+@con_plazo()
+def analizar_sentimiento_lote_endpoint():
+    try:
+        datos = request.get_json()
+        textos = datos.get('textos')
+        
+        if not isinstance(textos, list) or not textos:
+            return jsonify({'error': 'No se proporcionó una lista de textos'}), 400
+
+        if len(textos) > app.config['SENTIMIENTO_LOTE_MAX']:
+            return jsonify({
+                'error': f"Se permiten como máximo {app.config['SENTIMIENTO_LOTE_MAX']} textos por petición"
+            }), 400
+
+        resultados = analizar_sentimiento_lote(textos)
+        return jsonify({
+            'estado': 'éxito',
+            'resultados': resultados
+        })
+
+    except Exception as e:
+        return jsonify({
+            'estado': 'error',
+            'mensaje': str(e)
+        }), 500
+
 # 2. Servicio de Traducción
 @app.route('/api/traducir', methods=['POST'])
+@con_plazo()
 def traducir():
     try:
         datos = request.get_json()
+        
+        # Varios textos y/o varios idiomas: se devuelve una matriz texto x idioma
+        if 'textos' in datos or 'idiomas' in datos:
+            textos = datos.get('textos', [datos.get('texto', '')])
+            idiomas = datos.get('idiomas', [datos.get('idioma', 'en')])
+            
+            if not isinstance(textos, list) or not textos:
+                return jsonify({'error': 'No se proporcionó una lista de textos para traducir'}), 400
+            if not isinstance(idiomas, list) or not idiomas or not all(isinstance(i, str) and i.strip() for i in idiomas):
+                return jsonify({'error': 'No se proporcionó una lista de idiomas de destino'}), 400
+            if len(textos) * len(idiomas) > app.config['TRADUCCION_CELDAS_MAX']:
+                return jsonify({
+                    'error': f"Se permiten como máximo {app.config['TRADUCCION_CELDAS_MAX']} traducciones (textos x idiomas) por petición"
+                }), 400
+            
+            return jsonify({
+                'estado': 'éxito',
+                'idiomas': idiomas,
+                'traducciones': traducir_textos(textos, idiomas)
+            })
+        
         texto = datos.get('texto', '')
         idioma_destino = datos.get('idioma', 'en')  # Por defecto a inglés
         
@@ -99,24 +154,21 @@ def traducir():
 
 # 3. Servicio de Análisis de Imágenes
 @app.route('/api/analizar-imagen', methods=['POST'])
+@con_plazo()
 def analizar_imagen():
-    filepath = None
     try:
-        print("\n=== Inicio de análisis de imagen ===")
-        print(f"Archivos recibidos: {request.files}")
+        with fase('subida'):
+            archivos = request.files
         
-        if 'imagen' not in request.files:
-            print("Error: No se encontró el campo 'imagen' en la solicitud")
+        if 'imagen' not in archivos:
             return jsonify({
                 'estado': 'error',
                 'mensaje': 'No se proporcionó ninguna imagen o el campo no se llama \'imagen\''
             }), 400
         
-        archivo = request.files['imagen']
-        print(f"Archivo recibido: {archivo.filename} (tipo: {archivo.content_type})")
+        archivo = archivos['imagen']
         
         if archivo.filename == '':
-            print("Error: Nombre de archivo vacío")
             return jsonify({
                 'estado': 'error',
                 'mensaje': 'No se seleccionó ningún archivo'
@@ -124,48 +176,235 @@ def analizar_imagen():
         
         # Asegurar que el nombre del archivo sea seguro
         filename = secure_filename(archivo.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
-        print(f"Guardando archivo temporal en: {filepath}")
-        archivo.save(filepath)
-        
-        # Verificar que el archivo se haya guardado correctamente
-        if not os.path.exists(filepath):
-            raise Exception("No se pudo guardar el archivo temporal")
-            
-        print("Archivo guardado correctamente, analizando...")
-        
-        # Analizar imagen (pasamos el archivo directamente)
-        archivo.seek(0)  # Asegurarse de que estamos al inicio del archivo
-        descripcion = describir_imagen(archivo)
-        
-        print(f"Análisis completado: {descripcion[:100]}...")
+        # La subida ya está en memoria (o en un spool anónimo): se envía a
+        # Azure directamente, sin copiarla
+        tamano = FlujoContado(archivo.stream).tamano()
+        preprocesado = {}
+        with fase('analisis'):
+            descripcion = describir_imagen(archivo.stream, detalles=preprocesado)
+        # Bytes enviados a Vision: la imagen recomprimida si hubo preprocesado
+        bytes_leidos = preprocesado.pop('bytes_leidos', 0)
+        
+        logger.debug(
+            "Imagen analizada",
+            extra={'muestreo': 0.01, 'archivo': filename, 'tipo': archivo.content_type, 'bytes': tamano}
+        )
         
-        return jsonify({
-            'estado': 'éxito',
-            'descripcion': descripcion,
-            'nombre_archivo': filename
-        })
+        with fase('json'):
+            return jsonify({
+                'estado': 'éxito',
+                'descripcion': descripcion,
+                'nombre_archivo': filename,
+                'subida': {
+                    'modo': modo_subida(),
+                    'bytes': tamano,
+                    'bytes_leidos': bytes_leidos
+                },
+                'preprocesado': preprocesado or None
+            })
         
     except Exception as e:
-        print(f"Error en analizar_imagen: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en analizar_imagen")
         
         return jsonify({
             'estado': 'error',
             'mensaje': f'Error al procesar la imagen: {str(e)}',
             'tipo_error': str(type(e).__name__)
         }), 500
+
+# 3b. Análisis de Imágenes por lotes (varios archivos o un .zip)
+def _imagenes_de_zip(archivo):
+    """Devuelve pares (nombre, abrir) para las imágenes de un archivo zip"""
+    zip_imagenes = zipfile.ZipFile(archivo.stream)
+    miembros = [m for m in zip_imagenes.infolist() if not m.is_dir()]
+    
+    if len(miembros) > app.config['IMAGEN_LOTE_MAX_ARCHIVOS']:
+        raise ValueError(f"El zip contiene más de {app.config['IMAGEN_LOTE_MAX_ARCHIVOS']} archivos")
+    for miembro in miembros:
+        if miembro.file_size > app.config['MAX_CONTENT_LENGTH']:
+            raise ValueError(f"'{miembro.filename}' supera el tamaño máximo por imagen")
+    
+    # Cada imagen se descomprime solo cuando un hilo la va a analizar
+    return [
+        (secure_filename(os.path.basename(m.filename)), lambda m=m: io.BytesIO(zip_imagenes.read(m)))
+        for m in miembros
+    ]
+
+@app.route('/api/analizar-imagen/lote', methods=['POST'])
+def analizar_imagen_lote():
+    try:
+        archivos = [a for a in request.files.getlist('imagenes') if a.filename]
+        archivo_zip = request.files.get('zip')
         
-    finally:
-        # Limpieza: eliminar archivo temporal si existe
-        if filepath and os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                print(f"Archivo temporal eliminado: {filepath}")
-            except Exception as e:
-                print(f"Error al eliminar archivo temporal: {e}")
+        if archivo_zip is not None and archivo_zip.filename:
+            imagenes = _imagenes_de_zip(archivo_zip)
+        else:
+            imagenes = [(secure_filename(a.filename), lambda a=a: a.stream) for a in archivos]
+        
+        if not imagenes:
+            return jsonify({
+                'estado': 'error',
+                'mensaje': 'No se proporcionaron imágenes en el campo \'imagenes\' ni un archivo \'zip\''
+            }), 400
+        
+        if len(imagenes) > app.config['IMAGEN_LOTE_MAX_ARCHIVOS']:
+            return jsonify({
+                'estado': 'error',
+                'mensaje': f"Se permiten como máximo {app.config['IMAGEN_LOTE_MAX_ARCHIVOS']} imágenes por petición"
+            }), 400
+        
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({
+            'estado': 'error',
+            'mensaje': f'Error al leer las imágenes: {str(e)}'
+        }), 400
+    
+    def generar():
+        errores = 0
+        for resultado in describir_imagenes(
+            imagenes,
+            concurrencia=app.config['IMAGEN_LOTE_CONCURRENCIA'],
+            timeout=app.config['IMAGEN_LOTE_TIMEOUT']
+        ):
+            errores += resultado['estado'] == 'error'
+            yield json.dumps(resultado, ensure_ascii=False) + '\n'
+        yield json.dumps({'fin': True, 'total': len(imagenes), 'errores': errores}) + '\n'
+    
+    # Cada línea NDJSON se envía en cuanto termina su imagen
+    return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+
+# 3c. Trabajos en segundo plano (sentimiento, traducción o imágenes)
+def _leer_trabajo():
+    """Devuelve (tipo, entrada, opciones, prioridad, callback, archivos) de la petición"""
+    if request.mimetype == 'multipart/form-data':
+        datos = request.form
+        archivo_zip = request.files.get('zip')
+        if archivo_zip is not None and archivo_zip.filename:
+            imagenes = _imagenes_de_zip(archivo_zip)
+        else:
+            imagenes = [(secure_filename(a.filename), lambda a=a: a.stream) for a in request.files.getlist('imagenes') if a.filename]
+        if len(imagenes) > app.config['IMAGEN_LOTE_MAX_ARCHIVOS']:
+            raise ValueError(f"Se permiten como máximo {app.config['IMAGEN_LOTE_MAX_ARCHIVOS']} imágenes por trabajo")
+        if datos.get('tipo', 'imagen') != 'imagen':
+            raise ValueError("Los trabajos de texto se envían como JSON; con multipart solo se admite 'imagen'")
+        # Se abren (y, si vienen en un zip, se descomprimen) de una en una al guardarlas
+        archivos = (abrir() for _, abrir in imagenes)
+        entrada = [nombre for nombre, _ in imagenes]
+        tipo, opciones = 'imagen', None
+    else:
+        datos = request.get_json(silent=True)
+        if not isinstance(datos, dict):
+            raise ValueError('Se esperaba un objeto JSON o un formulario multipart con imágenes')
+        tipo, entrada, archivos = datos.get('tipo'), datos.get('textos'), None
+        opciones = {'idiomas': datos.get('idiomas', [datos.get('idioma', 'en')])} if tipo == 'traduccion' else None
+        textos = entrada if isinstance(entrada, list) else []
+        idiomas = opciones['idiomas'] if opciones and isinstance(opciones['idiomas'], list) else [None]
+        if len(textos) * len(idiomas) > app.config['TRABAJOS_MAX_ELEMENTOS']:
+            raise ValueError(f"Se permiten como máximo {app.config['TRABAJOS_MAX_ELEMENTOS']} textos (x idiomas) por trabajo")
+
+    try:
+        prioridad = int(datos.get('prioridad', 5))
+    except (TypeError, ValueError):
+        raise ValueError('La prioridad debe ser un entero entre 0 y 9')
+    return tipo, entrada, opciones, prioridad, datos.get('callback'), archivos
+
+@app.route('/api/jobs', methods=['POST'])
+def crear_trabajo():
+    try:
+        tipo, entrada, opciones, prioridad, callback, archivos = _leer_trabajo()
+        id_trabajo = encolar(tipo, entrada, opciones, prioridad, callback, archivos)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'estado': 'error', 'mensaje': str(e)}), 400
+    except ColaLlena as e:
+        response = jsonify({'estado': 'error', 'mensaje': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    response = jsonify({'estado': 'éxito', 'trabajo': obtener_almacen().obtener(id_trabajo, con_resultados=False)})
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{id_trabajo}'
+    return response
+
+@app.route('/api/jobs/<id_trabajo>', methods=['GET'])
+def consultar_trabajo(id_trabajo):
+    # ?resultados=0 devuelve solo el estado y el progreso
+    trabajo = obtener_almacen().obtener(id_trabajo, con_resultados=request.args.get('resultados') != '0')
+    if trabajo is None:
+        return jsonify({'estado': 'error', 'mensaje': 'No existe el trabajo'}), 404
+    return jsonify({'estado': 'éxito', 'trabajo': trabajo})
+
+@app.route('/api/jobs/<id_trabajo>', methods=['DELETE'])
+def cancelar_trabajo(id_trabajo):
+    estado = obtener_almacen().cancelar(id_trabajo)
+    if estado is None:
+        return jsonify({'estado': 'error', 'mensaje': 'No existe el trabajo'}), 404
+    # Uno en curso se detiene al terminar el trozo que está procesando y uno
+    # que aún recibe sus imágenes, al terminar de guardarlas
+    codigo = 202 if estado in ('en_curso', 'recibiendo') else 200
+    return jsonify({'estado': 'éxito', 'trabajo': obtener_almacen().obtener(id_trabajo, con_resultados=False)}), codigo
+
+# 3d. Sentimiento o traducción de archivos NDJSON/CSV completos (respuesta en streaming)
+@app.route('/api/masivo/sentimiento', methods=['POST'])
+@app.route('/api/masivo/traducir', methods=['POST'])
+def procesar_masivo():
+    operacion = request.url_rule.rule.rsplit('/', 1)[1]
+    formato = request.args.get('formato') or TIPOS_CONTENIDO.get(request.mimetype)
+    idiomas = [idioma.strip() for idioma in request.args.get('idiomas', '').split(',') if idioma.strip()]
+    campo = request.args.get('campo', 'texto')
+    
+    if formato not in FORMATOS:
+        return jsonify({
+            'estado': 'error',
+            'mensaje': "Envía el archivo como text/csv o application/x-ndjson, o indica ?formato=csv|ndjson"
+        }), 400
+    if operacion == 'traducir' and not idiomas:
+        return jsonify({'estado': 'error', 'mensaje': 'Indica los idiomas de destino en ?idiomas=en,fr'}), 400
+    try:
+        # Filas ya recibidas en un intento anterior
+        desde = int(request.args.get('desde', '0'))
+        if desde < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'estado': 'error', 'mensaje': 'desde debe ser un número de filas'}), 400
+    
+    # El archivo se guarda en disco por bloques antes de responder: se usa
+    # memoria constante y el cliente no tiene que leer la respuesta mientras
+    # sigue enviando el archivo
+    entrada = tempfile.TemporaryFile(prefix='masivo_')
+    try:
+        shutil.copyfileobj(request.stream, entrada, 64 * 1024)
+        entrada.seek(0)
+        filas, escritor = preparar(entrada, formato, operacion, campo, idiomas)
+    except (ValueError, csv.Error) as e:
+        entrada.close()
+        return jsonify({'estado': 'error', 'mensaje': f'Error al leer el archivo: {str(e)}'}), 400
+    except Exception:
+        entrada.close()
+        raise
+    
+    def generar():
+        enviadas = desde
+        try:
+            if not desde:
+                yield escritor.cabecera()
+            for grupo in procesar(saltar(filas, desde), operacion, campo, idiomas):
+                enviadas += len(grupo)
+                yield escritor.filas(grupo)
+        except (LoteFallido, UnicodeDecodeError, csv.Error) as e:
+            # La respuesta ya empezó con 200: se termina con una línea de error
+            # y el cliente reintenta con ?desde=<filas>
+            logger.warning("Procesamiento masivo interrumpido tras %d filas: %s", enviadas, e)
+            yield escritor.error(str(e), enviadas)
+        except Exception as e:
+            logger.exception("Error en el procesamiento masivo tras %d filas", enviadas)
+            yield escritor.error(f'Error inesperado: {str(e)}', enviadas)
+        finally:
+            entrada.close()
+    
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generar()), mimetype=mimetype)
 
 # Ruta principal que sirve la interfaz web
 @app.route('/')
@@ -174,15 +413,14 @@ def index():
 
 # Endpoint para obtener token de Direct Line
 @app.route('/api/directline/token', methods=['GET'])
+@con_plazo()
 def generate_directline_token():
     try:
-        print("\n=== Iniciando generación de token Direct Line ===")
-        
         # 1. Validar la clave secreta
         DIRECT_LINE_SECRET = os.getenv('DIRECT_LINE_SECRET')
         if not DIRECT_LINE_SECRET:
             error_msg = 'No se encontró la clave secreta de Direct Line en las variables de entorno'
-            print(f"Error: {error_msg}")
+            logger.error(error_msg)
             return jsonify({
                 'success': False,
                 'error': error_msg,
@@ -194,105 +432,44 @@ def generate_directline_token():
 
         # 2. Validar formato de la clave
         if not DIRECT_LINE_SECRET.startswith('DLSECRET_'):
-            print(f"Advertencia: La clave no tiene el formato esperado. Valor: {DIRECT_LINE_SECRET[:10]}...")
-
-        # 3. Configurar headers con validación
-        headers = {
-            'Authorization': f'Bearer {DIRECT_LINE_SECRET}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Configurar orígenes confiables
-        trusted_origins = [
-            'https://sandra-servicio-akenaacucyavbug9.brazilsouth-01.azurewebsites.net',
-            'http://localhost:8000',
-            'http://localhost:5000'
-        ]
-        
-        # Filtrar orígenes vacíos o inválidos
-        trusted_origins = [origin for origin in trusted_origins if origin and origin.strip() != '*']
-        
-        # Datos para la solicitud
-        data = {
-            'user': {
-                'id': f"user_{os.urandom(8).hex()}",
-                'name': 'Usuario Web'  # Nombre opcional
-            },
-            'trustedOrigins': trusted_origins
-        }
+            logger.warning("DIRECT_LINE_SECRET no tiene el formato esperado (DLSECRET_...)")
 
-        # 5. Configurar URL y timeout
-        url = 'https://directline.botframework.com/v3/directline/tokens/generate'
-        
-        # 6. Log de depuración (sin exponer la clave secreta)
-        debug_info = {
-            'url': url,
-            'headers': {k: '***' if k == 'Authorization' else v for k, v in headers.items()},
-            'data': data,
-            'direct_line_secret_length': len(DIRECT_LINE_SECRET),
-            'direct_line_secret_prefix': DIRECT_LINE_SECRET[:10] + '...' if DIRECT_LINE_SECRET else None
-        }
-        print(f"\n=== Debug Info ===\n{json.dumps(debug_info, indent=2)}\n")
-
-        # 7. Hacer la petición con timeout
-        response = requests.post(
-            'https://directline.botframework.com/v3/directline/tokens/generate',
-            headers=headers,
-            json=data,
-            timeout=15
+        # 3. Obtener el token del intermediario: reutiliza el del cliente si
+        #    sigue vigente, lo renueva con /tokens/refresh o genera uno nuevo
+        cliente = request.cookies.get(COOKIE_CONVERSACION)
+        if not id_valido(cliente):
+            cliente = nuevo_id()
+        
+        result, origen = gestor_tokens.obtener_token(DIRECT_LINE_SECRET, cliente)
+        logger.debug(
+            "Token Direct Line servido",
+            extra={'muestreo': 0.01, 'origen': origen, 'expires_in': result.get('expires_in')}
         )
         
-        # 8. Manejar respuesta
-        print(f"Respuesta de Direct Line - Estado: {response.status_code}")
-        response.raise_for_status()
-        
-        # Procesar la respuesta
-        result = response.json()
-        
-        # Verificar si la respuesta contiene un token
-        if not result.get('token'):
-            error_msg = 'La respuesta no contiene un token válido'
-            print(f"Error: {error_msg}")
-            return jsonify({
-                'success': False,
-                'error': error_msg,
-                'response': result,
-                'hint': 'Verifica que el bot esté publicado y que la clave secreta sea correcta',
-                'solution': '1. Asegúrate de que el bot esté publicado en Azure\n' +
-                           '2. Verifica que la clave secreta sea la correcta\n' +
-                           '3. Revisa los registros del bot en Azure Portal para ver si hay errores',
-                'debug': {
-                    'status_code': response.status_code,
-                    'response_headers': dict(response.headers)
-                }
-            }), 500
-            
-        # 9. Retornar respuesta exitosa (sin exponer información sensible)
-        # Preparar respuesta exitosa
-        response_data = {
-            'success': True,
-            'token': result.get('token'),
-            'expires_in': result.get('expires_in', 3600),
-            'conversationId': result.get('conversationId'),
-            'streamUrl': result.get('streamUrl'),
-            'hint': 'Token generado correctamente',
-            'debug': {
-                'token_length': len(result.get('token', '')),
-                'expires_in': result.get('expires_in'),
-                'has_conversation_id': 'conversationId' in result
-            }
-        }
-        
-        print(f"Token generado con éxito. Longitud: {len(result.get('token', ''))} caracteres")
+        # 4. Retornar respuesta exitosa (sin exponer información sensible)
+        response_data = respuesta_token(result)
+        response_data['origen'] = origen
         
         # Configurar CORS para permitir el origen de la aplicación
         response = jsonify(response_data)
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
         response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
+        response.headers['Cache-Control'] = 'no-store'
+        response.set_cookie(
+            COOKIE_CONVERSACION, cliente,
+            max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='Lax'
+        )
         
         return response
 
+    except BackendNoDisponible as e:
+        # Direct Line está saturado o con el circuito abierto: se responde sin esperar
+        return _respuesta_no_disponible(e)
+
+    except PlazoAgotado as e:
+        return jsonify({'success': False, 'error': str(e)}), 504
+
     except requests.exceptions.RequestException as e:
         # Manejo detallado de errores de red
         error_info = {
@@ -313,7 +490,10 @@ def generate_directline_token():
             except Exception as resp_err:
                 error_info['response_error'] = f'Error al procesar respuesta: {str(resp_err)}'
         
-        print(f"\n=== Error de conexión ===\n{json.dumps(error_info, indent=2)}\n")
+        logger.warning(
+            "Error al conectar con Direct Line",
+            extra={clave: valor for clave, valor in error_info.items() if clave != 'response_headers'}
+        )
         
         response = jsonify({
             'success': False,
@@ -348,7 +528,10 @@ def generate_directline_token():
                 'response_headers': dict(e.response.headers)
             })
         
-        print(f"\n=== Error de conexión ===\n{json.dumps(error_info, indent=2)}\n")
+        logger.warning(
+            "Error al conectar con Direct Line",
+            extra={clave: valor for clave, valor in error_info.items() if clave != 'response_headers'}
+        )
         
         return jsonify({
             'success': False,
@@ -364,7 +547,7 @@ def generate_directline_token():
         # Manejo de errores inesperados
         import traceback
         error_trace = traceback.format_exc()
-        print(f"\n=== Error inesperado ===\n{error_trace}")
+        logger.exception("Error inesperado al obtener el token de Direct Line")
         
         return jsonify({
             'success': False,
@@ -379,6 +562,7 @@ def generate_directline_token():
 
 # Endpoint para el chatbot
 @app.route('/api/chat', methods=['POST'])
+@con_plazo()
 def chat():
     try:
         data = request.get_json()
@@ -390,9 +574,17 @@ def chat():
                 'error': 'El mensaje no puede estar vacío'
             }), 400
             
+        # La conversación se identifica por el id del cuerpo o por la cookie
+        conversation_id = data.get('conversation_id') or request.cookies.get(COOKIE_CONVERSACION)
+        
         # Obtener respuesta del bot
-        response = chat_bot.generate_response(message)
-        return jsonify(response)
+        response = chat_bot.generate_response(message, conversation_id)
+        resp = jsonify(response)
+        resp.set_cookie(
+            COOKIE_CONVERSACION, response['conversation_id'],
+            max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='Lax'
+        )
+        return resp
         
     except Exception as e:
         return jsonify({
@@ -400,11 +592,122 @@ def chat():
             'error': f'Error al procesar el mensaje: {str(e)}'
         }), 500
 
+# Endpoint del chatbot en streaming (Server-Sent Events): la respuesta se
+# envía en cuanto se conoce y el sentimiento y las sugerencias después
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    
+    if not message:
+        return jsonify({
+            'success': False,
+            'error': 'El mensaje no puede estar vacío'
+        }), 400
+    
+    conversation_id = data.get('conversation_id') or request.cookies.get(COOKIE_CONVERSACION)
+    if not id_valido(conversation_id):
+        conversation_id = nuevo_id()
+    
+    def generar():
+        inicio = time.perf_counter()
+        try:
+            for evento, datos in chat_bot.stream_response(message, conversation_id):
+                yield _evento_sse(evento, datos)
+        except Exception as e:
+            yield _evento_sse('error', {
+                'success': False,
+                'error': f'Error al procesar el mensaje: {str(e)}'
+            })
+        yield _evento_sse('fin', {'ms': round((time.perf_counter() - inicio) * 1000, 1)})
+    
+    response = Response(stream_with_context(generar()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # evita que un proxy acumule los eventos
+    response.set_cookie(
+        COOKIE_CONVERSACION, conversation_id,
+        max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='Lax'
+    )
+    return response
+
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+# Métricas de los agrupadores de solicitudes (tamaño de lote y espera añadida)
+@app.route('/api/estado/agrupadores', methods=['GET'])
+def estado_agrupadores():
+    return jsonify(metricas_agrupadores())
+
+# Métricas de la caché de resultados (aciertos y fallos por servicio)
+@app.route('/api/estado/cache', methods=['GET'])
+def estado_cache():
+    return jsonify(obtener_cache().metricas())
+
+# Rutas tomadas por el chatbot y llamadas de sentimiento evitadas
+@app.route('/api/estado/chat', methods=['GET'])
+def estado_chat():
+    return jsonify(chat_bot.get_stats())
+
+# Variables de configuración definidas por servicio (sin sus valores)
+@app.route('/api/estado/configuracion', methods=['GET'])
+def estado_configuracion():
+    return jsonify(resumen_configuracion())
+
+# Llamadas a Direct Line y edad de los tokens del intermediario
+@app.route('/api/estado/directline', methods=['GET'])
+def estado_directline():
+    return jsonify(gestor_tokens.metricas())
+
+# Circuito, límite de concurrencia y contadores de cada servicio de Azure
+@app.route('/api/estado/backends', methods=['GET'])
+def estado_resiliencia():
+    return jsonify(estado_backends())
+
+# Profundidad de la cola de trabajos (de todos los workers del host)
+@app.route('/api/estado/trabajos', methods=['GET'])
+def estado_trabajos():
+    return jsonify(obtener_almacen().profundidad())
+
+def _respuesta_no_disponible(error):
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'backend': error.backend,
+        'motivo': error.motivo
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(error.reintentar_en) + 1)
+    return response
+
+# Cualquier ruta que deje escapar la excepción responde 503 en lugar de 500
+@app.errorhandler(BackendNoDisponible)
+def backend_no_disponible(error):
+    return _respuesta_no_disponible(error)
+
+# Histogramas de latencia de todos los workers en formato Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(exposicion(), mimetype=TIPO_CONTENIDO)
+
 # Ruta para servir archivos estáticos
 @app.route('/static/<path:path>')
 def serve_static(path):
     return send_from_directory('static', path)
 
+def precalentar():
+    """
+    Prepara en el proceso actual lo que comparten todos los workers: los SDK
+    de Azure, Pillow y la plantilla principal compilada. Lo llama el proceso
+    maestro de gunicorn cuando se usa preload_app (ver gunicorn.conf.py).
+    """
+    precargar_sdk()
+    for modulo in ('PIL.Image', 'PIL.ImageOps'):
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            pass
+    app.jinja_env.get_template('index.html')
+
 if __name__ == '__main__':
     # Verificar conexión con los servicios al iniciar
     try:
@@ -412,9 +715,14 @@ if __name__ == '__main__':
         print("✅ Servicios listos en http://localhost:5000")
         print("\nEndpoints disponibles:")
         print("1. POST /api/analizar-sentimiento - Analiza el sentimiento de un texto")
-        print("2. POST /api/traducir - Traduce un texto a otro idioma")
+        print("   POST /api/analizar-sentimiento/lote - Analiza el sentimiento de varios textos")
+        print("2. POST /api/traducir - Traduce uno o varios textos a uno o varios idiomas")
         print("3. POST /api/analizar-imagen - Analiza una imagen")
+        print("   POST /api/analizar-imagen/lote - Analiza varias imágenes o un .zip (respuesta NDJSON)")
+        print("   POST /api/jobs - Encola un trabajo largo; GET /api/jobs/<id> devuelve su estado")
+        print("   POST /api/masivo/sentimiento y /api/masivo/traducir - Procesa un archivo NDJSON o CSV completo")
     except Exception as e:
         print(f"❌ Error al conectar con los servicios: {e}")
     
+    iniciar_procesador()  # Hilos de la cola de trabajos (con gunicorn, en post_fork)
     app.run(debug=True, port=5000)
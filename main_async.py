@@ -0,0 +1,425 @@
+# === PUNTO DE ENTRADA ASÍNCRONO (ASGI) ===
+"""
+Versión ASGI de la aplicación. Sirve las rutas de `main.py` con llamadas no
+bloqueantes a Azure, de modo que un worker puede atender cientos de
+peticiones lentas a la vez.
+
+Las rutas de subidas grandes y respuestas en streaming de archivos
+(/api/analizar-imagen/lote, /api/jobs y /api/masivo/*) solo las sirve
+`main.py`: dependen de la lectura de subidas en memoria y de los límites de
+tamaño por ruta de la aplicación Flask.
+
+Se ejecuta con:
+    APP_MODO=asgi ./startup.sh
+o directamente:
+    gunicorn -k uvicorn.workers.UvicornWorker main_async:app
+"""
+import os
+import json
+import importlib
+import time
+from pathlib import Path
+
+import requests
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from werkzeug.utils import secure_filename
+
+from configuracion import cargar_entorno, resumen_configuracion
+from registro import configurar_registro
+import servicio_async
+from clientes_azure import precargar_sdk
+from servicio_bot import bot as chat_bot
+from estado_conversacion import COOKIE_CONVERSACION, id_valido, nuevo_id
+from servicio_directline import respuesta_token, gestor_tokens
+from resiliencia import BackendNoDisponible, PlazoAgotado, con_plazo, estado_backends
+from metricas import MiddlewareMetricas, exposicion, TIPO_CONTENIDO
+from limite_clientes import MiddlewareLimites
+from servicio_translator import traducir_textos
+from servicio_language import analizar_sentimiento_lote
+from agrupador import metricas_agrupadores
+from cache_resultados import obtener_cache
+from trabajos import obtener_almacen
+
+current_dir = Path(__file__).parent.absolute()
+cargar_entorno()
+configurar_registro()
+
+MAX_CONTENT_LENGTH = 4 * 1024 * 1024  # 4MB max-limit
+SENTIMIENTO_LOTE_MAX = int(os.getenv('SENTIMIENTO_LOTE_MAX', '1000'))  # textos por petición
+TRADUCCION_CELDAS_MAX = int(os.getenv('TRADUCCION_CELDAS_MAX', '5000'))  # textos x idiomas por petición
+
+templates = Jinja2Templates(directory=str(current_dir / 'templates'))
+
+
+async def _leer_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return {}
+
+
+async def index(request):
+    return templates.TemplateResponse(request, 'index.html')
+
+
+# 1. Servicio de Análisis de Sentimiento
+@con_plazo()
+async def analizar_sentimiento_endpoint(request):
+    try:
+        datos = await _leer_json(request)
+        texto = datos.get('texto', '')
+
+        if not texto:
+            return JSONResponse({'error': 'No se proporcionó texto'}, status_code=400)
+
+        resultado = await servicio_async.analizar_sentimiento(texto)
+        return JSONResponse({
+            'estado': 'éxito',
+            'resultado': resultado
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'estado': 'error',
+            'mensaje': str(e)
+        }, status_code=500)
+
+
+# 1b. Análisis de Sentimiento por lotes
+@con_plazo()
+async def analizar_sentimiento_lote_endpoint(request):
+    try:
+        datos = await _leer_json(request)
+        textos = datos.get('textos')
+
+        if not isinstance(textos, list) or not textos:
+            return JSONResponse({'error': 'No se proporcionó una lista de textos'}, status_code=400)
+
+        if len(textos) > SENTIMIENTO_LOTE_MAX:
+            return JSONResponse({
+                'error': f"Se permiten como máximo {SENTIMIENTO_LOTE_MAX} textos por petición"
+            }, status_code=400)
+
+        # Los lotes se envían en paralelo desde la versión síncrona, en un hilo
+        return JSONResponse({
+            'estado': 'éxito',
+            'resultados': await run_in_threadpool(analizar_sentimiento_lote, textos)
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'estado': 'error',
+            'mensaje': str(e)
+        }, status_code=500)
+
+
+# 2. Servicio de Traducción
+@con_plazo()
+async def traducir(request):
+    try:
+        datos = await _leer_json(request)
+        
+        # La matriz texto x idioma reutiliza la versión síncrona en un hilo
+        if 'textos' in datos or 'idiomas' in datos:
+            textos = datos.get('textos', [datos.get('texto', '')])
+            idiomas = datos.get('idiomas', [datos.get('idioma', 'en')])
+
+            if not isinstance(textos, list) or not textos:
+                return JSONResponse({'error': 'No se proporcionó una lista de textos para traducir'}, status_code=400)
+            if not isinstance(idiomas, list) or not idiomas or not all(isinstance(i, str) and i.strip() for i in idiomas):
+                return JSONResponse({'error': 'No se proporcionó una lista de idiomas de destino'}, status_code=400)
+            if len(textos) * len(idiomas) > TRADUCCION_CELDAS_MAX:
+                return JSONResponse({
+                    'error': f"Se permiten como máximo {TRADUCCION_CELDAS_MAX} traducciones (textos x idiomas) por petición"
+                }, status_code=400)
+
+            return JSONResponse({
+                'estado': 'éxito',
+                'idiomas': idiomas,
+                'traducciones': await run_in_threadpool(traducir_textos, textos, idiomas)
+            })
+
+        texto = datos.get('texto', '')
+        idioma_destino = datos.get('idioma', 'en')  # Por defecto a inglés
+
+        if not texto:
+            return JSONResponse({'error': 'No se proporcionó texto para traducir'}, status_code=400)
+
+        resultado = await servicio_async.traducir_texto(texto, idioma_destino)
+        return JSONResponse({
+            'estado': 'éxito',
+            'traduccion': resultado
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'estado': 'error',
+            'mensaje': str(e)
+        }, status_code=500)
+
+
+# 3. Servicio de Análisis de Imágenes
+@con_plazo()
+async def analizar_imagen(request):
+    try:
+        if int(request.headers.get('content-length') or 0) > MAX_CONTENT_LENGTH:
+            return JSONResponse({
+                'estado': 'error',
+                'mensaje': 'La imagen supera el tamaño máximo permitido'
+            }, status_code=413)
+
+        formulario = await request.form()
+        archivo = formulario.get('imagen')
+
+        if archivo is None or isinstance(archivo, str):
+            return JSONResponse({
+                'estado': 'error',
+                'mensaje': 'No se proporcionó ninguna imagen o el campo no se llama \'imagen\''
+            }, status_code=400)
+
+        if not archivo.filename:
+            return JSONResponse({
+                'estado': 'error',
+                'mensaje': 'No se seleccionó ningún archivo'
+            }, status_code=400)
+
+        filename = secure_filename(archivo.filename)
+
+        descripcion = await servicio_async.describir_imagen(await archivo.read())
+
+        return JSONResponse({
+            'estado': 'éxito',
+            'descripcion': descripcion,
+            'nombre_archivo': filename
+        })
+
+    except Exception as e:
+        return JSONResponse({
+            'estado': 'error',
+            'mensaje': f'Error al procesar la imagen: {str(e)}',
+            'tipo_error': str(type(e).__name__)
+        }, status_code=500)
+
+
+# Endpoint para obtener token de Direct Line
+@con_plazo()
+async def generate_directline_token(request):
+    DIRECT_LINE_SECRET = os.getenv('DIRECT_LINE_SECRET')
+    if not DIRECT_LINE_SECRET:
+        return JSONResponse({
+            'success': False,
+            'error': 'No se encontró la clave secreta de Direct Line en las variables de entorno',
+            'hint': 'Verifica que la variable DIRECT_LINE_SECRET esté configurada en Azure App Service'
+        }, status_code=500)
+
+    cliente = request.cookies.get(COOKIE_CONVERSACION)
+    if not id_valido(cliente):
+        cliente = nuevo_id()
+
+    try:
+        # El intermediario responde desde memoria en los casos habituales
+        result, origen = await run_in_threadpool(gestor_tokens.obtener_token, DIRECT_LINE_SECRET, cliente)
+
+        response_data = respuesta_token(result)
+        response_data['origen'] = origen
+        response = JSONResponse(response_data, headers={
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Methods': 'GET,OPTIONS',
+            'Cache-Control': 'no-store'
+        })
+        response.set_cookie(
+            COOKIE_CONVERSACION, cliente,
+            max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='lax'
+        )
+        return response
+
+    except BackendNoDisponible as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e),
+            'backend': e.backend,
+            'motivo': e.motivo
+        }, status_code=503, headers={'Retry-After': str(int(e.reintentar_en) + 1)})
+
+    except PlazoAgotado as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=504)
+
+    except requests.exceptions.HTTPError as e:
+        estado = e.response.status_code if e.response is not None else 500
+        return JSONResponse({
+            'success': False,
+            'error': f'Error al conectar con Direct Line: HTTP {estado}',
+            'hint': 'Verifica que el bot esté publicado y que la clave secreta sea correcta'
+        }, status_code=estado)
+
+    except requests.exceptions.RequestException as e:
+        return JSONResponse({
+            'success': False,
+            'error': f'Error al conectar con Direct Line: {str(e)}',
+            'hint': 'Verifica tu conexión a internet y la configuración del bot'
+        }, status_code=500)
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': f'Error inesperado: {str(e)}',
+            'error_type': type(e).__name__
+        }, status_code=500)
+
+
+# Endpoint para el chatbot
+@con_plazo()
+async def chat(request):
+    try:
+        data = await _leer_json(request)
+        message = data.get('message', '').strip()
+
+        if not message:
+            return JSONResponse({
+                'success': False,
+                'error': 'El mensaje no puede estar vacío'
+            }, status_code=400)
+
+        conversation_id = data.get('conversation_id') or request.cookies.get(COOKIE_CONVERSACION)
+        response = await chat_bot.generate_response_async(message, conversation_id)
+        resp = JSONResponse(response)
+        resp.set_cookie(
+            COOKIE_CONVERSACION, response['conversation_id'],
+            max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='lax'
+        )
+        return resp
+
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': f'Error al procesar el mensaje: {str(e)}'
+        }, status_code=500)
+
+
+# Endpoint del chatbot en streaming (Server-Sent Events)
+async def chat_stream(request):
+    data = await _leer_json(request)
+    message = (data.get('message') or '').strip()
+
+    if not message:
+        return JSONResponse({
+            'success': False,
+            'error': 'El mensaje no puede estar vacío'
+        }, status_code=400)
+
+    conversation_id = data.get('conversation_id') or request.cookies.get(COOKIE_CONVERSACION)
+    if not id_valido(conversation_id):
+        conversation_id = nuevo_id()
+
+    async def generar():
+        inicio = time.perf_counter()
+        try:
+            async for evento, datos in chat_bot.stream_response_async(message, conversation_id):
+                yield _evento_sse(evento, datos)
+        except Exception as e:
+            yield _evento_sse('error', {
+                'success': False,
+                'error': f'Error al procesar el mensaje: {str(e)}'
+            })
+        yield _evento_sse('fin', {'ms': round((time.perf_counter() - inicio) * 1000, 1)})
+
+    response = StreamingResponse(generar(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.set_cookie(
+        COOKIE_CONVERSACION, conversation_id,
+        max_age=int(chat_bot.conversations.ttl), httponly=True, samesite='lax'
+    )
+    return response
+
+
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+async def estado_agrupadores(request):
+    return JSONResponse(metricas_agrupadores())
+
+
+async def estado_cache(request):
+    cache = obtener_cache()
+    if cache.bloqueante:
+        return JSONResponse(await run_in_threadpool(cache.metricas))
+    return JSONResponse(cache.metricas())
+
+
+async def estado_chat(request):
+    return JSONResponse(chat_bot.get_stats())
+
+
+async def estado_configuracion(request):
+    return JSONResponse(resumen_configuracion())
+
+
+async def estado_directline(request):
+    return JSONResponse(gestor_tokens.metricas())
+
+
+async def estado_resiliencia(request):
+    return JSONResponse(estado_backends())
+
+
+async def estado_trabajos(request):
+    # La cola vive en SQLite: se consulta fuera del bucle de eventos
+    return JSONResponse(await run_in_threadpool(lambda: obtener_almacen().profundidad()))
+
+
+async def metrics(request):
+    # Suma los archivos de los workers y lee los indicadores de SQLite (cuota, trabajos)
+    return PlainTextResponse(await run_in_threadpool(exposicion), media_type=TIPO_CONTENIDO)
+
+
+def precalentar():
+    """
+    Prepara en el proceso maestro de gunicorn (preload_app) lo que comparten
+    todos los workers: los SDK de Azure, Pillow y la plantilla principal.
+    """
+    precargar_sdk()
+    for modulo in ('azure.ai.textanalytics.aio', 'azure.ai.translation.text.aio', 'PIL.Image', 'PIL.ImageOps'):
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            pass
+    templates.get_template('index.html')
+
+
+routes = [
+    Route('/', index),
+    Route('/api/analizar-sentimiento', analizar_sentimiento_endpoint, methods=['POST']),
+    Route('/api/analizar-sentimiento/lote', analizar_sentimiento_lote_endpoint, methods=['POST']),
+    Route('/api/traducir', traducir, methods=['POST']),
+    Route('/api/analizar-imagen', analizar_imagen, methods=['POST']),
+    Route('/api/directline/token', generate_directline_token, methods=['GET']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/estado/agrupadores', estado_agrupadores, methods=['GET']),
+    Route('/api/estado/cache', estado_cache, methods=['GET']),
+    Route('/api/estado/chat', estado_chat, methods=['GET']),
+    Route('/api/estado/configuracion', estado_configuracion, methods=['GET']),
+    Route('/api/estado/directline', estado_directline, methods=['GET']),
+    Route('/api/estado/backends', estado_resiliencia, methods=['GET']),
+    Route('/api/estado/trabajos', estado_trabajos, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+
+if (current_dir / 'static').is_dir():
+    routes.append(Mount('/static', app=StaticFiles(directory=str(current_dir / 'static')), name='static'))
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(MiddlewareMetricas), Middleware(MiddlewareLimites)],
+    on_shutdown=[servicio_async.cerrar]
+)
@@ -0,0 +1,439 @@
+# === PROCESAMIENTO MASIVO (NDJSON / CSV) ===
+"""
+Análisis de sentimiento y traducción de archivos NDJSON o CSV con cientos de
+miles de filas, sin una petición HTTP por fila.
+
+Las filas se leen de una en una, se agrupan en lotes del tamaño que admiten
+los servicios y los lotes se procesan con concurrencia limitada. Los
+resultados se escriben en el mismo formato y en el mismo orden que la
+entrada, lote a lote, así que la memoria usada no depende del tamaño del
+archivo: como mucho hay `concurrencia + 1` lotes en memoria.
+
+Se usa desde POST /api/masivo/sentimiento y /api/masivo/traducir, cuya
+respuesta, si se corta, termina con una línea de error que indica las filas
+enviadas (`{"error": ..., "filas": N}` o `#error,N,...`) para reenviar el
+archivo con `?desde=N`, o desde la línea de comandos, que guarda tras cada
+lote un punto de control para reanudar el trabajo si se interrumpe:
+
+    python masivo.py sentimiento resenas.csv resultados.csv --campo texto
+    python masivo.py traducir resenas.ndjson traducidas.ndjson --idiomas en,fr --reanudar
+
+Variables de entorno:
+    MASIVO_LOTE: Filas por lote; en las traducciones, filas x idiomas
+        (por defecto: 100)
+    MASIVO_CONCURRENCIA: Lotes procesados a la vez (por defecto: 2)
+    MASIVO_PLAZO_S: Plazo de las llamadas a Azure de cada intento de un
+        lote (por defecto: 60)
+    MASIVO_REINTENTOS: Veces que se reintenta un lote cuya llamada a Azure
+        falla entera (por defecto: 2)
+"""
+import io
+import os
+import csv
+import json
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from resiliencia import plazo
+
+logger = logging.getLogger(__name__)
+
+OPERACIONES = ('sentimiento', 'traducir')
+FORMATOS = ('ndjson', 'csv')
+
+# Primera celda de la línea con la que termina una respuesta CSV cortada
+MARCA_ERROR_CSV = '#error'
+
+# Tipos de contenido con los que se puede enviar cada formato a la API
+TIPOS_CONTENIDO = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/json-seq': 'ndjson',
+    'text/csv': 'csv',
+}
+
+
+class LoteFallido(Exception):
+    """La llamada a Azure de un lote falló entera tras los reintentos (Azure no disponible, sin credenciales...)"""
+
+    def __init__(self, numero, error):
+        super().__init__(f'Falló el lote {numero}: {error}')
+        self.numero = numero
+
+
+def configuracion():
+    """
+    Lee la configuración del procesamiento masivo.
+
+    Returns:
+        dict: lote, concurrencia, plazo (segundos) y reintentos
+    """
+    return {
+        'lote': max(1, int(os.getenv('MASIVO_LOTE', '100'))),
+        'concurrencia': max(1, int(os.getenv('MASIVO_CONCURRENCIA', '2'))),
+        'plazo': float(os.getenv('MASIVO_PLAZO_S', '60')),
+        'reintentos': max(0, int(os.getenv('MASIVO_REINTENTOS', '2'))),
+    }
+
+
+# --- Lectura -----------------------------------------------------------------------
+
+def _texto(flujo):
+    # Acepta archivos binarios o de texto; 'utf-8-sig' descarta el BOM de Excel
+    if isinstance(flujo, io.TextIOBase):
+        return flujo
+    return io.TextIOWrapper(flujo, encoding='utf-8-sig', newline='')
+
+
+def columnas_csv(flujo):
+    """
+    Prepara la lectura de un CSV y devuelve el lector y sus columnas.
+
+    Returns:
+        tuple: (csv.DictReader, list[str] con las columnas de la cabecera)
+    """
+    lector = csv.DictReader(_texto(flujo))
+    return lector, list(lector.fieldnames or [])
+
+
+def filas_ndjson(flujo):
+    """
+    Lee un NDJSON fila a fila. Las líneas vacías se ignoran; las que no son
+    un objeto JSON se devuelven como {'linea': número}, sin texto.
+
+    Yields:
+        dict: Cada fila
+    """
+    for numero, linea in enumerate(_texto(flujo), start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield fila if isinstance(fila, dict) else {'linea': numero}
+
+
+# --- Procesamiento -----------------------------------------------------------------
+
+def _agrupar(filas, tamano):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _aplanar_sentimiento(resultado):
+    puntuaciones = resultado.get('puntuaciones') or {}
+    return {
+        'sentimiento': resultado.get('sentimiento'),
+        'positivo': puntuaciones.get('positivo'),
+        'neutral': puntuaciones.get('neutral'),
+        'negativo': puntuaciones.get('negativo'),
+        'error': resultado.get('error'),
+    }
+
+
+def _aplanar_traduccion(celdas, idiomas):
+    columnas = {f'traduccion_{idioma}': celdas.get(idioma, {}).get('traduccion') for idioma in idiomas}
+    errores = [f"{idioma}: {celdas[idioma]['error']}" for idioma in idiomas if 'error' in celdas.get(idioma, {})]
+    columnas['error'] = '; '.join(errores) or None
+    return columnas
+
+
+def columnas_resultado(operacion, idiomas=None):
+    """Devuelve las columnas que se añaden a cada fila"""
+    if operacion == 'sentimiento':
+        return ['sentimiento', 'positivo', 'neutral', 'negativo', 'error']
+    return [f'traduccion_{idioma}' for idioma in idiomas] + ['error']
+
+
+def _llamar_servicio(operacion, textos, idiomas, segundos):
+    # Los hilos del executor no heredan el plazo: cada intento tiene el suyo
+    with plazo(segundos):
+        # Los fallos de una llamada entera se lanzan; los de cada texto
+        # (entrada no válida, documento rechazado por Azure) vuelven como filas
+        if operacion == 'sentimiento':
+            from servicio_language import analizar_sentimiento_lote
+            resultados = analizar_sentimiento_lote(textos, lanzar_errores=True)
+            return [_aplanar_sentimiento(resultado) for resultado in resultados]
+        from servicio_translator import traducir_textos
+        matriz = traducir_textos(textos, idiomas, lanzar_errores=True)
+        return [_aplanar_traduccion(celdas, idiomas) for celdas in matriz]
+
+
+def _procesar_lote(operacion, textos, idiomas, segundos, reintentos):
+    for intento in range(reintentos + 1):
+        try:
+            return _llamar_servicio(operacion, textos, idiomas, segundos)
+        except Exception as e:
+            # El limitador de concurrencia rechaza al momento las llamadas que
+            # no caben; la caché evita repetir las partes que ya respondieron
+            if intento == reintentos:
+                raise
+            logger.warning("Reintentando un lote: %s", e)
+            time.sleep(0.5 * 2 ** intento)
+
+
+def procesar(filas, operacion, campo='texto', idiomas=None, lote=None, concurrencia=None, segundos=None):
+    """
+    Procesa filas por lotes con concurrencia limitada, conservando el orden.
+
+    Args:
+        filas: Iterable de dicts (se consume a medida que se procesa)
+        operacion (str): 'sentimiento' o 'traducir'
+        campo (str): Columna o clave con el texto de cada fila
+        idiomas (list[str]): Idiomas de destino para 'traducir'
+        lote (int): Filas por lote (por defecto MASIVO_LOTE)
+        concurrencia (int): Lotes procesados a la vez (por defecto MASIVO_CONCURRENCIA)
+        segundos (float): Plazo de cada lote (por defecto MASIVO_PLAZO_S)
+
+    Yields:
+        list[dict]: Las filas de cada lote con las columnas de resultado añadidas
+
+    Raises:
+        LoteFallido: Si la llamada a Azure de un lote falla entera tras los reintentos
+    """
+    config = configuracion()
+    lote = lote or config['lote']
+    concurrencia = concurrencia or config['concurrencia']
+    segundos = segundos or config['plazo']
+    if operacion == 'traducir':
+        # El lote se mide en traducciones (filas x idiomas)
+        lote = max(1, lote // len(idiomas))
+
+    en_vuelo = deque()
+    executor = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='masivo')
+
+    def entregar():
+        numero, grupo, futuro = en_vuelo.popleft()
+        try:
+            resultados = futuro.result()
+        except Exception as e:
+            # El lote no se da por hecho: se puede reanudar cuando Azure vuelva a responder
+            raise LoteFallido(numero, e) from e
+        for fila, resultado in zip(grupo, resultados):
+            fila.update(resultado)
+        return grupo
+
+    try:
+        for numero, grupo in enumerate(_agrupar(filas, lote), start=1):
+            textos = [fila.get(campo) for fila in grupo]
+            futuro = executor.submit(_procesar_lote, operacion, textos, idiomas, segundos, config['reintentos'])
+            en_vuelo.append((numero, grupo, futuro))
+            # No se lee más entrada hasta que haya sitio: la memoria no crece con el archivo
+            if len(en_vuelo) >= concurrencia:
+                yield entregar()
+        while en_vuelo:
+            yield entregar()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Escritura ---------------------------------------------------------------------
+
+class EscritorNDJSON:
+    """Convierte filas en líneas NDJSON"""
+
+    def cabecera(self):
+        return ''
+
+    def filas(self, filas):
+        return ''.join(json.dumps(fila, ensure_ascii=False) + '\n' for fila in filas)
+
+    def error(self, mensaje, filas):
+        """Última línea de una respuesta cortada: solo las claves 'error' y 'filas'"""
+        return json.dumps({'error': mensaje, 'filas': filas}, ensure_ascii=False) + '\n'
+
+
+class EscritorCSV:
+    """
+    Convierte filas en líneas CSV con las columnas de la entrada seguidas
+    de las de resultado.
+
+    Args:
+        columnas (list[str]): Columnas de la cabecera de la entrada
+        resultado (list[str]): Columnas de resultado
+    """
+
+    def __init__(self, columnas, resultado):
+        self.columnas = columnas + [columna for columna in resultado if columna not in columnas]
+
+    def _escribir(self, escribir):
+        salida = io.StringIO()
+        escribir(csv.DictWriter(salida, fieldnames=self.columnas, extrasaction='ignore', lineterminator='\n'))
+        return salida.getvalue()
+
+    def cabecera(self):
+        return self._escribir(lambda escritor: escritor.writeheader())
+
+    def filas(self, filas):
+        return self._escribir(lambda escritor: escritor.writerows(filas))
+
+    def error(self, mensaje, filas):
+        """Última línea de una respuesta cortada: '#error,<filas>,<mensaje>'"""
+        salida = io.StringIO()
+        csv.writer(salida, lineterminator='\n').writerow([MARCA_ERROR_CSV, filas, mensaje])
+        return salida.getvalue()
+
+
+def preparar(flujo, formato, operacion, campo='texto', idiomas=None):
+    """
+    Abre la entrada y crea el escritor del mismo formato.
+
+    Args:
+        flujo: Archivo de entrada (binario o de texto)
+        formato (str): 'ndjson' o 'csv'
+        operacion (str): 'sentimiento' o 'traducir'
+        campo (str): Columna o clave con el texto de cada fila
+        idiomas (list[str]): Idiomas de destino para 'traducir'
+
+    Returns:
+        tuple: (iterador de filas, EscritorNDJSON o EscritorCSV)
+
+    Raises:
+        ValueError: Si el CSV no tiene la columna `campo`
+    """
+    if formato == 'csv':
+        lector, columnas = columnas_csv(flujo)
+        if campo not in columnas:
+            raise ValueError(f"El CSV no tiene la columna '{campo}'")
+        return lector, EscritorCSV(columnas, columnas_resultado(operacion, idiomas))
+    return filas_ndjson(flujo), EscritorNDJSON()
+
+
+def saltar(filas, cantidad):
+    """Descarta las primeras `cantidad` filas (para reanudar) sin guardarlas"""
+    for _ in range(cantidad):
+        if next(filas, None) is None:
+            break
+    return filas
+
+
+# --- Línea de comandos con punto de control ----------------------------------------
+
+def _leer_control(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def _guardar_control(ruta, control):
+    # Se reemplaza de una vez: una interrupción nunca deja el control a medias
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(control, archivo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def ejecutar(operacion, entrada, salida, formato=None, campo='texto', idiomas=None,
+             lote=None, concurrencia=None, reanudar=False):
+    """
+    Procesa un archivo completo y escribe el resultado en otro, guardando un
+    punto de control (`<salida>.progreso`) tras cada lote terminado.
+
+    Con `reanudar` la salida se recorta a lo que había cuando se guardó el
+    último punto de control y se continúa desde el lote siguiente.
+
+    Returns:
+        dict: filas procesadas, lotes y filas con error
+
+    Raises:
+        ValueError: Si la configuración o la entrada no son válidas, o no
+            coinciden con las del trabajo que se quiere reanudar
+        LoteFallido: Si la llamada a Azure de un lote falla entera tras los
+            reintentos (se puede reanudar)
+    """
+    formato = formato or ('csv' if entrada.lower().endswith('.csv') else 'ndjson')
+    if operacion not in OPERACIONES:
+        raise ValueError(f"Operación no válida: {operacion!r}")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato!r}")
+    if operacion == 'traducir' and not idiomas:
+        raise ValueError('Indica los idiomas de destino con --idiomas')
+
+    ruta_control = salida + '.progreso'
+    parametros = {
+        'operacion': operacion, 'entrada': os.path.abspath(entrada), 'formato': formato,
+        'campo': campo, 'idiomas': idiomas or [], 'lote': lote or configuracion()['lote'],
+    }
+    control = _leer_control(ruta_control)
+    if control is not None and not reanudar:
+        raise ValueError(f"Hay un trabajo a medias en '{salida}': usa --reanudar o borra '{ruta_control}'")
+    if control is not None and control['parametros'] != parametros:
+        raise ValueError(f"'{ruta_control}' es de un trabajo con otros parámetros")
+    control = control or {'parametros': parametros, 'filas': 0, 'lotes': 0, 'errores': 0, 'bytes': 0}
+
+    with open(entrada, 'rb') as archivo_entrada, open(salida, 'ab' if control['bytes'] else 'wb') as archivo_salida:
+        # Lo escrito después del último punto de control se descarta
+        archivo_salida.truncate(control['bytes'])
+        archivo_salida.seek(control['bytes'])
+
+        filas, escritor = preparar(archivo_entrada, formato, operacion, campo, idiomas)
+        if not control['bytes']:
+            archivo_salida.write(escritor.cabecera().encode('utf-8'))
+        if control['filas']:
+            logger.info("Reanudando desde la fila %d (lote %d)", control['filas'], control['lotes'])
+
+        for grupo in procesar(saltar(filas, control['filas']), operacion, campo, idiomas, parametros['lote'], concurrencia):
+            archivo_salida.write(escritor.filas(grupo).encode('utf-8'))
+            archivo_salida.flush()
+            os.fsync(archivo_salida.fileno())
+            control['filas'] += len(grupo)
+            control['lotes'] += 1
+            control['errores'] += sum(1 for fila in grupo if fila.get('error'))
+            control['bytes'] = archivo_salida.tell()
+            _guardar_control(ruta_control, control)
+            logger.info("Lote terminado", extra={'lote': control['lotes'], 'filas': control['filas']})
+
+    os.remove(ruta_control)
+    return {'filas': control['filas'], 'lotes': control['lotes'], 'errores': control['errores']}
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    from configuracion import cargar_entorno
+    from registro import configurar_registro
+
+    parser = argparse.ArgumentParser(description='Sentimiento o traducción de un archivo NDJSON o CSV completo')
+    parser.add_argument('operacion', choices=OPERACIONES)
+    parser.add_argument('entrada', help='Archivo NDJSON o CSV')
+    parser.add_argument('salida', help='Archivo de resultados (mismo formato que la entrada)')
+    parser.add_argument('--formato', choices=FORMATOS, help='Por defecto, según la extensión de la entrada')
+    parser.add_argument('--campo', default='texto', help='Columna o clave con el texto (por defecto: texto)')
+    parser.add_argument('--idiomas', default='', help="Idiomas de destino separados por comas, p. ej. 'en,fr'")
+    parser.add_argument('--lote', type=int, help='Filas por lote (por defecto: MASIVO_LOTE)')
+    parser.add_argument('--concurrencia', type=int, help='Lotes a la vez (por defecto: MASIVO_CONCURRENCIA)')
+    parser.add_argument('--reanudar', action='store_true', help='Continuar desde el último lote terminado')
+    args = parser.parse_args()
+
+    cargar_entorno()
+    configurar_registro()
+    try:
+        resumen = ejecutar(
+            args.operacion, args.entrada, args.salida, args.formato, args.campo,
+            [idioma.strip() for idioma in args.idiomas.split(',') if idioma.strip()],
+            args.lote, args.concurrencia, args.reanudar
+        )
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    except LoteFallido as e:
+        print(f"❌ {e}. Vuelve a lanzarlo con --reanudar para continuar desde ese lote", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrumpido. Vuelve a lanzarlo con --reanudar para continuar desde el último lote", file=sys.stderr)
+        sys.exit(130)
+    print(f"✅ {resumen['filas']} filas en {resumen['lotes']} lotes ({resumen['errores']} con error) -> {args.salida}")
@@ -0,0 +1,382 @@
+# === MÉTRICAS ===
+"""
+Histogramas de latencia con buckets fijos y exposición en formato Prometheus.
+
+Se miden las peticiones HTTP (por ruta, método y código de estado), cada
+llamada a un backend de Azure (por backend y resultado), la espera por la
+cuota de Azure, las fases de las rutas que lo necesitan (subida,
+preprocesado, llamada, JSON...) y la espera y duración de los trabajos en
+segundo plano. Los indicadores (`Indicador`) son valores instantáneos
+que se leen al generar /metrics.
+
+Observar un valor solo actualiza contadores en memoria. Con varios workers
+de gunicorn cada proceso vuelca sus histogramas a `METRICAS_DIR/<pid>.json`
+cada `METRICAS_INTERVALO_S` segundos y al terminar, y `/metrics` suma los
+archivos de todos los procesos, incluidos los de workers ya reiniciados
+para que los contadores nunca retrocedan.
+
+Variables de entorno:
+    METRICAS: '0' desactiva la instrumentación (por defecto: '1')
+    METRICAS_DIR: Directorio compartido por los workers; sin él solo se
+        exponen las métricas del proceso que atiende /metrics
+    METRICAS_INTERVALO_S: Cada cuánto vuelca cada worker sus métricas
+        (por defecto: 5)
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+
+def activas():
+    """
+    Indica si la instrumentación está activada. Se consulta en cada uso
+    porque este módulo se importa antes de que `cargar_entorno()` lea el .env.
+
+    Returns:
+        bool: False si METRICAS vale '0'
+    """
+    return os.getenv('METRICAS', '1') != '0'
+
+
+# Límites superiores (en segundos) de los buckets de todos los histogramas
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_histogramas = {}
+_indicadores = {}
+
+# Ruta de la petición en curso, para etiquetar sus fases
+_ruta_actual = contextvars.ContextVar('ruta_metricas', default='sin_ruta')
+
+
+class Histograma:
+    """
+    Histograma acumulado por combinación de etiquetas.
+
+    Args:
+        nombre (str): Nombre de la métrica en Prometheus
+        ayuda (str): Descripción de la métrica
+        etiquetas (tuple[str]): Nombres de las etiquetas
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        # valores de etiquetas -> [cuenta por bucket..., cuenta fuera de rango, suma]
+        self._series = {}
+        _histogramas[nombre] = self
+
+    def observar(self, segundos, *valores):
+        """
+        Registra una duración.
+
+        Args:
+            segundos (float): Valor observado
+            *valores: Valores de las etiquetas, en el mismo orden
+        """
+        if not activas():
+            return
+        posicion = bisect.bisect_left(BUCKETS, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(BUCKETS) + 1) + [0.0]
+            serie[posicion] += 1
+            serie[-1] += segundos
+        _asegurar_volcado()
+
+    def muestras(self):
+        """Devuelve una copia de las series: {valores: [cuentas..., suma]}"""
+        with self._lock:
+            return {valores: list(serie) for valores, serie in self._series.items()}
+
+
+PETICIONES = Histograma(
+    'http_peticion_segundos', 'Duración de las peticiones HTTP', ('ruta', 'metodo', 'estado')
+)
+LLAMADAS_AZURE = Histograma(
+    'azure_llamada_segundos', 'Duración de cada intento de llamada a un servicio de Azure', ('backend', 'resultado')
+)
+FASES = Histograma(
+    'http_fase_segundos', 'Duración de las fases de una petición', ('ruta', 'fase')
+)
+ESPERAS_CUOTA = Histograma(
+    'azure_cuota_espera_segundos', 'Espera por un token de la cuota de Azure', ('backend', 'resultado')
+)
+TRABAJOS_ESPERA = Histograma(
+    'trabajo_espera_segundos', 'Tiempo en la cola de un trabajo hasta que empieza', ('tipo',)
+)
+TRABAJOS_DURACION = Histograma(
+    'trabajo_duracion_segundos', 'Duración de los trabajos en segundo plano', ('tipo', 'estado')
+)
+
+
+class Indicador:
+    """
+    Valor instantáneo (gauge) que se calcula al generar /metrics. No se
+    vuelca ni se suma entre procesos: `leer` debe consultar un estado
+    compartido si el valor es del host.
+
+    Args:
+        nombre (str): Nombre de la métrica en Prometheus
+        ayuda (str): Descripción de la métrica
+        etiquetas (tuple[str]): Nombres de las etiquetas
+        leer (callable): Devuelve {valores de las etiquetas: valor}
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas, leer):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.leer = leer
+        _indicadores[nombre] = self
+
+
+class fase:
+    """
+    Mide una fase de la petición en curso:
+
+        with fase('subida'):
+            archivo = request.files['imagen']
+
+    Args:
+        nombre (str): Nombre de la fase
+    """
+
+    __slots__ = ('nombre', 'inicio')
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        FASES.observar(time.perf_counter() - self.inicio, _ruta_actual.get(), self.nombre)
+        return False
+
+
+# --- Volcado entre procesos -------------------------------------------------
+
+_lock_volcado = threading.Lock()
+_pid_volcado = None
+
+
+def _directorio():
+    return os.getenv('METRICAS_DIR') or None
+
+
+def _asegurar_volcado():
+    # Un hilo por proceso; tras un fork el del padre no existe en el hijo
+    global _pid_volcado
+    if _pid_volcado == os.getpid():
+        return
+    with _lock_volcado:
+        if _pid_volcado == os.getpid():
+            return
+        _pid_volcado = os.getpid()
+        if _directorio() is None:
+            return
+        intervalo = float(os.getenv('METRICAS_INTERVALO_S', '5'))
+        threading.Thread(target=_volcar_periodicamente, args=(intervalo,), name='metricas', daemon=True).start()
+
+
+def _volcar_periodicamente(intervalo):
+    while True:
+        time.sleep(intervalo)
+        try:
+            volcar()
+        except OSError as e:
+            logger.warning("No se pudieron volcar las métricas: %s", e)
+
+
+def _instantanea():
+    return {
+        nombre: {
+            'ayuda': histograma.ayuda,
+            'etiquetas': list(histograma.etiquetas),
+            'series': [[list(valores), serie] for valores, serie in histograma.muestras().items()]
+        }
+        for nombre, histograma in _histogramas.items()
+    }
+
+
+def volcar():
+    """
+    Escribe las métricas de este proceso en METRICAS_DIR/<pid>.json.
+
+    Returns:
+        str o None: Ruta del archivo escrito
+    """
+    directorio = _directorio()
+    if directorio is None:
+        return None
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f'{os.getpid()}.json')
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(_instantanea(), archivo, ensure_ascii=False)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def limpiar_directorio():
+    """Borra los volcados anteriores. Lo llama el maestro de gunicorn al arrancar."""
+    directorio = _directorio()
+    if directorio is None or not os.path.isdir(directorio):
+        return
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.json') or nombre.endswith('.json.tmp'):
+            os.remove(os.path.join(directorio, nombre))
+
+
+def _agregado():
+    """Suma los volcados de todos los procesos (incluido el actual, recién volcado)"""
+    directorio = _directorio()
+    if directorio is None:
+        return _instantanea()
+
+    volcar()
+    total = {}
+    for nombre_archivo in sorted(os.listdir(directorio)):
+        if not nombre_archivo.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre_archivo), encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            continue
+        for nombre, metrica in datos.items():
+            destino = total.setdefault(nombre, {'ayuda': metrica['ayuda'], 'etiquetas': metrica['etiquetas'], 'series': {}})
+            for valores, serie in metrica['series']:
+                acumulada = destino['series'].get(tuple(valores))
+                if acumulada is None:
+                    destino['series'][tuple(valores)] = list(serie)
+                else:
+                    for i, valor in enumerate(serie):
+                        acumulada[i] += valor
+    for metrica in total.values():
+        metrica['series'] = [[list(valores), serie] for valores, serie in metrica['series'].items()]
+    return total
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exposicion():
+    """
+    Devuelve todas las métricas en el formato de texto de Prometheus (0.0.4).
+
+    Returns:
+        str: Cuerpo de la respuesta de /metrics
+    """
+    lineas = []
+    for nombre, metrica in sorted(_agregado().items()):
+        lineas.append(f"# HELP {nombre} {metrica['ayuda']}")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for valores, serie in sorted(metrica['series']):
+            etiquetas = ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in zip(metrica['etiquetas'], valores))
+            separador = ',' if etiquetas else ''
+            acumulado = 0
+            for limite, cuenta in zip(BUCKETS, serie):
+                acumulado += cuenta
+                lineas.append(f'{nombre}_bucket{{{etiquetas}{separador}le="{limite}"}} {acumulado}')
+            acumulado += serie[len(BUCKETS)]
+            lineas.append(f'{nombre}_bucket{{{etiquetas}{separador}le="+Inf"}} {acumulado}')
+            lineas.append(f'{nombre}_sum{{{etiquetas}}} {serie[-1]:.6f}')
+            lineas.append(f'{nombre}_count{{{etiquetas}}} {acumulado}')
+    for nombre, indicador in sorted(_indicadores.items()):
+        try:
+            valores = indicador.leer()
+        except Exception as e:
+            logger.warning("No se pudo leer el indicador %s: %s", nombre, e)
+            continue
+        lineas.append(f"# HELP {nombre} {indicador.ayuda}")
+        lineas.append(f"# TYPE {nombre} gauge")
+        for etiquetas, valor in sorted(valores.items()):
+            texto = ','.join(f'{clave}="{_escapar(v)}"' for clave, v in zip(indicador.etiquetas, etiquetas))
+            lineas.append(f'{nombre}{{{texto}}} {valor:.6g}')
+    return '\n'.join(lineas) + '\n'
+
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# --- Integración con las aplicaciones ---------------------------------------
+
+def instrumentar_flask(app):
+    """
+    Registra en una aplicación Flask la medición de cada petición por ruta,
+    método y código de estado. La duración incluye el envío del cuerpo en las
+    respuestas en streaming.
+
+    Args:
+        app (Flask): Aplicación a instrumentar
+    """
+    if not activas():
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _inicio_peticion_metricas():
+        g.inicio_metricas = time.perf_counter()
+        g.ruta_metricas = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        _ruta_actual.set(g.ruta_metricas)
+
+    @app.after_request
+    def _fin_peticion_metricas(respuesta):
+        inicio = g.get('inicio_metricas')
+        if inicio is not None:
+            etiquetas = (g.ruta_metricas, request.method, str(respuesta.status_code))
+            respuesta.call_on_close(
+                lambda: PETICIONES.observar(time.perf_counter() - inicio, *etiquetas)
+            )
+        return respuesta
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI equivalente a `instrumentar_flask` para Starlette:
+
+        Starlette(routes=..., middleware=[Middleware(MiddlewareMetricas)])
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._rutas = None
+
+    def _ruta(self, scope):
+        if self._rutas is None:
+            rutas = {}
+            for ruta in getattr(scope.get('app'), 'routes', []):
+                destino = getattr(ruta, 'endpoint', None) or getattr(ruta, 'app', None)
+                rutas[id(destino)] = ruta.path if hasattr(ruta, 'endpoint') else f'{ruta.path}/{{path}}'
+            self._rutas = rutas
+        return self._rutas.get(id(scope.get('endpoint')), 'sin_ruta')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not activas():
+            return await self.app(scope, receive, send)
+
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estado[0] = mensaje['status']
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            PETICIONES.observar(time.perf_counter() - inicio, self._ruta(scope), scope['method'], str(estado[0]))
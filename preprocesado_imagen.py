@@ -0,0 +1,123 @@
+# === PREPROCESADO DE IMÁGENES ===
+"""
+Reduce y recomprime las imágenes antes de enviarlas a Computer Vision.
+
+La calidad de las descripciones apenas cambia por encima de ~1024 px, así
+que enviar la imagen original de varios MB solo añade tiempo de subida.
+
+Variables de entorno:
+    IMAGEN_PREPROCESAR: '0' desactiva el preprocesado (por defecto: '1')
+    IMAGEN_LADO_MAX: Lado mayor máximo en píxeles (por defecto: 1024)
+    IMAGEN_FORMATO: 'JPEG' o 'WEBP' (por defecto: JPEG). La API v3.2 de
+        Computer Vision solo acepta JPEG, PNG, GIF y BMP; WEBP requiere
+        Image Analysis 4.0
+    IMAGEN_CALIDAD: Calidad de compresión de 1 a 100 (por defecto: 85)
+"""
+import io
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Etiqueta EXIF de orientación
+_ORIENTACION = 0x0112
+
+
+def configuracion():
+    """
+    Devuelve la configuración de preprocesado.
+
+    Returns:
+        dict: activo, lado_max, formato y calidad
+    """
+    return {
+        'activo': os.getenv('IMAGEN_PREPROCESAR', '1') != '0',
+        'lado_max': int(os.getenv('IMAGEN_LADO_MAX', '1024')),
+        'formato': os.getenv('IMAGEN_FORMATO', 'JPEG').upper(),
+        'calidad': int(os.getenv('IMAGEN_CALIDAD', '85')),
+    }
+
+
+def _tamano_flujo(flujo):
+    posicion = flujo.tell()
+    total = flujo.seek(0, io.SEEK_END)
+    flujo.seek(posicion)
+    return total
+
+
+def preparar_imagen(flujo, config=None):
+    """
+    Decodifica la imagen de forma perezosa, aplica la orientación EXIF, la
+    reduce al lado máximo configurado y la recomprime.
+
+    Si la imagen ya es lo bastante pequeña, no se puede decodificar o el
+    resultado ocuparía más que el original, se devuelve el flujo original.
+
+    Args:
+        flujo: Objeto de archivo con la imagen original
+        config (dict): Configuración (por defecto: configuracion())
+
+    Returns:
+        tuple: (flujo a enviar, dict con bytes ahorrados y tiempo empleado)
+    """
+    config = config or configuracion()
+    inicio = time.perf_counter()
+    flujo.seek(0)
+    bytes_originales = _tamano_flujo(flujo)
+
+    info = {
+        'aplicado': False,
+        'bytes_originales': bytes_originales,
+        'bytes_enviados': bytes_originales,
+        'bytes_ahorrados': 0,
+    }
+
+    def terminar(resultado):
+        flujo.seek(0)
+        info['ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+        return resultado, info
+
+    if not config['activo']:
+        return terminar(flujo)
+
+    # Pillow se importa con la primera imagen, no al arrancar el worker
+    from PIL import Image, ImageOps
+
+    try:
+        # Image.open solo lee la cabecera; los píxeles se decodifican al usarlos
+        imagen = Image.open(flujo)
+        ancho, alto = imagen.size
+        orientacion = imagen.getexif().get(_ORIENTACION, 1)
+        info['dimensiones_originales'] = [ancho, alto]
+
+        if max(ancho, alto) <= config['lado_max'] and orientacion == 1:
+            return terminar(flujo)
+
+        lado_max = config['lado_max']
+        if imagen.format == 'JPEG':
+            # Decodificación JPEG a escala reducida (mucho más rápida)
+            imagen.draft('RGB', (lado_max, lado_max))
+
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.thumbnail((lado_max, lado_max), getattr(Image, 'Resampling', Image).LANCZOS)
+        if imagen.mode not in ('RGB', 'L'):
+            imagen = imagen.convert('RGB')
+
+        salida = io.BytesIO()
+        imagen.save(salida, format=config['formato'], quality=config['calidad'])
+    except Exception as e:
+        logger.warning("No se pudo preprocesar la imagen, se envía la original: %s", e)
+        return terminar(flujo)
+
+    if salida.tell() >= bytes_originales and orientacion == 1:
+        return terminar(flujo)
+
+    info.update({
+        'aplicado': True,
+        'dimensiones_enviadas': list(imagen.size),
+        'bytes_enviados': salida.tell(),
+        'bytes_ahorrados': bytes_originales - salida.tell(),
+    })
+    salida.seek(0)
+    return terminar(salida)
@@ -0,0 +1,182 @@
+# === REGISTRO (LOGGING) ===
+"""
+Registro estructurado de la aplicación.
+
+Cada módulo usa su propio logger (`logging.getLogger(__name__)`). Los hilos
+que atienden peticiones solo dejan el registro en una cola en memoria; un
+hilo por proceso lo formatea como una línea JSON y lo escribe en stdout, de
+modo que una escritura lenta a los logs de App Service nunca bloquea una
+petición.
+
+Los eventos muy frecuentes se pueden muestrear:
+
+    logger.debug("Token servido desde caché", extra={'muestreo': 0.01})
+
+registra de media uno de cada cien. Los mensajes DEBUG sin `muestreo` usan
+LOG_MUESTREO_DEBUG. Cualquier otro campo de `extra` se añade a la línea JSON.
+
+Variables de entorno:
+    LOG_NIVEL: DEBUG, INFO, WARNING o ERROR (por defecto: INFO)
+    LOG_FORMATO: 'json' o 'texto' (por defecto: json)
+    LOG_MUESTREO_DEBUG: Fracción de mensajes DEBUG que se registran
+        (por defecto: 1)
+    LOG_COLA_MAX: Registros pendientes como máximo; si la cola se llena
+        se descartan y se cuentan (por defecto: 10000)
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import traceback
+import logging.handlers
+from datetime import datetime, timezone
+
+# Atributos propios de LogRecord: el resto son campos pasados con `extra`
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'muestreo'}
+
+_lock = threading.Lock()
+_manejador = None
+_oyente = None
+_descartados = 0
+_sin_avisar = 0
+
+
+class FormateadorJSON(logging.Formatter):
+    """Formatea cada registro como una línea JSON"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_ESTANDAR:
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        elif record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar una fracción de los registros que indican `muestreo`, y de
+    los DEBUG según LOG_MUESTREO_DEBUG.
+    """
+
+    def __init__(self, muestreo_debug=1.0):
+        super().__init__()
+        self.muestreo_debug = muestreo_debug
+
+    def filter(self, record):
+        fraccion = getattr(record, 'muestreo', None)
+        if fraccion is None and record.levelno <= logging.DEBUG:
+            fraccion = self.muestreo_debug
+        return fraccion is None or fraccion >= 1 or random.random() < fraccion
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloquea: si la cola está llena, descarta el
+    registro y lo cuenta, y avisa de cuántos se perdieron en cuanto vuelve
+    a haber sitio. Deja el formateo (y el traceback) al hilo oyente.
+    """
+
+    def prepare(self, record):
+        # El mensaje se resuelve aquí porque los argumentos pueden cambiar
+        # después; el traceback se formatea en el hilo oyente
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        global _descartados, _sin_avisar
+        try:
+            if _sin_avisar:
+                aviso = logging.LogRecord(
+                    __name__, logging.WARNING, __file__, 0,
+                    "Se descartaron %d registros por tener la cola llena", (_sin_avisar,), None
+                )
+                self.queue.put_nowait(self.prepare(aviso))
+                _sin_avisar = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _descartados += 1
+            _sin_avisar += 1
+
+
+def _crear_salida():
+    salida = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMATO', 'json').lower() == 'texto':
+        salida.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        salida.setFormatter(FormateadorJSON())
+    return salida
+
+
+def _arrancar_oyente():
+    global _oyente
+    _oyente = logging.handlers.QueueListener(_manejador.queue, _crear_salida(), respect_handler_level=False)
+    _oyente.start()
+
+
+def configurar_registro():
+    """
+    Configura el logger raíz una sola vez por proceso: nivel, muestreo y
+    escritura en segundo plano a stdout.
+    """
+    global _manejador
+    if _manejador is not None:
+        return
+
+    with _lock:
+        if _manejador is not None:
+            return
+
+        nivel = os.getenv('LOG_NIVEL', 'INFO').upper()
+        manejador = ManejadorCola(queue.Queue(maxsize=int(os.getenv('LOG_COLA_MAX', '10000'))))
+        manejador.addFilter(FiltroMuestreo(float(os.getenv('LOG_MUESTREO_DEBUG', '1'))))
+
+        raiz = logging.getLogger()
+        raiz.setLevel(nivel)
+        raiz.addHandler(manejador)
+        # Los SDK de Azure registran cada petición HTTP en INFO
+        logging.getLogger('azure').setLevel(max(logging.WARNING, raiz.level))
+
+        _manejador = manejador
+        _arrancar_oyente()
+        atexit.register(detener_registro)
+
+
+def detener_registro():
+    """Escribe los registros pendientes y detiene el hilo oyente"""
+    if _oyente is not None:
+        try:
+            _oyente.stop()
+        except Exception:
+            pass
+
+
+def registros_descartados():
+    """Devuelve cuántos registros se han descartado por tener la cola llena"""
+    return _descartados
+
+
+def _reiniciar_tras_fork():
+    # El hilo oyente no existe en el hijo: se crea otro con una cola nueva
+    global _lock
+    _lock = threading.Lock()
+    if _manejador is not None:
+        _manejador.queue = queue.Queue(maxsize=_manejador.queue.maxsize)
+        _arrancar_oyente()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
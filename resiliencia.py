@@ -0,0 +1,708 @@
+# === RESILIENCIA DE LOS BACKENDS ===
+"""
+Limitador de concurrencia adaptativo (AIMD) y cortocircuito por backend.
+
+Cada llamada a un servicio remoto se hace dentro de `proteger(backend)`:
+
+    with proteger('translator'):
+        client.translate(...)
+
+Si el circuito del backend está abierto, o no queda hueco en el limitador
+tras una espera corta, se lanza `BackendNoDisponible` en lugar de dejar el
+hilo bloqueado esperando a un servicio que ya está saturado.
+
+El límite de llamadas simultáneas crece en uno por cada "ventana" de
+llamadas correctas y se reduce a la mitad ante una señal de sobrecarga
+(429, 5xx, timeout, error de conexión o latencia por encima del máximo).
+
+Si el backend tiene una cuota de llamadas por segundo (CUOTA_TPS), cada
+intento reserva antes un token de la cubeta compartida por los workers del
+host (ver `cuota_azure`) y espera a que se reponga como mucho
+CUOTA_ESPERA_MAX_MS, sin pasarse del plazo de la petición; si no llega a
+tiempo se lanza `BackendNoDisponible` sin llamar al servicio.
+
+Las llamadas que fallan por sobrecarga se reintentan con `llamar(backend,
+funcion)` usando espera exponencial con jitter, o el tiempo que indique la
+cabecera Retry-After, sin pasarse nunca del plazo de la petición en curso
+(ver `con_plazo`). Los SDK de Azure se crean sin reintentos propios.
+
+Variables de entorno (admiten un sufijo por backend, por ejemplo
+RESILIENCIA_LIMITE_MAX_VISION):
+    RESILIENCIA_LIMITE_INICIAL: Llamadas simultáneas al arrancar (por defecto: 8)
+    RESILIENCIA_LIMITE_MIN: Límite mínimo (por defecto: 1)
+    RESILIENCIA_LIMITE_MAX: Límite máximo (por defecto: 64)
+    RESILIENCIA_ESPERA_MS: Espera máxima por un hueco antes de rechazar
+        (por defecto: 100)
+    RESILIENCIA_LATENCIA_MAX_MS: Latencia que se trata como sobrecarga
+        (por defecto: 10000)
+    CIRCUITO_FALLOS: Fallos seguidos que abren el circuito (por defecto: 5)
+    CIRCUITO_ABIERTO_S: Segundos que el circuito permanece abierto antes
+        de dejar pasar una llamada de prueba (por defecto: 30)
+    REINTENTOS_MAX: Reintentos por llamada (por defecto: 3)
+    REINTENTOS_BASE_MS: Espera antes del primer reintento (por defecto: 200)
+    REINTENTOS_TOPE_MS: Espera máxima entre intentos; un Retry-After mayor
+        no se reintenta (por defecto: 5000)
+    PLAZO_PETICION_MS: Plazo total de cada petición HTTP (por defecto: 15000)
+    CUOTA_TPS: Llamadas por segundo permitidas en el host; 0 sin cuota
+        (por defecto: 0)
+    CUOTA_RAFAGA: Llamadas que se pueden acumular para una ráfaga; con 1
+        las llamadas salen espaciadas 1/CUOTA_TPS (por defecto: 1)
+    CUOTA_ESPERA_MAX_MS: Espera máxima por un token; 0 rechaza en el acto
+        si no queda ninguno (por defecto: 5000)
+"""
+import os
+import sys
+import time
+import random
+import inspect
+import threading
+import functools
+import contextvars
+from email.utils import parsedate_to_datetime
+
+from clientes_azure import es_error_de_conexion, configuracion_red
+from cuota_azure import obtener_cuota
+from metricas import LLAMADAS_AZURE, ESPERAS_CUOTA
+
+# Códigos HTTP que indican que el backend está saturado o caído
+_CODIGOS_SOBRECARGA = {408, 429, 500, 502, 503, 504}
+
+CERRADO = 'cerrado'
+ABIERTO = 'abierto'
+SEMIABIERTO = 'semiabierto'
+
+
+class BackendNoDisponible(Exception):
+    """
+    El backend no admite más llamadas ahora mismo.
+
+    Attributes:
+        backend (str): Nombre del backend
+        motivo (str): 'circuito_abierto', 'saturado' o 'cuota'
+        reintentar_en (float): Segundos recomendados antes de reintentar
+    """
+
+    def __init__(self, backend, motivo, reintentar_en):
+        self.backend = backend
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+        if motivo == 'circuito_abierto':
+            detalle = f"demasiados fallos recientes, reintenta en {int(reintentar_en) + 1} s"
+        elif motivo == 'cuota':
+            detalle = f"cuota de llamadas por segundo agotada, reintenta en {int(reintentar_en) + 1} s"
+        else:
+            detalle = "demasiadas llamadas en curso"
+        super().__init__(f"El servicio '{backend}' no está disponible temporalmente ({detalle})")
+
+
+class PlazoAgotado(TimeoutError):
+    """
+    La petición en curso se ha quedado sin tiempo antes de poder llamar al backend.
+
+    Attributes:
+        backend (str): Nombre del backend
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        super().__init__(f"Se agotó el plazo de la petición antes de obtener respuesta de '{backend}'")
+
+
+def codigo_estado(error):
+    """
+    Busca el código HTTP de la respuesta asociada a una excepción.
+
+    Args:
+        error (Exception): Excepción de requests, azure-core o msrest
+
+    Returns:
+        int o None
+    """
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        vistos.add(id(error))
+        codigo = getattr(error, 'status_code', None)
+        respuesta = getattr(error, 'response', None)
+        if codigo is None and respuesta is not None:
+            codigo = getattr(respuesta, 'status_code', None) or getattr(respuesta, 'status', None)
+        if isinstance(codigo, int):
+            return codigo
+        error = getattr(error, 'inner_exception', None) or error.__cause__
+    return None
+
+
+def es_sobrecarga(error):
+    """Indica si una excepción señala que el backend está saturado o caído"""
+    # asyncio no se importa aquí: si no está cargado, no puede haber lanzado nada
+    asyncio = sys.modules.get('asyncio')
+    timeouts = (TimeoutError, asyncio.TimeoutError) if asyncio else (TimeoutError,)
+    if isinstance(error, timeouts) or es_error_de_conexion(error):
+        return True
+    return codigo_estado(error) in _CODIGOS_SOBRECARGA
+
+
+def segundos_retry_after(error):
+    """
+    Lee el tiempo de espera que pide el servicio en las cabeceras de la respuesta
+    (retry-after-ms, x-ms-retry-after-ms o Retry-After en segundos o como fecha).
+
+    Args:
+        error (Exception): Excepción de la llamada
+
+    Returns:
+        float o None: Segundos de espera pedidos
+    """
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        vistos.add(id(error))
+        cabeceras = getattr(error, 'headers', None)
+        if cabeceras is None:
+            cabeceras = getattr(getattr(error, 'response', None), 'headers', None)
+        if cabeceras:
+            for nombre in ('retry-after-ms', 'x-ms-retry-after-ms'):
+                valor = cabeceras.get(nombre)
+                if valor:
+                    try:
+                        return max(float(valor) / 1000.0, 0.0)
+                    except ValueError:
+                        pass
+            valor = cabeceras.get('Retry-After') or cabeceras.get('retry-after')
+            if valor:
+                try:
+                    return max(float(valor), 0.0)
+                except ValueError:
+                    try:
+                        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+                    except (TypeError, ValueError):
+                        pass
+        error = getattr(error, 'inner_exception', None) or error.__cause__
+    return None
+
+
+def resultado_llamada(error):
+    """
+    Clasifica el resultado de una llamada para las métricas.
+
+    Returns:
+        str: 'ok', el código HTTP, 'timeout', 'conexion' o 'error'
+    """
+    if error is None:
+        return 'ok'
+    codigo = codigo_estado(error)
+    if codigo is not None:
+        return str(codigo)
+    asyncio = sys.modules.get('asyncio')
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError) if asyncio else TimeoutError):
+        return 'timeout'
+    return 'conexion' if es_error_de_conexion(error) else 'error'
+
+
+def _config(nombre, clave, defecto):
+    valor = os.getenv(f'{clave}_{nombre.upper()}') or os.getenv(clave)
+    return float(valor) if valor else defecto
+
+
+class Backend:
+    """
+    Limitador AIMD y cortocircuito de un backend remoto.
+
+    Args:
+        nombre (str): Nombre del backend ('language', 'translator', ...)
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.limite_min = _config(nombre, 'RESILIENCIA_LIMITE_MIN', 1)
+        self.limite_max = _config(nombre, 'RESILIENCIA_LIMITE_MAX', 64)
+        self.espera = _config(nombre, 'RESILIENCIA_ESPERA_MS', 100) / 1000.0
+        self.latencia_max = _config(nombre, 'RESILIENCIA_LATENCIA_MAX_MS', 10000) / 1000.0
+        self.umbral_fallos = int(_config(nombre, 'CIRCUITO_FALLOS', 5))
+        self.tiempo_abierto = _config(nombre, 'CIRCUITO_ABIERTO_S', 30)
+        self.reintentos_max = int(_config(nombre, 'REINTENTOS_MAX', 3))
+        self.espera_base = _config(nombre, 'REINTENTOS_BASE_MS', 200) / 1000.0
+        self.espera_tope = _config(nombre, 'REINTENTOS_TOPE_MS', 5000) / 1000.0
+        self.cuota_tps = _config(nombre, 'CUOTA_TPS', 0)
+        self.cuota_rafaga = max(_config(nombre, 'CUOTA_RAFAGA', 1), 1)
+        self.cuota_espera_max = _config(nombre, 'CUOTA_ESPERA_MAX_MS', 5000) / 1000.0
+
+        self._condicion = threading.Condition()
+        self.limite = min(max(_config(nombre, 'RESILIENCIA_LIMITE_INICIAL', 8), self.limite_min), self.limite_max)
+        self.en_vuelo = 0
+        self.estado = CERRADO
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+        self._sonda_en_vuelo = False
+        self._contadores = {
+            'llamadas': 0,
+            'exitos': 0,
+            'fallos': 0,
+            'sobrecargas': 0,
+            'rechazos_circuito': 0,
+            'rechazos_limite': 0,
+            'aperturas': 0,
+            'reintentos': 0,
+            'reintentos_con_retry_after': 0,
+            'reintentos_agotados': 0,
+            'plazos_agotados': 0,
+            'esperas_cuota': 0,
+            'rechazos_cuota': 0
+        }
+        self._tiempo_reintentando = 0.0
+        self._tiempo_esperando_cuota = 0.0
+        self._latencia_media = None
+
+    def reservar_cuota(self):
+        """
+        Reserva un token de la cuota del backend, si tiene.
+
+        Returns:
+            float: Segundos que hay que esperar antes de llamar
+
+        Raises:
+            BackendNoDisponible: Si el token no llega antes de la espera
+                máxima o del plazo de la petición
+        """
+        if self.cuota_tps <= 0:
+            return 0.0
+        if self.estado == ABIERTO and time.monotonic() < self._abierto_hasta:
+            # `entrar` la rechazará: no se gasta un token de la cuota
+            return 0.0
+
+        espera_max = self.cuota_espera_max
+        restante = tiempo_restante()
+        if restante is not None:
+            espera_max = max(min(espera_max, restante), 0.0)
+
+        reservado, espera = obtener_cuota().reservar(self.nombre, self.cuota_tps, self.cuota_rafaga, espera_max)
+        ESPERAS_CUOTA.observar(espera if reservado else 0.0, self.nombre, 'concedido' if reservado else 'rechazado')
+        with self._condicion:
+            if not reservado:
+                self._contadores['rechazos_cuota'] += 1
+                raise BackendNoDisponible(self.nombre, 'cuota', espera)
+            if espera > 0:
+                self._contadores['esperas_cuota'] += 1
+                self._tiempo_esperando_cuota += espera
+        return espera
+
+    def _admitir(self, ahora):
+        """
+        Comprueba el circuito y reserva un hueco.
+
+        Returns:
+            tuple: (motivo del rechazo o None, si la llamada es la sonda del circuito semiabierto)
+        """
+        if self.estado == ABIERTO:
+            if ahora < self._abierto_hasta:
+                self._contadores['rechazos_circuito'] += 1
+                return 'circuito_abierto', False
+            self.estado = SEMIABIERTO
+
+        sonda = False
+        if self.estado == SEMIABIERTO:
+            # Solo una llamada de prueba mientras el circuito está semiabierto
+            if self._sonda_en_vuelo:
+                self._contadores['rechazos_circuito'] += 1
+                return 'circuito_abierto', False
+            self._sonda_en_vuelo = sonda = True
+
+        if self.en_vuelo >= int(self.limite):
+            if sonda:
+                self._sonda_en_vuelo = False
+            return 'saturado', False
+
+        self.en_vuelo += 1
+        self._contadores['llamadas'] += 1
+        return None, sonda
+
+    def entrar(self, espera=None):
+        """
+        Reserva un hueco para una llamada, esperando como mucho `espera` segundos.
+
+        Returns:
+            bool: True si la llamada es la sonda del circuito semiabierto
+            (hay que pasarlo a `salir`)
+
+        Raises:
+            BackendNoDisponible: Si el circuito está abierto o no hay hueco
+        """
+        limite_espera = time.monotonic() + (self.espera if espera is None else espera)
+        with self._condicion:
+            while True:
+                ahora = time.monotonic()
+                motivo, sonda = self._admitir(ahora)
+                if motivo is None:
+                    return sonda
+                if motivo == 'circuito_abierto' or ahora >= limite_espera:
+                    self._rechazar(motivo, ahora)
+                self._condicion.wait(limite_espera - ahora)
+
+    async def entrar_async(self, espera=None):
+        """Versión de `entrar` que espera sin bloquear el event loop"""
+        import asyncio
+
+        limite_espera = time.monotonic() + (self.espera if espera is None else espera)
+        while True:
+            with self._condicion:
+                ahora = time.monotonic()
+                motivo, sonda = self._admitir(ahora)
+                if motivo is None:
+                    return sonda
+                if motivo == 'circuito_abierto' or ahora >= limite_espera:
+                    self._rechazar(motivo, ahora)
+            await asyncio.sleep(0.005)
+
+    def _rechazar(self, motivo, ahora):
+        if motivo == 'saturado':
+            self._contadores['rechazos_limite'] += 1
+            raise BackendNoDisponible(self.nombre, motivo, self.espera)
+        raise BackendNoDisponible(self.nombre, motivo, max(self._abierto_hasta - ahora, 0))
+
+    def salir(self, latencia, error=None, sonda=False):
+        """
+        Libera el hueco y ajusta el límite y el circuito según el resultado.
+
+        Args:
+            latencia (float): Duración de la llamada en segundos
+            error (Exception): Excepción de la llamada, si falló
+            sonda (bool): Lo que devolvió `entrar`; solo la sonda cierra o
+                reabre un circuito semiabierto
+        """
+        sobrecarga = (error is not None and es_sobrecarga(error)) or latencia > self.latencia_max
+
+        with self._condicion:
+            self.en_vuelo -= 1
+            self._latencia_media = latencia if self._latencia_media is None else (
+                0.9 * self._latencia_media + 0.1 * latencia
+            )
+
+            if sobrecarga:
+                # Disminución multiplicativa
+                self._contadores['sobrecargas'] += 1
+                self.limite = max(self.limite_min, self.limite / 2)
+            else:
+                # Aumento aditivo: +1 por cada `limite` llamadas correctas
+                self.limite = min(self.limite_max, self.limite + 1 / self.limite)
+
+            # Los errores del cliente (400, 401, 404...) no dicen nada de la salud del backend
+            if error is not None and sobrecarga:
+                self._contadores['fallos'] += 1
+                self._fallos_seguidos += 1
+                # Las llamadas que empezaron antes de abrirse el circuito y
+                # terminan tarde no cambian un circuito abierto o semiabierto
+                if sonda or (self.estado == CERRADO and self._fallos_seguidos >= self.umbral_fallos):
+                    self._contadores['aperturas'] += 1
+                    self.estado = ABIERTO
+                    self._abierto_hasta = time.monotonic() + self.tiempo_abierto
+            else:
+                self._contadores['exitos'] += 1
+                self._fallos_seguidos = 0
+                if sonda and self.estado == SEMIABIERTO:
+                    self.estado = CERRADO
+
+            if sonda:
+                self._sonda_en_vuelo = False
+            self._condicion.notify()
+
+    def espera_reintento(self, intento, error):
+        """
+        Decide si un fallo se reintenta y cuánto hay que esperar antes.
+
+        Args:
+            intento (int): Reintentos ya hechos para esta llamada
+            error (Exception): Excepción del último intento
+
+        Returns:
+            float o None: Segundos de espera, o None si no debe reintentarse
+        """
+        if isinstance(error, (BackendNoDisponible, PlazoAgotado)) or not es_sobrecarga(error):
+            return None
+        if intento >= self.reintentos_max:
+            with self._condicion:
+                self._contadores['reintentos_agotados'] += 1
+            return None
+
+        espera = segundos_retry_after(error)
+        if espera is not None:
+            if espera > self.espera_tope:
+                return None
+        else:
+            # Backoff exponencial con jitter completo
+            espera = random.uniform(0, min(self.espera_tope, self.espera_base * 2 ** intento))
+
+        restante = tiempo_restante()
+        if restante is not None and espera >= restante:
+            with self._condicion:
+                self._contadores['plazos_agotados'] += 1
+            return None
+        return espera
+
+    def registrar_reintento(self, espera, retry_after=False):
+        with self._condicion:
+            self._contadores['reintentos'] += 1
+            if retry_after:
+                self._contadores['reintentos_con_retry_after'] += 1
+            self._tiempo_reintentando += espera
+
+    def metricas(self):
+        with self._condicion:
+            ahora = time.monotonic()
+            estado = self.estado
+            if estado == ABIERTO and ahora >= self._abierto_hasta:
+                estado = SEMIABIERTO
+            return {
+                'circuito': estado,
+                'reabre_en_s': round(max(self._abierto_hasta - ahora, 0), 1) if estado == ABIERTO else 0,
+                'fallos_seguidos': self._fallos_seguidos,
+                'limite': round(self.limite, 2),
+                'limite_min': self.limite_min,
+                'limite_max': self.limite_max,
+                'en_vuelo': self.en_vuelo,
+                'latencia_media_ms': round(self._latencia_media * 1000, 1) if self._latencia_media is not None else None,
+                'tiempo_reintentando_ms': round(self._tiempo_reintentando * 1000, 1),
+                'cuota_tps': self.cuota_tps or None,
+                'tiempo_esperando_cuota_ms': round(self._tiempo_esperando_cuota * 1000, 1),
+                **self._contadores
+            }
+
+
+class _Llamada:
+    """Contexto (síncrono o asíncrono) de una llamada protegida"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __enter__(self):
+        # El token se espera antes de ocupar un hueco del limitador
+        espera = self.backend.reservar_cuota()
+        if espera:
+            time.sleep(espera)
+        self.sonda = self.backend.entrar()
+        self.inicio = time.monotonic()
+        return self
+
+    def __exit__(self, tipo, error, traza):
+        latencia = time.monotonic() - self.inicio
+        self.backend.salir(latencia, error, self.sonda)
+        LLAMADAS_AZURE.observar(latencia, self.backend.nombre, resultado_llamada(error))
+        return False
+
+    async def __aenter__(self):
+        import asyncio
+
+        if self.backend.cuota_tps > 0 and obtener_cuota().bloqueante:
+            # La cuota compartida es una transacción SQLite: fuera del event loop
+            espera = await asyncio.to_thread(self.backend.reservar_cuota)
+        else:
+            espera = self.backend.reservar_cuota()
+        if espera:
+            await asyncio.sleep(espera)
+        self.sonda = await self.backend.entrar_async()
+        self.inicio = time.monotonic()
+        return self
+
+    async def __aexit__(self, tipo, error, traza):
+        return self.__exit__(tipo, error, traza)
+
+
+_backends = {}
+_lock_backends = threading.Lock()
+
+
+def obtener_backend(nombre):
+    """Devuelve el limitador y cortocircuito de un backend, creándolo si hace falta"""
+    backend = _backends.get(nombre)
+    if backend is None:
+        with _lock_backends:
+            backend = _backends.get(nombre)
+            if backend is None:
+                backend = _backends[nombre] = Backend(nombre)
+    return backend
+
+
+def proteger(nombre):
+    """
+    Contexto para hacer una llamada a un backend con limitación y cortocircuito.
+    Admite `with` y `async with`.
+
+    Args:
+        nombre (str): 'language', 'translator', 'vision' o 'directline'
+
+    Raises:
+        BackendNoDisponible: Al entrar, si el backend no admite la llamada
+    """
+    return _Llamada(obtener_backend(nombre))
+
+
+def llamar(nombre, funcion, *args, **kwargs):
+    """
+    Llama a `funcion(*args, **kwargs)` protegida por el backend y la reintenta
+    si falla por sobrecarga, respetando Retry-After y el plazo de la petición.
+
+    Args:
+        nombre (str): Nombre del backend
+        funcion (callable): Llamada al servicio remoto
+
+    Returns:
+        El resultado de `funcion`
+
+    Raises:
+        BackendNoDisponible: Si el backend no admite la llamada
+        PlazoAgotado: Si el plazo de la petición ya ha vencido
+        Exception: El error del último intento si no se puede reintentar
+    """
+    backend = obtener_backend(nombre)
+    intento = 0
+    while True:
+        _comprobar_plazo(backend)
+        try:
+            with _Llamada(backend):
+                return funcion(*args, **kwargs)
+        except Exception as e:
+            espera = backend.espera_reintento(intento, e)
+            if espera is None:
+                raise
+            backend.registrar_reintento(espera, segundos_retry_after(e) is not None)
+            intento += 1
+            time.sleep(espera)
+
+
+async def llamar_async(nombre, funcion, *args, **kwargs):
+    """Versión de `llamar` para corrutinas: `funcion` devuelve un awaitable"""
+    import asyncio
+
+    backend = obtener_backend(nombre)
+    intento = 0
+    while True:
+        _comprobar_plazo(backend)
+        try:
+            async with _Llamada(backend):
+                return await funcion(*args, **kwargs)
+        except Exception as e:
+            espera = backend.espera_reintento(intento, e)
+            if espera is None:
+                raise
+            backend.registrar_reintento(espera, segundos_retry_after(e) is not None)
+            intento += 1
+            await asyncio.sleep(espera)
+
+
+def _comprobar_plazo(backend):
+    restante = tiempo_restante()
+    if restante is not None and restante <= 0:
+        with backend._condicion:
+            backend._contadores['plazos_agotados'] += 1
+        raise PlazoAgotado(backend.nombre)
+
+
+# Instante (time.monotonic) en que vence la petición en curso
+_vencimiento = contextvars.ContextVar('vencimiento_peticion', default=None)
+
+
+def vencimiento():
+    """Devuelve el instante (time.monotonic) en que vence la petición en curso, o None"""
+    return _vencimiento.get()
+
+
+def tiempo_restante():
+    """Devuelve los segundos que le quedan a la petición en curso, o None si no tiene plazo"""
+    limite = _vencimiento.get()
+    return None if limite is None else limite - time.monotonic()
+
+
+def timeout_restante(timeout):
+    """
+    Ajusta el timeout de una llamada para que no termine después del plazo.
+
+    Args:
+        timeout (float): Timeout configurado en segundos
+
+    Returns:
+        float: El menor entre `timeout` y el tiempo restante (como mínimo 10 ms)
+    """
+    restante = tiempo_restante()
+    return timeout if restante is None else max(min(timeout, restante), 0.01)
+
+
+def opciones_timeout(servicio):
+    """
+    Timeouts de una llamada al SDK recortados al plazo de la petición.
+
+    Args:
+        servicio (str): 'vision' (msrest) o un servicio con azure-core
+
+    Returns:
+        dict: Argumentos de la llamada al SDK
+    """
+    config = configuracion_red()
+    conexion = timeout_restante(config['timeout_conexion'])
+    lectura = timeout_restante(config['timeout_lectura'])
+    if servicio == 'vision':
+        return {'timeout': (conexion, lectura)}
+    return {'connection_timeout': conexion, 'read_timeout': lectura}
+
+
+class plazo:
+    """
+    Contexto que fija el plazo de la petición en curso. Un plazo anidado no
+    puede alargar el exterior.
+
+    Args:
+        segundos (float): Duración del plazo desde ahora
+        hasta (float): Instante (time.monotonic) de vencimiento; None sin plazo
+    """
+
+    def __init__(self, segundos=None, hasta=None):
+        if segundos is not None:
+            hasta = time.monotonic() + segundos
+        self.hasta = hasta
+
+    def __enter__(self):
+        actual = _vencimiento.get()
+        nuevo = actual if self.hasta is None or (actual is not None and actual < self.hasta) else self.hasta
+        self._token = _vencimiento.set(nuevo)
+        return self
+
+    def __exit__(self, *exc):
+        _vencimiento.reset(self._token)
+        return False
+
+
+def con_plazo(segundos=None):
+    """
+    Decorador de rutas (Flask o Starlette) que da a cada petición un plazo
+    total para sus llamadas a Azure, incluidos los reintentos.
+
+    Args:
+        segundos (float): Plazo de la ruta; por defecto PLAZO_PETICION_MS
+    """
+    def decorador(vista):
+        def duracion():
+            if segundos is not None:
+                return segundos
+            return float(os.getenv('PLAZO_PETICION_MS', '15000')) / 1000.0
+
+        if inspect.iscoroutinefunction(vista):
+            @functools.wraps(vista)
+            async def envoltura_async(*args, **kwargs):
+                with plazo(duracion()):
+                    return await vista(*args, **kwargs)
+            return envoltura_async
+
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            with plazo(duracion()):
+                return vista(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def estado_backends():
+    """
+    Devuelve el estado de todos los backends usados por este proceso.
+
+    Returns:
+        dict: nombre -> circuito, límite, llamadas en vuelo y contadores
+    """
+    with _lock_backends:
+        backends = dict(_backends)
+    return {nombre: backend.metricas() for nombre, backend in sorted(backends.items())}
@@ -0,0 +1,320 @@
+# === SERVICIOS ASÍNCRONOS (MODO ASGI) ===
+"""
+Versiones asíncronas de los servicios de Azure para `main_async.py`.
+
+Usan los clientes `aio` del SDK de Azure y una única sesión de aiohttp por
+proceso, de modo que un worker puede mantener cientos de llamadas remotas en
+vuelo sin ocupar un hilo por cada una.
+"""
+import os
+import io
+import json
+import asyncio
+import logging
+
+import aiohttp
+
+from clientes_azure import configuracion_red, es_error_de_conexion
+from cache_resultados import obtener_cache, clave_cache, normalizar_texto, hash_bytes
+from resiliencia import llamar_async, opciones_timeout, tiempo_restante
+from servicio_language import (
+    _es_texto_valido, _resultado_entrada_invalida, _formatear_documento, _clave_sentimiento
+)
+from preprocesado_imagen import preparar_imagen, configuracion as configuracion_preprocesado
+
+logger = logging.getLogger(__name__)
+
+# Estado ligado al event loop en el que se creó
+_loop = None
+_sesion = None
+_clientes = {}
+
+
+def _reiniciar_si_cambia_loop():
+    global _loop, _sesion
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        _loop = loop
+        _sesion = None
+        _clientes.clear()
+
+
+def obtener_sesion():
+    """
+    Devuelve la sesión de aiohttp compartida por el proceso.
+
+    Returns:
+        aiohttp.ClientSession: Sesión con pool de conexiones y keep-alive
+    """
+    global _sesion
+    _reiniciar_si_cambia_loop()
+    if _sesion is None or _sesion.closed:
+        config = configuracion_red()
+        _sesion = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config['pool'] * 10, limit_per_host=config['pool'] * 10),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=config['timeout_conexion'],
+                sock_read=config['timeout_lectura']
+            )
+        )
+    return _sesion
+
+
+def _obtener_cliente(servicio, endpoint, clave):
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    sesion = obtener_sesion()
+    llave = (servicio, endpoint)
+    entrada = _clientes.get(llave)
+    if entrada is not None and entrada[0] == clave:
+        return entrada[1]
+
+    config = configuracion_red()
+    transporte = AioHttpTransport(
+        session=sesion,
+        session_owner=False,
+        connection_timeout=config['timeout_conexion'],
+        read_timeout=config['timeout_lectura']
+    )
+
+    if servicio == 'language':
+        from azure.ai.textanalytics.aio import TextAnalyticsClient
+        cliente = TextAnalyticsClient(
+            endpoint=endpoint, credential=AzureKeyCredential(clave), transport=transporte, retry_total=0
+        )
+    elif servicio == 'translator':
+        from azure.ai.translation.text.aio import TextTranslationClient
+        cliente = TextTranslationClient(
+            endpoint=endpoint, credential=AzureKeyCredential(clave), transport=transporte, retry_total=0
+        )
+    else:
+        raise ValueError(f"Servicio desconocido: {servicio}")
+
+    _clientes[llave] = (clave, cliente)
+    return cliente
+
+
+def _invalidar(servicio):
+    for llave in [llave for llave in _clientes if llave[0] == servicio]:
+        del _clientes[llave]
+
+
+async def analizar_documentos(textos, endpoint, clave):
+    """
+    Analiza el sentimiento de varios textos en una sola llamada asíncrona.
+
+    Args:
+        textos (list[str]): Textos a analizar
+        endpoint (str): Endpoint de Azure Language
+        clave (str): Clave de Azure Language
+
+    Returns:
+        list: Documentos de respuesta del SDK de Azure
+    """
+    client = _obtener_cliente('language', endpoint, clave)
+    try:
+        return await llamar_async('language', lambda: client.analyze_sentiment(
+            documents=textos, language="es", **opciones_timeout('language')
+        ))
+    except Exception as e:
+        if es_error_de_conexion(e):
+            _invalidar('language')
+        raise
+
+
+async def _leer_cache(cache, servicio, clave):
+    # Con la caché SQLite la consulta se hace en un hilo, no en el event loop
+    if cache.bloqueante:
+        return await asyncio.to_thread(cache.obtener, servicio, clave)
+    return cache.obtener(servicio, clave)
+
+
+async def _guardar_cache(cache, servicio, clave, valor):
+    if cache.bloqueante:
+        await asyncio.to_thread(cache.guardar, servicio, clave, valor)
+    else:
+        cache.guardar(servicio, clave, valor)
+
+
+async def analizar_sentimiento(texto):
+    """
+    Versión asíncrona de servicio_language.analizar_sentimiento.
+
+    Args:
+        texto (str): Texto a analizar
+
+    Returns:
+        dict: Diccionario con los resultados del análisis de sentimiento
+    """
+    try:
+        if not _es_texto_valido(texto):
+            return _resultado_entrada_invalida()
+
+        key = os.getenv('TEXT_ANALYTICS_KEY')
+        endpoint = os.getenv('TEXT_ANALYTICS_ENDPOINT')
+        if not key or not endpoint:
+            raise ValueError("TEXT_ANALYTICS_KEY o TEXT_ANALYTICS_ENDPOINT no están configuradas en las variables de entorno")
+
+        cache = obtener_cache()
+        clave = _clave_sentimiento(texto)
+        resultado = await _leer_cache(cache, 'sentimiento', clave)
+        if resultado is not None:
+            return resultado
+
+        response = await analizar_documentos([texto], endpoint, key)
+        resultado = _formatear_documento(response[0] if response else None)
+        if resultado.get('sentimiento') != 'error':
+            await _guardar_cache(cache, 'sentimiento', clave, resultado)
+        return resultado
+
+    except Exception as e:
+        return {
+            'sentimiento': 'error',
+            'error': f"Error inesperado: {str(e)}"
+        }
+
+
+async def traducir_texto(texto, idioma_destino="en"):
+    """
+    Versión asíncrona de servicio_translator.traducir_texto.
+
+    Args:
+        texto (str): Texto a traducir
+        idioma_destino (str): Código de idioma de destino (por defecto: "en")
+
+    Returns:
+        str: Texto traducido o mensaje de error
+    """
+    try:
+        if not texto or not isinstance(texto, str) or not texto.strip():
+            return ""
+
+        key = os.getenv('TRANSLATOR_KEY')
+        endpoint = os.getenv('TRANSLATOR_ENDPOINT')
+        if not key or not endpoint:
+            raise ValueError("Las credenciales de Azure Translator no están configuradas correctamente.")
+
+        cache = obtener_cache()
+        clave = clave_cache('traduccion', normalizar_texto(texto, conservar_formato=True), idioma_destino)
+        traduccion = await _leer_cache(cache, 'traduccion', clave)
+        if traduccion is not None:
+            return traduccion
+
+        client = _obtener_cliente('translator', endpoint, key)
+        from azure.ai.translation.text.models import InputTextItem
+        response = await llamar_async('translator', lambda: client.translate(
+            content=[InputTextItem(text=texto)], to=[idioma_destino], **opciones_timeout('translator')
+        ))
+
+        if response and len(response) > 0 and hasattr(response[0], 'translations'):
+            traduccion = response[0].translations[0].text
+            await _guardar_cache(cache, 'traduccion', clave, traduccion)
+            return traduccion
+        return "No se pudo obtener la traducción. Respuesta inesperada del servicio."
+
+    except Exception as e:
+        if es_error_de_conexion(e):
+            _invalidar('translator')
+        logger.warning("Error en la traducción: %s", e)
+        return f"Error al traducir el texto: {str(e)}"
+
+
+def _json_o_none(cuerpo):
+    try:
+        return json.loads(cuerpo)
+    except ValueError:
+        return None
+
+
+async def describir_imagen(imagen_bytes):
+    """
+    Versión asíncrona de servicio_vision.describir_imagen. Llama a la API
+    REST de Computer Vision directamente, ya que el SDK no tiene variante aio.
+
+    Args:
+        imagen_bytes (bytes): Contenido de la imagen
+
+    Returns:
+        str: Descripción de la imagen o mensaje de error
+    """
+    try:
+        if not imagen_bytes:
+            return "No se proporcionó una imagen válida"
+
+        key = os.getenv('VISION_KEY')
+        endpoint = os.getenv('VISION_ENDPOINT')
+        if not key or not endpoint:
+            raise ValueError("VISION_KEY o VISION_ENDPOINT no están configurados")
+
+        max_candidates = 1
+        idioma = "es"
+
+        config = configuracion_preprocesado()
+
+        cache = obtener_cache()
+        clave = clave_cache(
+            'vision', hash_bytes(imagen_bytes), max_candidates, idioma,
+            config['activo'] and [config['lado_max'], config['formato'], config['calidad']]
+        )
+        descripcion = await _leer_cache(cache, 'vision', clave)
+        if descripcion is not None:
+            return descripcion
+
+        # El preprocesado usa CPU: se ejecuta fuera del event loop
+        flujo, _ = await asyncio.to_thread(preparar_imagen, io.BytesIO(imagen_bytes), config)
+
+        async def describir():
+            # Sin plazo se usan los timeouts de la sesión
+            restante = tiempo_restante()
+            opciones = {'timeout': aiohttp.ClientTimeout(total=max(restante, 0.01))} if restante is not None else {}
+            async with obtener_sesion().post(
+                f"{endpoint.rstrip('/')}/vision/v3.2/describe",
+                params={'maxCandidates': str(max_candidates), 'language': idioma, 'model-version': 'latest'},
+                headers={
+                    'Ocp-Apim-Subscription-Key': key,
+                    'Content-Type': 'application/octet-stream'
+                },
+                data=flujo.getvalue(),
+                **opciones
+            ) as respuesta:
+                # Un 502 del gateway puede traer HTML: el código se mira antes
+                # de interpretar el cuerpo
+                resultado = _json_o_none(await respuesta.read())
+                if respuesta.status >= 400:
+                    detalle = resultado.get('error') if isinstance(resultado, dict) else None
+                    detalle = detalle if isinstance(detalle, dict) else {}
+                    error = RuntimeError(f"({detalle.get('code', respuesta.status)}) {detalle.get('message', '')}")
+                    # El código y las cabeceras permiten decidir si se reintenta y cuándo
+                    error.status_code = respuesta.status
+                    error.headers = respuesta.headers
+                    raise error
+                if not isinstance(resultado, dict):
+                    raise RuntimeError("Computer Vision devolvió una respuesta que no es JSON")
+                return resultado
+
+        resultado = await llamar_async('vision', describir)
+
+        captions = (resultado.get('description') or {}).get('captions') or []
+        if captions:
+            descripcion = captions[0]['text']
+            await _guardar_cache(cache, 'vision', clave, descripcion)
+            return descripcion
+        return "No se pudo generar una descripción para la imagen"
+
+    except Exception as e:
+        return f"Error al analizar la imagen: {str(e)}"
+
+
+async def cerrar():
+    """Cierra los clientes y la sesión HTTP del proceso."""
+    global _sesion
+    for _, cliente in list(_clientes.values()):
+        try:
+            await cliente.close()
+        except Exception:
+            pass
+    _clientes.clear()
+    if _sesion is not None and not _sesion.closed:
+        await _sesion.close()
+    _sesion = None
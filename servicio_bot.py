@@ -1,11 +1,47 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator
 import os
+import time
 import random
-from dotenv import load_dotenv
-from azure.ai.textanalytics import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from configuracion import cargar_entorno
+from clientes_azure import obtener_cliente, invalidar_cliente, es_error_de_conexion
+from agrupador import AgrupadorSolicitudes
+from resiliencia import llamar, opciones_timeout, BackendNoDisponible, PlazoAgotado
+from intenciones import COMPARADOR_FAQ
+from estado_conversacion import EstadoConversacion, obtener_almacen, nuevo_id, id_valido
+
+cargar_entorno()
+logger = logging.getLogger(__name__)
+
+# Datos inmutables del bot: se crean una vez al importar el módulo (en el
+# proceso maestro de gunicorn si se usa preload_app)
+SUGGESTIONS = (
+    '¿Cómo hago un pedido?',
+    '¿Cuál es el estado de mi envío?',
+    '¿Tienen este producto en stock?',
+    '¿Cuáles son las formas de pago?'
+)
+
+WELCOME_MESSAGE = """
+¡Hola! 👋 Soy tu asistente virtual de InnovVentas. Estoy aquí para ayudarte con:
+
+📦 **Seguimiento de pedidos**
+💳 **Información de productos**
+❓ **Preguntas frecuentes**
+🛒 **Asistencia en compras**
+
+Por ejemplo, puedes preguntarme:
+• "¿Cómo hago un pedido?"
+• "¿Cuál es el estado de mi envío?"
+• "¿Tienen este producto en stock?"
+• "¿Cuáles son las formas de pago?"
+
+¿En qué puedo ayudarte hoy?
+"""
 
-load_dotenv()
 
 class InnovVentasBot:
     """
@@ -17,115 +53,337 @@ class InnovVentasBot:
     def __init__(self):
         self.language_key = os.getenv('LANGUAGE_KEY')
         self.language_endpoint = os.getenv('LANGUAGE_ENDPOINT')
-        self._welcome_shown = False
+        
+        # Cuándo se calcula el sentimiento de los mensajes que responde una FAQ:
+        # 'lazy' (nunca), 'background' (después de responder) o 'always'
+        self.sentiment_mode = os.getenv('CHAT_SENTIMIENTO', 'lazy').lower()
+        self._background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-sentimiento')
+        self._background_tasks = set()
+        
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'messages': 0,
+            'paths': {},
+            'sentiment_calls': 0,
+            'sentiment_calls_skipped': 0,
+            'background_sentiment_calls': 0,
+            'sentiment_ms': 0.0
+        }
+        
+        # Los mensajes que llegan a la vez comparten una llamada a Azure
+        self.agrupador = AgrupadorSolicitudes(
+            'chat_sentimiento',
+            self._analyze_sentiment_batch,
+            ventana_ms=float(os.getenv('SENTIMIENTO_VENTANA_MS', '0')),
+            max_lote=int(os.getenv('SENTIMIENTO_MAX_LOTE', '10'))
+        )
         
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """
         Analiza el sentimiento del texto usando Azure Language Service
         """
         try:
-            credential = AzureKeyCredential(self.language_key)
-            client = TextAnalyticsClient(
-                endpoint=self.language_endpoint, 
-                credential=credential
-            )
-            
-            response = client.analyze_sentiment(
-                documents=[text],
-                language="es"
-            )
+            return self.agrupador.enviar(text)
             
-            if response and not response[0].is_error:
-                doc = response[0]
-                return {
-                    'sentiment': doc.sentiment,
-                    'confidence_scores': {
-                        'positive': doc.confidence_scores.positive,
-                        'neutral': doc.confidence_scores.neutral,
-                        'negative': doc.confidence_scores.negative
-                    }
-                }
+        except (BackendNoDisponible, PlazoAgotado):
+            # Servicio saturado, circuito abierto o plazo agotado: respuesta degradada sin esperar
+            return {'sentiment': 'neutral', 'degraded': True}
             
+        except Exception as e:
+            if es_error_de_conexion(e):
+                invalidar_cliente('language')
+            logger.warning("Error en análisis de sentimiento: %s", e)
             return {'sentiment': 'neutral'}
+    
+    def _analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Analiza varios mensajes en una sola llamada a Azure Language Service
+        """
+        client = obtener_cliente('language', self.language_endpoint, self.language_key)
+        
+        response = llamar('language', lambda: client.analyze_sentiment(
+            documents=texts,
+            language="es",
+            **opciones_timeout('language')
+        ))
+        
+        return [self._format_sentiment(doc) for doc in response]
+    
+    async def analyze_sentiment_async(self, text: str) -> Dict[str, Any]:
+        """
+        Versión asíncrona de analyze_sentiment para el modo ASGI
+        """
+        from servicio_async import analizar_documentos
+        
+        try:
+            response = await analizar_documentos([text], self.language_endpoint, self.language_key)
+            return self._format_sentiment(response[0])
+            
+        except (BackendNoDisponible, PlazoAgotado):
+            return {'sentiment': 'neutral', 'degraded': True}
             
         except Exception as e:
-            print(f"Error en análisis de sentimiento: {str(e)}")
+            logger.warning("Error en análisis de sentimiento: %s", e)
             return {'sentiment': 'neutral'}
     
-    def generate_response(self, message: str) -> Dict[str, Any]:
+    def _format_sentiment(self, doc) -> Dict[str, Any]:
+        """
+        Convierte un documento de respuesta de Azure al formato del bot
+        """
+        if not doc.is_error:
+            return {
+                'sentiment': doc.sentiment,
+                'confidence_scores': {
+                    'positive': doc.confidence_scores.positive,
+                    'neutral': doc.confidence_scores.neutral,
+                    'negative': doc.confidence_scores.negative
+                }
+            }
+        return {'sentiment': 'neutral'}
+    
+    @property
+    def conversations(self):
+        """
+        Estado por conversación (bienvenida, mensajes, última intención).
+        Se abre con la primera conversación, no al importar el módulo.
+        """
+        return obtener_almacen()
+    
+    def generate_response(self, message: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Genera una respuesta basada en el mensaje del usuario y el estado de su conversación
+        """
+        state = self._load_state(conversation_id)
+        
+        # Si es el primer mensaje de la conversación, mostrar el mensaje de bienvenida
+        if not state.bienvenida:
+            response = self._get_welcome_message()
+        else:
+            response = self._respond(message)
+        
+        return self._save_state(state, response)
+    
+    async def generate_response_async(self, message: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Versión asíncrona de generate_response para el modo ASGI
+        """
+        state = await self._load_state_async(conversation_id)
+        
+        if not state.bienvenida:
+            response = self._get_welcome_message()
+        else:
+            response = await self._respond_async(message)
+        
+        return await self._save_state_async(state, response)
+    
+    def stream_response(self, message: str, conversation_id: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Variante por eventos de generate_response: envía la respuesta en cuanto
+        se conoce y el sentimiento y las sugerencias cuando llegan.
+        
+        Produce tuplas (evento, datos) con los eventos 'escribiendo',
+        'respuesta', 'sentimiento' y 'sugerencias'.
+        """
+        state = self._load_state(conversation_id)
+        
+        if not state.bienvenida:
+            yield from self._split_events(self._save_state(state, self._get_welcome_message()))
+            return
+        
+        match = COMPARADOR_FAQ.buscar(message)
+        if match is not None and self.sentiment_mode != 'always':
+            yield from self._split_events(self._save_state(state, self._faq_streamed(match)))
+            if self.sentiment_mode == 'background':
+                # El sentimiento ya no retrasa la respuesta: se envía a continuación
+                start = time.perf_counter()
+                sentiment = self.analyze_sentiment(message)
+                self._record_background(sentiment, time.perf_counter() - start)
+                yield 'sentimiento', sentiment
+            return
+        
+        # La respuesta depende del sentimiento: avisar al cliente mientras llega
+        yield 'escribiendo', {'conversation_id': state.id}
+        start = time.perf_counter()
+        sentiment = self.analyze_sentiment(message)
+        response = self._build_response(match, sentiment, time.perf_counter() - start)
+        yield from self._split_events(self._save_state(state, response))
+    
+    async def stream_response_async(self, message: str, conversation_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
         """
-        Genera una respuesta basada en el mensaje del usuario
+        Versión asíncrona de stream_response para el modo ASGI
         """
-        # Convertir el mensaje a minúsculas para facilitar la comparación
-        message_lower = message.lower()
+        state = await self._load_state_async(conversation_id)
         
-        # Si es el primer mensaje, mostrar el mensaje de bienvenida
-        if not self._welcome_shown:
-            self._welcome_shown = True
-            return self._get_welcome_message()
+        if not state.bienvenida:
+            for event in self._split_events(await self._save_state_async(state, self._get_welcome_message())):
+                yield event
+            return
+        
+        match = COMPARADOR_FAQ.buscar(message)
+        if match is not None and self.sentiment_mode != 'always':
+            for event in self._split_events(await self._save_state_async(state, self._faq_streamed(match))):
+                yield event
+            if self.sentiment_mode == 'background':
+                start = time.perf_counter()
+                sentiment = await self.analyze_sentiment_async(message)
+                self._record_background(sentiment, time.perf_counter() - start)
+                yield 'sentimiento', sentiment
+            return
+        
+        yield 'escribiendo', {'conversation_id': state.id}
+        start = time.perf_counter()
+        sentiment = await self.analyze_sentiment_async(message)
+        response = self._build_response(match, sentiment, time.perf_counter() - start)
+        for event in self._split_events(await self._save_state_async(state, response)):
+            yield event
+    
+    def _faq_streamed(self, match) -> Dict[str, Any]:
+        path = 'faq_streamed_sentiment' if self.sentiment_mode == 'background' else 'faq'
+        return self._faq_response(match, path)
+    
+    def _split_events(self, response: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Divide una respuesta completa en los eventos del modo streaming
+        """
+        yield 'respuesta', {k: v for k, v in response.items() if k not in ('sentiment', 'suggestions')}
+        if response.get('sentiment'):
+            yield 'sentimiento', response['sentiment']
+        if response.get('suggestions'):
+            yield 'sugerencias', {'suggestions': response['suggestions']}
+    
+    def _load_state(self, conversation_id: Optional[str]) -> EstadoConversacion:
+        if not id_valido(conversation_id):
+            conversation_id = nuevo_id()
+        return self.conversations.obtener(conversation_id)
+    
+    def _save_state(self, state: EstadoConversacion, response: Dict[str, Any]) -> Dict[str, Any]:
+        state.registrar(response.get('intent'), (response.get('sentiment') or {}).get('sentiment'))
+        self.conversations.guardar(state)
+        response['conversation_id'] = state.id
+        return response
+    
+    async def _load_state_async(self, conversation_id: Optional[str]) -> EstadoConversacion:
+        # El almacén SQLite bloquearía el event loop: se usa desde un hilo
+        if not self.conversations.bloqueante:
+            return self._load_state(conversation_id)
+        import asyncio  # solo el modo ASGI usa el event loop
+        return await asyncio.to_thread(self._load_state, conversation_id)
+    
+    async def _save_state_async(self, state: EstadoConversacion, response: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.conversations.bloqueante:
+            return self._save_state(state, response)
+        import asyncio
+        return await asyncio.to_thread(self._save_state, state, response)
+    
+    def _respond(self, message: str) -> Dict[str, Any]:
+        # Las FAQ se buscan primero: su respuesta no depende del sentimiento
+        match = COMPARADOR_FAQ.buscar(message)
+        if match is not None and self.sentiment_mode != 'always':
+            if self.sentiment_mode == 'background':
+                self._background.submit(self._log_background_sentiment, message)
+            return self._faq_response(match)
             
         # Análisis de sentimiento
+        start = time.perf_counter()
         sentiment = self.analyze_sentiment(message)
         
-        # Diccionario de preguntas y respuestas frecuentes
-        faqs = {
-            # Saludos
-            'hola': '¡Hola! Soy tu asistente virtual. ¿En qué puedo ayudarte hoy?',
-            'buenos días': '¡Buenos días! ¿Cómo puedo ayudarte hoy?',
-            'buenas tardes': '¡Buenas tardes! ¿En qué puedo asistirte?',
-            'buenas noches': '¡Buenas noches! ¿En qué te puedo ayudar?',
-            
-            # Preguntas generales
-            'quién eres': 'Soy un asistente virtual diseñado para ayudarte con tus consultas. Estoy aquí para hacerte la vida más fácil.',
-            'qué puedes hacer': 'Puedo ayudarte con información sobre productos, seguimiento de pedidos, asistencia técnica y más. ¿En qué necesitas ayuda?',
-            'ayuda': '¡Claro! Estoy aquí para ayudarte. ¿Necesitas información sobre productos, seguimiento de pedidos o asistencia técnica?',
-            
-            # Información de contacto
-            'contacto': '📧 Email: contacto@innovventas.com\n📞 Teléfono: +1 234 567 890\n🏢 Dirección: Av. Principal 123, Ciudad',
-            'horario': '⏰ Horario de atención:\nLunes a Viernes: 9:00 AM - 6:00 PM\nSábados: 9:00 AM - 1:00 PM',
-            
-            # Productos y servicios
-            'productos': 'Ofrecemos una amplia gama de productos. ¿Te gustaría saber sobre electrónicos, electrodomésticos o tecnología?',
-            'servicios': 'Nuestros servicios incluyen envíos a domicilio, garantía extendida y soporte técnico. ¿Sobre cuál necesitas información?',
-            
-            # Agradecimientos
-            'gracias': '¡De nada! 😊 ¿Hay algo más en lo que pueda ayudarte hoy?',
-            
-            # Despedidas
-            'adiós': '¡Hasta luego! Que tengas un excelente día. 😊',
-            'hasta luego': '¡Hasta pronto! Si tienes más preguntas, aquí estaré para ayudarte.',
-            
-            # Estado de pedidos
-            'seguimiento': 'Para dar seguimiento a tu pedido, necesitaré el número de orden. ¿Lo tienes a la mano?',
-            'pedido': 'Para ayudarte con tu pedido, necesitaré el número de orden. También puedo ayudarte a realizar un nuevo pedido si lo deseas.',
-            
-            # Devoluciones y garantías
-            'devolución': 'Nuestra política de devoluciones permite devoluciones hasta 30 días después de la compra. ¿Necesitas ayuda para iniciar una devolución?',
-            'garantía': 'La mayoría de nuestros productos tienen una garantía de 1 año. ¿Podrías indicarme el producto sobre el que necesitas información de garantía?',
-            
-            # Formas de pago
-            'pago': 'Aceptamos diferentes métodos de pago: tarjetas de crédito/débito, transferencias bancarias y billeteras digitales. ¿Neitas ayuda con algún método en particular?',
-            
-            # Envíos
-            'envío': 'Realizamos envíos a todo el país. El tiempo y costo de envío varían según la ubicación. ¿Podrías indicarme tu código postal?',
-            
-            # Ofertas
-            'oferta': '¡Claro! Actualmente tenemos promociones especiales. ¿Te interesa alguna categoría en particular?',
+        return self._build_response(match, sentiment, time.perf_counter() - start)
+    
+    async def _respond_async(self, message: str) -> Dict[str, Any]:
+        match = COMPARADOR_FAQ.buscar(message)
+        if match is not None and self.sentiment_mode != 'always':
+            if self.sentiment_mode == 'background':
+                import asyncio  # solo el modo ASGI usa el event loop
+                task = asyncio.create_task(self._log_background_sentiment_async(message))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            return self._faq_response(match)
             
-            # Soporte técnico
-            'soporte': 'Para asistencia técnica, por favor describe el problema que estás experimentando y con gusto te ayudaré a resolverlo.',
-            'problema': 'Lamento escuchar que tienes un problema. Por favor, cuéntame más detalles para poder ayudarte mejor.'
+        start = time.perf_counter()
+        sentiment = await self.analyze_sentiment_async(message)
+        
+        return self._build_response(match, sentiment, time.perf_counter() - start)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve cuántos mensajes tomó cada ruta y cuántas llamadas a Azure
+        (y tiempo) se evitaron respondiendo FAQ sin esperar el sentimiento
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            # 'paths' se sigue modificando bajo el lock: se devuelve una copia
+            stats['paths'] = dict(self._stats['paths'])
+        calls = stats['sentiment_calls']
+        stats['sentiment_mode'] = self.sentiment_mode
+        stats['conversations'] = self.conversations.metricas()
+        stats['avg_sentiment_ms'] = round(stats['sentiment_ms'] / calls, 2) if calls else 0.0
+        # Latencia ahorrada estimada: llamadas evitadas x duración media de una llamada
+        stats['estimated_saved_ms'] = round(stats['sentiment_calls_skipped'] * stats['avg_sentiment_ms'], 2)
+        return stats
+    
+    def _count(self, path: str, sentiment_seconds: Optional[float] = None) -> None:
+        with self._stats_lock:
+            self._stats['messages'] += 1
+            self._stats['paths'][path] = self._stats['paths'].get(path, 0) + 1
+            if sentiment_seconds is None:
+                self._stats['sentiment_calls_skipped'] += 1
+            else:
+                self._stats['sentiment_calls'] += 1
+                self._stats['sentiment_ms'] += sentiment_seconds * 1000
+    
+    def _faq_response(self, match, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Respuesta de FAQ sin esperar al análisis de sentimiento
+        """
+        path = path or ('faq_background_sentiment' if self.sentiment_mode == 'background' else 'faq')
+        self._count(path)
+        return {
+            'success': True,
+            'response': match[1],
+            'intent': 'faq',
+            'path': path
         }
+    
+    def _log_background_sentiment(self, message: str) -> None:
+        """
+        Calcula el sentimiento fuera de la respuesta y lo deja en el registro de analítica
+        """
+        start = time.perf_counter()
+        sentiment = self.analyze_sentiment(message)
+        self._record_background(sentiment, time.perf_counter() - start)
+    
+    async def _log_background_sentiment_async(self, message: str) -> None:
+        start = time.perf_counter()
+        sentiment = await self.analyze_sentiment_async(message)
+        self._record_background(sentiment, time.perf_counter() - start)
+    
+    def _record_background(self, sentiment: Dict[str, Any], seconds: float) -> None:
+        with self._stats_lock:
+            self._stats['background_sentiment_calls'] += 1
+        logger.info(
+            "Sentimiento de un mensaje respondido por la FAQ",
+            extra={'analitica': True, 'intent': 'faq', 'sentiment': sentiment.get('sentiment'), 'ms': round(seconds * 1000, 1)}
+        )
+    
+    def _build_response(self, match, sentiment: Dict[str, Any], sentiment_seconds: float) -> Dict[str, Any]:
+        """
+        Elige la respuesta a partir de la FAQ encontrada (si la hay) y del sentimiento
+        """
+        path = 'faq_with_sentiment' if match is not None else 'sentiment'
+        self._count(path, sentiment_seconds)
         
-        # Buscar coincidencias en las preguntas frecuentes
-        for pregunta, respuesta in faqs.items():
-            if pregunta in message_lower:
-                return {
-                    'success': True,
-                    'response': respuesta,
-                    'intent': 'faq',
-                    'sentiment': sentiment
-                }
+        response = self._sentiment_response(match, sentiment)
+        response['path'] = path
+        return response
+    
+    def _sentiment_response(self, match, sentiment: Dict[str, Any]) -> Dict[str, Any]:
+        if match is not None:
+            return {
+                'success': True,
+                'response': match[1],
+                'intent': 'faq',
+                'sentiment': sentiment
+            }
         
         # Si no hay coincidencia, usar la lógica de análisis de sentimiento
         if sentiment.get('sentiment') == 'positive':
@@ -156,45 +414,18 @@ class InnovVentasBot:
             'response': random.choice(default_responses),
             'intent': 'general_inquiry',
             'sentiment': sentiment,
-            'suggestions': [
-                '¿Cómo hago un pedido?',
-                '¿Cuál es el estado de mi envío?',
-                '¿Tienen este producto en stock?',
-                '¿Cuáles son las formas de pago?'
-            ]
+            'suggestions': list(SUGGESTIONS)
         }
     
     def _get_welcome_message(self) -> Dict[str, Any]:
         """
         Devuelve el mensaje de bienvenida con sugerencias
         """
-        welcome_message = """
-¡Hola! 👋 Soy tu asistente virtual de InnovVentas. Estoy aquí para ayudarte con:
-
-📦 **Seguimiento de pedidos**
-💳 **Información de productos**
-❓ **Preguntas frecuentes**
-🛒 **Asistencia en compras**
-
-Por ejemplo, puedes preguntarme:
-• "¿Cómo hago un pedido?"
-• "¿Cuál es el estado de mi envío?"
-• "¿Tienen este producto en stock?"
-• "¿Cuáles son las formas de pago?"
-
-¿En qué puedo ayudarte hoy?
-"""
-        
         return {
             'success': True,
-            'response': welcome_message,
+            'response': WELCOME_MESSAGE,
             'intent': 'welcome',
-            'suggestions': [
-                '¿Cómo hago un pedido?',
-                '¿Cuál es el estado de mi envío?',
-                '¿Tienen este producto en stock?',
-                '¿Cuáles son las formas de pago?'
-            ]
+            'suggestions': list(SUGGESTIONS)
         }
 
 # Instancia global del bot
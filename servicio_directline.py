@@ -0,0 +1,346 @@
+# === SERVICIO 4: DIRECT LINE ===
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import requests
+
+from clientes_azure import obtener_cliente, invalidar_cliente, es_error_de_conexion
+from resiliencia import llamar, timeout_restante
+
+logger = logging.getLogger(__name__)
+
+# URL base de la API de Direct Line
+DIRECTLINE_URL = os.getenv('DIRECTLINE_URL', 'https://directline.botframework.com/v3/directline')
+
+# Configurar orígenes confiables
+TRUSTED_ORIGINS = [
+    'https://sandra-servicio-akenaacucyavbug9.brazilsouth-01.azurewebsites.net',
+    'http://localhost:8000',
+    'http://localhost:5000'
+]
+
+
+def construir_solicitud_token(secreto):
+    """
+    Prepara la petición para generar un token de Direct Line.
+
+    Args:
+        secreto (str): Clave secreta del canal Direct Line
+
+    Returns:
+        tuple: (url, headers, data) de la petición
+    """
+    headers = {
+        'Authorization': f'Bearer {secreto}',
+        'Content-Type': 'application/json'
+    }
+
+    # Filtrar orígenes vacíos o inválidos
+    trusted_origins = [origin for origin in TRUSTED_ORIGINS if origin and origin.strip() != '*']
+
+    data = {
+        'user': {
+            'id': f"user_{os.urandom(8).hex()}",
+            'name': 'Usuario Web'  # Nombre opcional
+        },
+        'trustedOrigins': trusted_origins
+    }
+
+    return f'{DIRECTLINE_URL}/tokens/generate', headers, data
+
+
+def respuesta_token(result):
+    """
+    Construye la respuesta de la API a partir del token devuelto por Direct Line
+    (sin exponer información sensible).
+
+    Args:
+        result (dict): JSON devuelto por Direct Line
+
+    Returns:
+        dict: Datos de la respuesta exitosa
+    """
+    return {
+        'success': True,
+        'token': result.get('token'),
+        'expires_in': result.get('expires_in', 3600),
+        'conversationId': result.get('conversationId'),
+        'streamUrl': result.get('streamUrl'),
+        'hint': 'Token generado correctamente',
+        'debug': {
+            'token_length': len(result.get('token', '')),
+            'expires_in': result.get('expires_in'),
+            'has_conversation_id': 'conversationId' in result
+        }
+    }
+
+
+class GestorTokens:
+    """
+    Intermediario de tokens de Direct Line.
+
+    Guarda el token de cada cliente mientras le quede vida, lo renueva con
+    /tokens/refresh cuando está cerca de caducar, agrupa las peticiones
+    simultáneas de un mismo cliente en una sola llamada a Direct Line y
+    mantiene una reserva de tokens pregenerados para los clientes nuevos.
+
+    Los tokens solo se guardan en la memoria del proceso.
+
+    Variables de entorno:
+        DIRECTLINE_MARGEN_REFRESCO: Segundos de vida restante por debajo de
+            los cuales el token se renueva (por defecto: 900)
+        DIRECTLINE_PREGENERADOS: Tokens nuevos que se mantienen listos para
+            los primeros accesos (por defecto: 2; 0 lo desactiva)
+        DIRECTLINE_MAX_CLIENTES: Clientes cuyo token se recuerda (por
+            defecto: 10000)
+        DIRECTLINE_TIMEOUT: Timeout de las llamadas a Direct Line en segundos
+            (por defecto: 15)
+    """
+
+    def __init__(self):
+        self.margen_refresco = float(os.getenv('DIRECTLINE_MARGEN_REFRESCO', '900'))
+        self.pregenerados = int(os.getenv('DIRECTLINE_PREGENERADOS', '2'))
+        self.max_clientes = int(os.getenv('DIRECTLINE_MAX_CLIENTES', '10000'))
+        self.timeout = float(os.getenv('DIRECTLINE_TIMEOUT', '15'))
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._huella = None
+        # cliente -> (resultado de Direct Line, obtenido, expira)
+        self._tokens = OrderedDict()
+        self._reserva = deque()
+        self._en_vuelo = {}
+        self._hilo = None
+        self._rellenar = threading.Event()
+        self._llamadas = deque()
+        self._contadores = {
+            'peticiones': 0,
+            'aciertos': 0,
+            'agrupadas': 0,
+            'pregenerados_usados': 0,
+            'generate': 0,
+            'refresh': 0,
+            'errores': 0
+        }
+
+    def obtener_token(self, secreto, cliente):
+        """
+        Devuelve un token válido para el cliente.
+
+        Args:
+            secreto (str): Clave secreta del canal Direct Line
+            cliente (str): Id del cliente (conversación del navegador)
+
+        Returns:
+            tuple: (resultado con token, expires_in restante y conversationId,
+                origen: 'cache', 'refresh', 'pregenerado' o 'generate')
+        """
+        if self._pid != os.getpid():
+            self._reiniciar()
+
+        ahora = time.monotonic()
+        with self._lock:
+            self._usar_secreto(secreto)
+            self._contadores['peticiones'] += 1
+            entrada = self._tokens.get(cliente)
+            if entrada is not None and entrada[2] - ahora > self.margen_refresco:
+                self._tokens.move_to_end(cliente)
+                self._contadores['aciertos'] += 1
+                return self._con_vida_restante(entrada, ahora), 'cache'
+
+        self.precalentar(secreto)
+        return self._agrupado(cliente, lambda: self._renovar(secreto, cliente, entrada))
+
+    def _usar_secreto(self, secreto):
+        # Con el lock tomado. Secreto rotado: los tokens anteriores dejan de servir
+        huella = hashlib.sha256(secreto.encode('utf-8')).hexdigest()
+        if huella != self._huella:
+            self._huella = huella
+            self._tokens.clear()
+            self._reserva.clear()
+
+    def _agrupado(self, cliente, funcion):
+        # Solo una llamada a Direct Line en vuelo por cliente: el resto espera su resultado
+        with self._lock:
+            futuro = self._en_vuelo.get(cliente)
+            propio = futuro is None
+            if propio:
+                futuro = self._en_vuelo[cliente] = Future()
+            else:
+                self._contadores['agrupadas'] += 1
+
+        if not propio:
+            return futuro.result(timeout=self.timeout * 2)
+
+        try:
+            futuro.set_result(funcion())
+        except BaseException as e:
+            futuro.set_exception(e)
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(cliente, None)
+        return futuro.result()
+
+    def _renovar(self, secreto, cliente, entrada):
+        ahora = time.monotonic()
+        resultado = origen = None
+
+        if entrada is not None and entrada[2] > ahora:
+            try:
+                resultado, origen = self._llamar('refresh', entrada[0]['token'], None), 'refresh'
+                resultado.setdefault('conversationId', entrada[0].get('conversationId'))
+                resultado.setdefault('streamUrl', entrada[0].get('streamUrl'))
+            except requests.exceptions.RequestException as e:
+                logger.warning("No se pudo renovar el token de Direct Line, se genera uno nuevo: %s", e)
+
+        if resultado is None:
+            resultado, origen = self._de_reserva(), 'pregenerado'
+        if resultado is None:
+            data = construir_solicitud_token(secreto)[2]
+            resultado, origen = self._llamar('generate', secreto, data), 'generate'
+
+        ahora = time.monotonic()
+        entrada = (resultado, ahora, ahora + float(resultado.get('expires_in') or 3600))
+        with self._lock:
+            self._tokens[cliente] = entrada
+            self._tokens.move_to_end(cliente)
+            while len(self._tokens) > self.max_clientes:
+                self._tokens.popitem(last=False)
+        return self._con_vida_restante(entrada, ahora), origen
+
+    def _de_reserva(self):
+        ahora = time.monotonic()
+        with self._lock:
+            while self._reserva:
+                entrada = self._reserva.popleft()
+                if entrada[2] - ahora > self.margen_refresco:
+                    self._contadores['pregenerados_usados'] += 1
+                    self._rellenar.set()
+                    return entrada[0]
+        self._rellenar.set()
+        return None
+
+    def _llamar(self, operacion, credencial, data):
+        sesion = obtener_cliente('directline', DIRECTLINE_URL, 'directline')
+        headers = {
+            'Authorization': f'Bearer {credencial}',
+            'Content-Type': 'application/json'
+        }
+        with self._lock:
+            self._contadores[operacion] += 1
+            ahora = time.monotonic()
+            self._llamadas.append(ahora)
+            # Sin esto crecería sin límite en un worker que nunca sirve /api/estado/directline
+            self._descartar_llamadas(ahora)
+        try:
+            def enviar():
+                respuesta = sesion.post(
+                    f'{DIRECTLINE_URL}/tokens/{operacion}', headers=headers, json=data,
+                    timeout=timeout_restante(self.timeout)
+                )
+                respuesta.raise_for_status()
+                return respuesta
+
+            respuesta = llamar('directline', enviar)
+            resultado = respuesta.json()
+            if not resultado.get('token'):
+                raise requests.exceptions.RequestException(
+                    'La respuesta no contiene un token válido', request=respuesta.request, response=respuesta
+                )
+            return resultado
+        except Exception as e:
+            with self._lock:
+                self._contadores['errores'] += 1
+            if es_error_de_conexion(e):
+                invalidar_cliente('directline')
+            raise
+
+    def precalentar(self, secreto):
+        """
+        Arranca (si no lo está) el hilo que mantiene la reserva de tokens
+        pregenerados, para que los primeros clientes no esperen a Direct Line.
+
+        Args:
+            secreto (str): Clave secreta del canal Direct Line
+        """
+        if self._pid != os.getpid():
+            self._reiniciar()
+        with self._lock:
+            # Si no, el primer obtener_token tomaría el secreto por rotado y vaciaría la reserva
+            self._usar_secreto(secreto)
+            self._secreto = secreto
+        if self.pregenerados <= 0 or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(
+                    target=self._mantener_reserva, name='directline-reserva', daemon=True
+                )
+                self._hilo.start()
+
+    def _mantener_reserva(self):
+        pid = os.getpid()
+        while pid == self._pid:
+            ahora = time.monotonic()
+            with self._lock:
+                while self._reserva and self._reserva[0][2] - ahora <= self.margen_refresco:
+                    self._reserva.popleft()
+                faltan = self.pregenerados - len(self._reserva)
+
+            for _ in range(max(faltan, 0)):
+                try:
+                    data = construir_solicitud_token(self._secreto)[2]
+                    resultado = self._llamar('generate', self._secreto, data)
+                except Exception as e:
+                    logger.warning("No se pudo pregenerar un token de Direct Line: %s", e)
+                    break
+                ahora = time.monotonic()
+                with self._lock:
+                    self._reserva.append((resultado, ahora, ahora + float(resultado.get('expires_in') or 3600)))
+
+            self._rellenar.wait(timeout=60)
+            self._rellenar.clear()
+
+    def _descartar_llamadas(self, ahora):
+        # Solo se guardan las llamadas del último minuto (con el lock tomado)
+        while self._llamadas and self._llamadas[0] < ahora - 60:
+            self._llamadas.popleft()
+
+    def _con_vida_restante(self, entrada, ahora):
+        resultado = dict(entrada[0])
+        resultado['expires_in'] = max(int(entrada[2] - ahora), 0)
+        return resultado
+
+    def metricas(self):
+        """
+        Devuelve las métricas del intermediario en este proceso.
+
+        Returns:
+            dict: Peticiones, aciertos, llamadas a Direct Line (total y último
+                minuto) y edad de los tokens guardados en segundos
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            self._descartar_llamadas(ahora)
+            edades = [ahora - entrada[1] for entrada in self._tokens.values()]
+            metricas = dict(self._contadores)
+            metricas['llamadas_ultimo_minuto'] = len(self._llamadas)
+            metricas['clientes'] = len(self._tokens)
+            metricas['pregenerados_disponibles'] = len(self._reserva)
+
+        metricas['edad_tokens'] = {
+            'minima': round(min(edades), 1) if edades else None,
+            'promedio': round(sum(edades) / len(edades), 1) if edades else None,
+            'maxima': round(max(edades), 1) if edades else None
+        }
+        return metricas
+
+
+gestor_tokens = GestorTokens()
@@ -1,51 +1,22 @@
 # === SERVICIO 1: LANGUAGE SERVICE ===
-from azure.ai.textanalytics import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Cargar variables de entorno de forma robusta
-dotenv_paths = [
-    Path(__file__).parent.absolute() / '.env',  # Mismo directorio que el script
-    Path.cwd() / '.env',  # Directorio de trabajo actual
-    Path.home() / '.env',  # Directorio home del usuario
-]
-
-loaded = False
-for path in dotenv_paths:
-    if path.exists():
-        load_dotenv(path, override=True)
-        loaded = True
-        break
-
-if not loaded:
-    load_dotenv()  # Último intento sin ruta específica
-
-# Mensajes de depuración
-print("\n=== servicio_language.py ===")
-print(f"Directorio actual: {Path.cwd()}")
-print(f"Directorio del script: {Path(__file__).parent.absolute()}")
-print(f"Archivo .env cargado desde: {os.environ.get('DOTENV_PATH', 'No se pudo determinar')}")
-
-# Verificar variables de entorno
-text_analytics_key = os.getenv('TEXT_ANALYTICS_KEY')
-text_analytics_endpoint = os.getenv('TEXT_ANALYTICS_ENDPOINT')
-
-print(f"TEXT_ANALYTICS_KEY: {'Configurada' if text_analytics_key else 'No configurada'}")
-print(f"TEXT_ANALYTICS_ENDPOINT: {'Configurado' if text_analytics_endpoint else 'No configurado'}")
-
-if not text_analytics_key or not text_analytics_endpoint:
-    print("\n⚠️ ADVERTENCIA: No se encontraron las variables de entorno necesarias")
-    print("Por favor, asegúrate de que el archivo .env existe y contiene las siguientes variables:")
-    print("TEXT_ANALYTICS_KEY=tu_clave_aquí")
-    print("TEXT_ANALYTICS_ENDPOINT=tu_endpoint_aquí")
+from concurrent.futures import ThreadPoolExecutor
+
+from configuracion import cargar_entorno
+from clientes_azure import obtener_cliente, invalidar_cliente, es_error_de_conexion
+from agrupador import AgrupadorSolicitudes
+from cache_resultados import obtener_cache, clave_cache, normalizar_texto
+from resiliencia import llamar, opciones_timeout, plazo, vencimiento
+
+cargar_entorno()
 
 # Conexión al servicio
 def conectar_language():
     """
     Conecta al servicio de Azure Text Analytics.
     
+    El cliente se comparte entre peticiones e hilos del mismo proceso.
+    
     Returns:
         TextAnalyticsClient: Cliente de Azure Text Analytics
     """
@@ -55,7 +26,52 @@ def conectar_language():
     if not key or not endpoint:
         raise ValueError("TEXT_ANALYTICS_KEY o TEXT_ANALYTICS_ENDPOINT no están configuradas en las variables de entorno")
         
-    return TextAnalyticsClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+    return obtener_cliente('language', endpoint, key)
+
+# Límites del servicio por llamada a analyze_sentiment
+MAX_DOCUMENTOS_POR_LLAMADA = 10
+MAX_CARACTERES_POR_LLAMADA = 125000
+
+# Llamadas simultáneas a Azure para un mismo lote
+LOTE_CONCURRENCIA = int(os.getenv('SENTIMIENTO_LOTE_CONCURRENCIA', '4'))
+
+
+def _resultado_entrada_invalida():
+    return {
+        'sentimiento': 'neutral',
+        'puntuaciones': {
+            'positivo': 0.0,
+            'neutral': 1.0,
+            'negativo': 0.0
+        },
+        'error': 'Texto de entrada no válido'
+    }
+
+
+def _es_texto_valido(texto):
+    return bool(texto) and isinstance(texto, str) and bool(texto.strip())
+
+
+def _clave_sentimiento(texto):
+    return clave_cache('sentimiento', normalizar_texto(texto), 'es')
+
+
+def _formatear_documento(doc):
+    """Convierte un documento de respuesta de Azure al formato de la API"""
+    if doc is not None and not doc.is_error:
+        return {
+            'sentimiento': doc.sentiment,
+            'puntuaciones': {
+                'positivo': doc.confidence_scores.positive,
+                'neutral': doc.confidence_scores.neutral,
+                'negativo': doc.confidence_scores.negative
+            }
+        }
+    return {
+        'sentimiento': 'error',
+        'error': f"Error al analizar el texto: {doc.error if doc is not None and hasattr(doc, 'error') else 'Respuesta inválida'}"
+    }
+
 
 # Función para analizar texto
 def analizar_sentimiento(texto):
@@ -69,44 +85,154 @@ def analizar_sentimiento(texto):
         dict: Diccionario con los resultados del análisis de sentimiento
     """
     try:
-        if not texto or not isinstance(texto, str) or not texto.strip():
-            return {
-                'sentimiento': 'neutral',
-                'puntuaciones': {
-                    'positivo': 0.0,
-                    'neutral': 1.0,
-                    'negativo': 0.0
-                },
-                'error': 'Texto de entrada no válido'
-            }
+        if not _es_texto_valido(texto):
+            return _resultado_entrada_invalida()
             
-        client = conectar_language()
-        
-        # Analizar sentimiento
-        response = client.analyze_sentiment(
-            documents=[texto],
-            language="es"
-        )
-        
-        # Procesar resultados
-        if response and not response[0].is_error:
-            doc = response[0]
-            return {
-                'sentimiento': doc.sentiment,
-                'puntuaciones': {
-                    'positivo': doc.confidence_scores.positive,
-                    'neutral': doc.confidence_scores.neutral,
-                    'negativo': doc.confidence_scores.negative
-                }
-            }
-        else:
-            return {
-                'sentimiento': 'error',
-                'error': f"Error al analizar el texto: {response[0].error if response and hasattr(response[0], 'error') else 'Respuesta inválida'}"
-            }
+        cache = obtener_cache()
+        clave = _clave_sentimiento(texto)
+        resultado = cache.obtener('sentimiento', clave)
+        if resultado is not None:
+            return resultado
+            
+        # Las llamadas concurrentes se agrupan en una sola petición a Azure
+        resultado = _agrupador.enviar(texto)
+        if resultado.get('sentimiento') != 'error':
+            cache.guardar('sentimiento', clave, resultado)
+        return resultado
             
     except Exception as e:
+        if es_error_de_conexion(e):
+            invalidar_cliente('language')
         return {
             'sentimiento': 'error',
             'error': f"Error inesperado: {str(e)}"
         }
+
+
+def _dividir_en_lotes(pendientes):
+    """
+    Agrupa pares (índice, texto) en lotes que respetan los límites por llamada.
+    """
+    lotes = []
+    actual = []
+    caracteres = 0
+
+    for indice, texto in pendientes:
+        if actual and (len(actual) >= MAX_DOCUMENTOS_POR_LLAMADA or
+                       caracteres + len(texto) > MAX_CARACTERES_POR_LLAMADA):
+            lotes.append(actual)
+            actual = []
+            caracteres = 0
+        actual.append((indice, texto))
+        caracteres += len(texto)
+
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def _analizar_lote(client, lote, lanzar_errores=False):
+    """Analiza un lote en una sola llamada y devuelve pares (índice, resultado)"""
+    try:
+        response = llamar('language', lambda: client.analyze_sentiment(
+            documents=[texto for _, texto in lote],
+            language="es",
+            **opciones_timeout('language')
+        ))
+        documentos = list(response or [])
+        # Si faltan documentos en la respuesta, esos textos llevan su propio error
+        documentos += [None] * (len(lote) - len(documentos))
+        return [(indice, _formatear_documento(doc)) for (indice, _), doc in zip(lote, documentos)]
+    except Exception as e:
+        if es_error_de_conexion(e):
+            invalidar_cliente('language')
+        if lanzar_errores:
+            raise
+        error = {
+            'sentimiento': 'error',
+            'error': f"Error inesperado: {str(e)}"
+        }
+        return [(indice, dict(error)) for indice, _ in lote]
+
+
+def _analizar_textos(textos):
+    """Analiza una lista de textos válidos en una sola llamada a Azure"""
+    try:
+        client = conectar_language()
+    except Exception as e:
+        return [{'sentimiento': 'error', 'error': f"Error inesperado: {str(e)}"} for _ in textos]
+    return [resultado for _, resultado in _analizar_lote(client, list(enumerate(textos)))]
+
+
+# Agrupa llamadas individuales concurrentes (desactivado con ventana 0)
+_agrupador = AgrupadorSolicitudes(
+    'sentimiento',
+    _analizar_textos,
+    ventana_ms=float(os.getenv('SENTIMIENTO_VENTANA_MS', '0')),
+    max_lote=int(os.getenv('SENTIMIENTO_MAX_LOTE', str(MAX_DOCUMENTOS_POR_LLAMADA)))
+)
+
+
+def analizar_sentimiento_lote(textos, lanzar_errores=False):
+    """
+    Analiza el sentimiento de varios textos agrupándolos en el menor número
+    de llamadas a Azure Text Analytics. Los lotes se envían en paralelo.
+    
+    Args:
+        textos (list[str]): Textos a analizar
+        lanzar_errores (bool): Si es True, un fallo de una llamada entera
+            (sin cliente, Azure no disponible, plazo agotado) se lanza en vez
+            de copiarse en cada texto de esa llamada
+        
+    Returns:
+        list[dict]: Un resultado por texto, en el mismo orden de entrada. Los
+        textos que fallan llevan 'sentimiento': 'error' y un mensaje en 'error'
+
+    Raises:
+        Exception: El error de la llamada que falló, solo con `lanzar_errores`
+    """
+    resultados = [None] * len(textos)
+    pendientes = []
+    claves = {}
+    cache = obtener_cache()
+
+    for indice, texto in enumerate(textos):
+        if not _es_texto_valido(texto):
+            resultados[indice] = _resultado_entrada_invalida()
+            continue
+        claves[indice] = _clave_sentimiento(texto)
+        resultados[indice] = cache.obtener('sentimiento', claves[indice])
+        if resultados[indice] is None:
+            pendientes.append((indice, texto))
+
+    if not pendientes:
+        return resultados
+
+    try:
+        client = conectar_language()
+    except Exception as e:
+        if lanzar_errores:
+            raise
+        for indice, _ in pendientes:
+            resultados[indice] = {
+                'sentimiento': 'error',
+                'error': f"Error inesperado: {str(e)}"
+            }
+        return resultados
+
+    lotes = _dividir_en_lotes(pendientes)
+    hasta = vencimiento()
+
+    def analizar(lote):
+        # Los hilos del executor no heredan el plazo de la petición
+        with plazo(hasta=hasta):
+            return _analizar_lote(client, lote, lanzar_errores)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LOTE_CONCURRENCIA, len(lotes)))) as executor:
+        for parciales in executor.map(analizar, lotes):
+            for indice, resultado in parciales:
+                resultados[indice] = resultado
+                if resultado.get('sentimiento') != 'error':
+                    cache.guardar('sentimiento', claves[indice], resultado)
+
+    return resultados
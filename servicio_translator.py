@@ -1,35 +1,38 @@
-from azure.ai.translation.text import TextTranslationClient
-from azure.core.credentials import AzureKeyCredential
 import os
-from pathlib import Path
-from dotenv import load_dotenv
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
-# Obtener la ruta absoluta del directorio actual
-current_dir = Path(__file__).parent.absolute()
-dotenv_path = current_dir / '.env'
+from configuracion import cargar_entorno
+from clientes_azure import obtener_cliente, invalidar_cliente, es_error_de_conexion
+from cache_resultados import obtener_cache, clave_cache, normalizar_texto
+from resiliencia import llamar, opciones_timeout, plazo, vencimiento
 
-# Cargar variables de entorno
-load_dotenv(dotenv_path=dotenv_path, override=True)
-
-# Mensajes de depuración
-print("\n=== servicio_translator.py ===")
-print(f"Directorio actual: {current_dir}")
-print(f"Ruta del archivo .env: {dotenv_path}")
-print(f"¿Existe .env? {dotenv_path.exists()}")
-print(f"TRANSLATOR_KEY: {'Configurada' if os.getenv('TRANSLATOR_KEY') else 'No configurada'}")
-print(f"TRANSLATOR_ENDPOINT: {'Configurado' if os.getenv('TRANSLATOR_ENDPOINT') else 'No configurado'}")
-print(f"TRANSLATOR_REGION: {'Configurada' if os.getenv('TRANSLATOR_REGION') else 'No configurada'}")
+cargar_entorno()
+logger = logging.getLogger(__name__)
 
 def get_translation_client():
-    """Crea y retorna un cliente de Azure Translator"""
+    """Retorna el cliente de Azure Translator compartido por el proceso"""
     key = os.getenv('TRANSLATOR_KEY')
     endpoint = os.getenv('TRANSLATOR_ENDPOINT')
     
     if not key or not endpoint:
         raise ValueError("Las credenciales de Azure Translator no están configuradas correctamente.")
     
-    credential = AzureKeyCredential(key)
-    return TextTranslationClient(endpoint=endpoint, credential=credential)
+    return obtener_cliente('translator', endpoint, key)
+
+# Límites del servicio por llamada a translate. El límite de caracteres
+# cuenta el texto una vez por cada idioma de destino.
+MAX_ELEMENTOS_POR_LLAMADA = 1000
+MAX_CARACTERES_POR_LLAMADA = 50000
+
+# Llamadas simultáneas a Azure para un mismo lote
+LOTE_CONCURRENCIA = int(os.getenv('TRADUCCION_LOTE_CONCURRENCIA', '4'))
+
+
+def _elemento(texto):
+    from azure.ai.translation.text.models import InputTextItem
+    return InputTextItem(text=texto)
+
 
 def traducir_texto(texto, idioma_destino="en"):
     """
@@ -47,21 +50,177 @@ def traducir_texto(texto, idioma_destino="en"):
         if not texto or not isinstance(texto, str) or not texto.strip():
             return ""
 
+        cache = obtener_cache()
+        clave = clave_cache('traduccion', normalizar_texto(texto, conservar_formato=True), idioma_destino)
+        traduccion = cache.obtener('traduccion', clave)
+        if traduccion is not None:
+            return traduccion
+
         # Obtener cliente de traducción
         client = get_translation_client()
         
         # Realizar la traducción
-        response = client.translate(
-            content=[texto],
-            to=[idioma_destino]
-        )
+        response = llamar('translator', lambda: client.translate(
+            content=[_elemento(texto)],
+            to=[idioma_destino],
+            **opciones_timeout('translator')
+        ))
         
         # Procesar la respuesta
         if response and len(response) > 0 and hasattr(response[0], 'translations'):
-            return response[0].translations[0].text
+            traduccion = response[0].translations[0].text
+            cache.guardar('traduccion', clave, traduccion)
+            return traduccion
         else:
             return "No se pudo obtener la traducción. Respuesta inesperada del servicio."
             
     except Exception as e:
-        print(f"Error en la traducción: {str(e)}")
+        if es_error_de_conexion(e):
+            invalidar_cliente('translator')
+        logger.warning("Error en la traducción: %s", e)
         return f"Error al traducir el texto: {str(e)}"
+
+
+def _dividir_en_lotes(pendientes, num_idiomas):
+    """
+    Agrupa pares (índice, texto) en lotes que respetan los límites por llamada.
+    """
+    lotes = []
+    actual = []
+    caracteres = 0
+
+    for indice, texto in pendientes:
+        costo = len(texto) * num_idiomas
+        if actual and (len(actual) >= MAX_ELEMENTOS_POR_LLAMADA or
+                       caracteres + costo > MAX_CARACTERES_POR_LLAMADA):
+            lotes.append(actual)
+            actual = []
+            caracteres = 0
+        actual.append((indice, texto))
+        caracteres += costo
+
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def _traducir_lote(client, lote, idiomas, lanzar_errores=False):
+    """
+    Traduce un lote a todos los idiomas en una sola llamada.
+
+    Returns:
+        list: Pares (índice, {idioma: celda}) con la traducción o el error de cada celda
+    """
+    try:
+        response = llamar('translator', lambda: client.translate(
+            content=[_elemento(texto) for _, texto in lote],
+            to=list(idiomas),
+            **opciones_timeout('translator')
+        ))
+    except Exception as e:
+        if es_error_de_conexion(e):
+            invalidar_cliente('translator')
+        logger.warning("Error en la traducción: %s", e)
+        if lanzar_errores:
+            raise
+        error = {'error': f"Error al traducir el texto: {str(e)}"}
+        return [(indice, {idioma: dict(error) for idioma in idiomas}) for indice, _ in lote]
+
+    resultados = []
+    for posicion, (indice, _) in enumerate(lote):
+        item = response[posicion] if response is not None and posicion < len(response) else None
+        # Azure normaliza el código devuelto en 'to' ("EN", "zh-Hans"), así que
+        # las traducciones se asocian por posición: llegan en el orden de 'to'
+        traducciones = {
+            idioma: traduccion.text
+            for idioma, traduccion in zip(idiomas, getattr(item, 'translations', None) or [])
+        }
+        celdas = {}
+        for idioma in idiomas:
+            if idioma in traducciones:
+                celdas[idioma] = {'traduccion': traducciones[idioma]}
+            else:
+                celdas[idioma] = {'error': 'El servicio no devolvió la traducción para este idioma'}
+        resultados.append((indice, celdas))
+    return resultados
+
+
+def traducir_textos(textos, idiomas, lanzar_errores=False):
+    """
+    Traduce varios textos a varios idiomas con el menor número de llamadas
+    a Azure Translator. Los lotes se envían en paralelo.
+    
+    Args:
+        textos (list[str]): Textos a traducir
+        idiomas (list[str]): Códigos de idioma de destino
+        lanzar_errores (bool): Si es True, un fallo de una llamada entera
+            (sin cliente, Azure no disponible, plazo agotado) se lanza en vez
+            de copiarse en cada celda de esa llamada
+        
+    Returns:
+        list[dict]: Una fila por texto, en el orden de entrada, con una celda
+        por idioma: {'traduccion': str} o {'error': str}
+
+    Raises:
+        Exception: El error de la llamada que falló, solo con `lanzar_errores`
+    """
+    idiomas = list(dict.fromkeys(idiomas))
+    cache = obtener_cache()
+    matriz = [dict() for _ in textos]
+
+    # Agrupar los textos según los idiomas que faltan en caché
+    faltantes = {}
+    for indice, texto in enumerate(textos):
+        if not texto or not isinstance(texto, str) or not texto.strip():
+            for idioma in idiomas:
+                matriz[indice][idioma] = {'error': 'Texto de entrada no válido'}
+            continue
+
+        normalizado = normalizar_texto(texto, conservar_formato=True)
+        pendientes = []
+        for idioma in idiomas:
+            traduccion = cache.obtener('traduccion', clave_cache('traduccion', normalizado, idioma))
+            if traduccion is not None:
+                matriz[indice][idioma] = {'traduccion': traduccion}
+            else:
+                pendientes.append(idioma)
+        if pendientes:
+            faltantes.setdefault(tuple(pendientes), []).append((indice, texto))
+
+    if not faltantes:
+        return matriz
+
+    try:
+        client = get_translation_client()
+    except Exception as e:
+        if lanzar_errores:
+            raise
+        for grupo_idiomas, pendientes in faltantes.items():
+            for indice, _ in pendientes:
+                for idioma in grupo_idiomas:
+                    matriz[indice][idioma] = {'error': f"Error al traducir el texto: {str(e)}"}
+        return matriz
+
+    tareas = [
+        (lote, grupo_idiomas)
+        for grupo_idiomas, pendientes in faltantes.items()
+        for lote in _dividir_en_lotes(pendientes, len(grupo_idiomas))
+    ]
+
+    hasta = vencimiento()
+
+    def traducir(tarea):
+        # Los hilos del executor no heredan el plazo de la petición
+        with plazo(hasta=hasta):
+            return _traducir_lote(client, *tarea, lanzar_errores)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LOTE_CONCURRENCIA, len(tareas)))) as executor:
+        for parciales in executor.map(traducir, tareas):
+            for indice, celdas in parciales:
+                normalizado = normalizar_texto(textos[indice], conservar_formato=True)
+                for idioma, celda in celdas.items():
+                    matriz[indice][idioma] = celda
+                    if 'traduccion' in celda:
+                        cache.guardar('traduccion', clave_cache('traduccion', normalizado, idioma), celda['traduccion'])
+
+    return matriz
@@ -1,31 +1,29 @@
 # === SERVICIO 3: COMPUTER VISION ===
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from azure.cognitiveservices.vision.computervision.models import VisualFeatureTypes
-from msrest.authentication import CognitiveServicesCredentials
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-from typing import Union, BinaryIO
+import io
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Union, BinaryIO
 
-# Obtener la ruta absoluta del directorio actual
-current_dir = Path(__file__).parent.absolute()
-dotenv_path = current_dir / '.env'
+from configuracion import cargar_entorno
+from clientes_azure import obtener_cliente, invalidar_cliente, es_error_de_conexion
+from cache_resultados import obtener_cache, clave_cache, hash_bytes
+from resiliencia import llamar, opciones_timeout, plazo, BackendNoDisponible, PlazoAgotado
+from metricas import fase
+from subidas import vista_en_memoria, FlujoContado
+from preprocesado_imagen import preparar_imagen, configuracion as configuracion_preprocesado
 
-# Cargar variables de entorno
-load_dotenv(dotenv_path=dotenv_path, override=True)
-
-# Mensajes de depuración
-print("\n=== servicio_vision.py ===")
-print(f"Directorio actual: {current_dir}")
-print(f"Ruta del archivo .env: {dotenv_path}")
-print(f"¿Existe .env? {dotenv_path.exists()}")
-print(f"VISION_KEY: {'Configurada' if os.getenv('VISION_KEY') else 'No configurada'}")
-print(f"VISION_ENDPOINT: {'Configurado' if os.getenv('VISION_ENDPOINT') else 'No configurado'}")
+cargar_entorno()
+logger = logging.getLogger(__name__)
 
 def conectar_vision():
     """
     Conecta al servicio de Azure Computer Vision.
     
+    El cliente se comparte entre peticiones e hilos del mismo proceso.
+    
     Returns:
         ComputerVisionClient: Cliente de Azure Computer Vision
     """
@@ -35,14 +33,34 @@ def conectar_vision():
     if not key or not endpoint:
         raise ValueError("VISION_KEY o VISION_ENDPOINT no están configurados")
     
-    return ComputerVisionClient(endpoint, CognitiveServicesCredentials(key))
+    return obtener_cliente('vision', endpoint, key)
+
+def _hash_flujo(flujo):
+    """
+    Calcula el hash del contenido de un flujo. Si está en memoria se usa una
+    vista sin copia; si no, se lee por bloques.
+    """
+    vista = vista_en_memoria(flujo)
+    if vista is not None:
+        with vista:
+            return hash_bytes(vista)
+    
+    if hasattr(flujo, 'seek'):
+        flujo.seek(0)
+    resumen = hashlib.sha256()
+    for bloque in iter(lambda: flujo.read(64 * 1024), b''):
+        resumen.update(bloque)
+    return resumen.hexdigest()
 
-def describir_imagen(imagen: Union[str, BinaryIO]):
+def describir_imagen(imagen: Union[str, bytes, BinaryIO], detalles: Optional[dict] = None):
     """
     Describe una imagen utilizando Azure Computer Vision.
     
     Args:
         imagen: Puede ser una ruta de archivo local, un objeto de archivo o bytes
+        detalles (dict): Si se indica, se rellena con los datos del preprocesado,
+            los bytes enviados a Azure en 'bytes_leidos' (todos los intentos) y,
+            si la llamada falla, con el mensaje en 'error'
         
     Returns:
         str: Descripción de la imagen o mensaje de error
@@ -58,32 +76,151 @@ def describir_imagen(imagen: Union[str, BinaryIO]):
             if os.path.isfile(imagen):
                 # Es un archivo local
                 with open(imagen, 'rb') as img:
-                    imagen_bytes = img.read()
+                    flujo = io.BytesIO(img.read())
             else:
                 # Es una URL
                 return "El análisis por URL no está soportado actualmente. Por favor, sube un archivo de imagen."
-        # Si es un objeto de archivo o similar
+        elif isinstance(imagen, (bytes, bytearray)):
+            flujo = io.BytesIO(imagen)
+        # Si es un objeto de archivo o similar se envía tal cual, sin copiarlo
         elif hasattr(imagen, 'read'):
-            if hasattr(imagen, 'seek'):
-                imagen.seek(0)  # Asegurarse de que estamos al inicio del archivo
-            imagen_bytes = imagen.read()
+            flujo = imagen
         else:
             return "Tipo de imagen no soportado"
         
-        # Analizar la imagen desde bytes
-        resultado = cliente.describe_image_in_stream(
-            image=imagen_bytes,
-            max_candidates=1,  # Número de descripciones a devolver
-            language="es"      # Idioma de la descripción
+        max_candidates = 1  # Número de descripciones a devolver
+        idioma = "es"       # Idioma de la descripción
+        
+        config = configuracion_preprocesado()
+        
+        cache = obtener_cache()
+        clave = clave_cache(
+            'vision', _hash_flujo(flujo), max_candidates, idioma,
+            config['activo'] and [config['lado_max'], config['formato'], config['calidad']]
         )
+        descripcion = cache.obtener('vision', clave)
+        if descripcion is not None:
+            return descripcion
+        
+        # Reducir y recomprimir la imagen antes de subirla
+        with fase('preprocesado'):
+            flujo, info = preparar_imagen(flujo, config)
+        if detalles is not None:
+            detalles.update(info)
+        
+        # Analizar la imagen; el SDK lee el flujo por bloques al enviarlo.
+        # Solo se cuentan los bytes que salen hacia Azure, no las lecturas
+        # del hash ni del preprocesado
+        enviado = FlujoContado(flujo)
+
+        def describir():
+            # Cada intento vuelve a enviar la imagen desde el principio
+            enviado.seek(0)
+            return cliente.describe_image_in_stream(
+                image=enviado,
+                max_candidates=max_candidates,
+                language=idioma,
+                **opciones_timeout('vision')
+            )
+
+        try:
+            resultado = llamar('vision', describir)
+        finally:
+            if detalles is not None:
+                detalles['bytes_leidos'] = enviado.bytes_leidos
         
         # Obtener la mejor descripción
         if resultado.captions and len(resultado.captions) > 0:
-            return resultado.captions[0].text
+            descripcion = resultado.captions[0].text
+            cache.guardar('vision', clave, descripcion)
+            return descripcion
         else:
             return "No se pudo generar una descripción para la imagen"
             
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        if es_error_de_conexion(e):
+            invalidar_cliente('vision')
+        if isinstance(e, (BackendNoDisponible, PlazoAgotado)) or es_error_de_conexion(e):
+            # Errores de disponibilidad esperables: sin traceback
+            logger.warning("Error al analizar la imagen: %s", e)
+        else:
+            logger.exception("Error al analizar la imagen")
+        if detalles is not None:
+            detalles['error'] = str(e)
         return f"Error al analizar la imagen: {str(e)}"
+
+
+def describir_imagenes(imagenes, concurrencia=4, timeout=30):
+    """
+    Describe varias imágenes en paralelo con un número acotado de hilos y
+    devuelve cada resultado en cuanto termina.
+    
+    Solo se leen (y se mantienen en memoria) las imágenes en vuelo: se
+    encolan como mucho `2 * concurrencia` a la vez.
+    
+    Args:
+        imagenes: Iterable de pares (nombre, función que devuelve el flujo)
+        concurrencia (int): Imágenes analizadas a la vez
+        timeout (float): Segundos máximos de análisis por imagen
+        
+    Yields:
+        dict: Resultado de cada imagen con su índice de entrada
+    """
+    def analizar(indice, nombre, abrir):
+        inicios[indice] = time.monotonic()
+        detalles = {}
+        # El timeout de cada imagen es también el plazo de sus reintentos
+        with plazo(timeout):
+            descripcion = describir_imagen(abrir(), detalles=detalles)
+        resultado = {
+            'indice': indice,
+            'nombre_archivo': nombre,
+            'ms': round((time.monotonic() - inicios[indice]) * 1000, 2)
+        }
+        if 'error' in detalles:
+            resultado.update({'estado': 'error', 'mensaje': descripcion})
+        else:
+            resultado.update({'estado': 'éxito', 'descripcion': descripcion})
+        return resultado
+    
+    inicios = {}
+    en_vuelo = {}
+    pendientes = iter(enumerate(imagenes))
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix='vision-lote')
+    
+    def encolar():
+        while len(en_vuelo) < 2 * max(1, concurrencia):
+            siguiente = next(pendientes, None)
+            if siguiente is None:
+                return
+            indice, (nombre, abrir) = siguiente
+            en_vuelo[executor.submit(analizar, indice, nombre, abrir)] = (indice, nombre)
+    
+    try:
+        encolar()
+        while en_vuelo:
+            # Esperar como mucho hasta que venza la imagen en curso más antigua
+            ahora = time.monotonic()
+            limites = [inicios[indice] + timeout for indice, _ in en_vuelo.values() if indice in inicios]
+            espera = max(0.0, min(limites) - ahora) if limites else timeout
+            listos, _ = wait(list(en_vuelo), timeout=espera, return_when=FIRST_COMPLETED)
+            
+            for futuro in listos:
+                indice, nombre = en_vuelo.pop(futuro)
+                try:
+                    yield futuro.result()
+                except Exception as e:
+                    yield {'indice': indice, 'nombre_archivo': nombre, 'estado': 'error',
+                           'mensaje': f"Error al analizar la imagen: {str(e)}"}
+            
+            ahora = time.monotonic()
+            for futuro, (indice, nombre) in list(en_vuelo.items()):
+                if indice in inicios and ahora - inicios[indice] >= timeout and not futuro.done():
+                    # El hilo no se puede interrumpir: su resultado se descarta
+                    del en_vuelo[futuro]
+                    yield {'indice': indice, 'nombre_archivo': nombre, 'estado': 'error',
+                           'mensaje': f'Se superó el tiempo máximo de análisis ({timeout} s)'}
+            
+            encolar()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
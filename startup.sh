@@ -1,17 +1,12 @@
 #!/bin/bash
 
-# Este archivo inicia la aplicación Flask usando Gunicorn
+# Este archivo inicia la aplicación usando Gunicorn
 # Configura el puerto para Azure App Service
 export PORT=8000
 
 # Crea la carpeta de sesiones si no existe
 mkdir -p sessions
 
-# Inicia la aplicación con Gunicorn
-exec gunicorn --bind=0.0.0.0:$PORT \
-              --timeout 600 \
-              --workers 4 \
-              --threads 2 \
-              --access-logfile - \
-              --error-logfile - \
-              main:app
+# La configuración (workers, preload_app, hooks de fork) está en gunicorn.conf.py.
+# APP_MODO=asgi sirve la versión asíncrona (main_async.py) con workers de uvicorn
+exec gunicorn -c gunicorn.conf.py
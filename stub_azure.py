@@ -0,0 +1,314 @@
+# === SERVIDOR AZURE SIMULADO ===
+"""
+Servidor local que imita las APIs de Azure que usa la aplicación, para
+medir su rendimiento sin llamar (ni pagar) a los servicios reales.
+
+    Language     POST /language/:analyze-text  (analyze_sentiment)
+    Translator   POST /translate               (translate)
+    Vision       POST /vision/v3.2/describe    (describe_image_in_stream)
+    Direct Line  POST /v3/directline/tokens/generate y /tokens/refresh
+
+Las respuestas tienen la forma que esperan los SDK. A cada llamada se le
+puede añadir latencia (fija más un jitter aleatorio) y una fracción de
+respuestas 429 (con Retry-After) o 500. Con --tps cada servicio responde
+429, como Azure, a las llamadas que superan esa cuota por segundo.
+
+Uso:
+    python stub_azure.py --puerto 3980 --latencia-ms 80 --jitter-ms 40 --tasa-429 0.05
+    TEXT_ANALYTICS_ENDPOINT=http://127.0.0.1:3980 LANGUAGE_ENDPOINT=http://127.0.0.1:3980 \\
+    TRANSLATOR_ENDPOINT=http://127.0.0.1:3980 VISION_ENDPOINT=http://127.0.0.1:3980 \\
+    DIRECTLINE_URL=http://127.0.0.1:3980/v3/directline python main.py
+
+Endpoints de control:
+    GET  /estadisticas   Llamadas, 429 y errores por servicio
+    POST /configuracion  Cambia latencia y tasas sin reiniciar, p. ej.
+                         {"latencia_ms": 200, "tasa_429": 0.1}
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from stub_directline import EstadoSimulado, atender_token
+
+SERVICIOS = ('language', 'translator', 'vision', 'directline')
+
+# Palabras con las que el sentimiento simulado deja de ser neutral
+_POSITIVAS = ('encanta', 'genial', 'bien', 'gracias', 'excelente', 'love', 'great', 'good')
+_NEGATIVAS = ('odio', 'mal', 'terrible', 'horrible', 'problema', 'hate', 'bad', 'awful')
+
+
+class EstadoAzure:
+    """
+    Configuración de fallos y contadores del servidor simulado.
+
+    Args:
+        latencia_ms (float): Retardo fijo de cada respuesta
+        jitter_ms (float): Retardo adicional aleatorio entre 0 y este valor
+        tasa_error (float): Fracción de llamadas que responden 500
+        tasa_429 (float): Fracción de llamadas que responden 429
+        retry_after (float): Segundos indicados en Retry-After con los 429
+        tps (float): Cuota de llamadas por segundo de cada servicio; 0 sin cuota
+    """
+
+    def __init__(self, latencia_ms=0, jitter_ms=0, tasa_error=0.0, tasa_429=0.0, retry_after=1, tps=0):
+        self.lock = threading.Lock()
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.tasa_429 = tasa_429
+        self.retry_after = retry_after
+        self.tps = tps
+        # servicio -> (llamadas en el segundo actual, segundo)
+        self._ventanas = {}
+        self.directline = EstadoSimulado()
+        self.llamadas = {servicio: {'llamadas': 0, '429': 0, 'errores': 0, 'elementos': 0} for servicio in SERVICIOS}
+
+    def configurar(self, **valores):
+        with self.lock:
+            for clave in ('latencia_ms', 'jitter_ms', 'tasa_error', 'tasa_429', 'retry_after', 'tps'):
+                if clave in valores:
+                    setattr(self, clave, float(valores[clave]))
+            return self.configuracion()
+
+    def configuracion(self):
+        return {
+            'latencia_ms': self.latencia_ms,
+            'jitter_ms': self.jitter_ms,
+            'tasa_error': self.tasa_error,
+            'tasa_429': self.tasa_429,
+            'retry_after': self.retry_after,
+            'tps': self.tps,
+        }
+
+    def estadisticas(self):
+        with self.lock:
+            return {servicio: dict(contadores) for servicio, contadores in self.llamadas.items()}
+
+    def registrar(self, servicio, clave, cantidad=1):
+        with self.lock:
+            self.llamadas[servicio][clave] += cantidad
+
+    def fallo(self, servicio):
+        """Decide si la llamada falla por cuota o por sorteo: devuelve 429, 500 o None"""
+        if self.tps:
+            segundo = int(time.time())
+            with self.lock:
+                llamadas, actual = self._ventanas.get(servicio, (0, segundo))
+                llamadas = llamadas + 1 if actual == segundo else 1
+                self._ventanas[servicio] = (llamadas, segundo)
+            if llamadas > self.tps:
+                return 429
+        azar = random.random()
+        if azar < self.tasa_429:
+            return 429
+        if azar < self.tasa_429 + self.tasa_error:
+            return 500
+        return None
+
+    def esperar(self):
+        retardo = self.latencia_ms + random.uniform(0, self.jitter_ms)
+        if retardo > 0:
+            time.sleep(retardo / 1000)
+
+
+def _sentimiento(texto):
+    texto = texto.lower()
+    positivo = any(palabra in texto for palabra in _POSITIVAS)
+    negativo = any(palabra in texto for palabra in _NEGATIVAS)
+    if positivo and negativo:
+        return 'mixed', {'positive': 0.5, 'neutral': 0.0, 'negative': 0.5}
+    if positivo:
+        return 'positive', {'positive': 0.95, 'neutral': 0.04, 'negative': 0.01}
+    if negativo:
+        return 'negative', {'positive': 0.01, 'neutral': 0.04, 'negative': 0.95}
+    return 'neutral', {'positive': 0.05, 'neutral': 0.9, 'negative': 0.05}
+
+
+def responder_sentimiento(cuerpo):
+    documentos = []
+    for documento in cuerpo['analysisInput']['documents']:
+        sentimiento, puntuaciones = _sentimiento(documento['text'])
+        documentos.append({
+            'id': documento['id'],
+            'sentiment': sentimiento,
+            'confidenceScores': puntuaciones,
+            'sentences': [{
+                'text': documento['text'],
+                'sentiment': sentimiento,
+                'confidenceScores': puntuaciones,
+                'offset': 0,
+                'length': len(documento['text']),
+            }],
+            'warnings': [],
+        })
+    return len(documentos), {
+        'kind': 'SentimentAnalysisResults',
+        'results': {'documents': documentos, 'errors': [], 'modelVersion': '2022-11-01'},
+    }
+
+
+def responder_traduccion(cuerpo, consulta):
+    idiomas = consulta.get('to') or ['en']
+    return len(cuerpo) * len(idiomas), [
+        {
+            'detectedLanguage': {'language': 'es', 'score': 1.0},
+            'translations': [{'text': f"[{idioma}] {elemento['text']}", 'to': idioma} for idioma in idiomas],
+        }
+        for elemento in cuerpo
+    ]
+
+
+def responder_descripcion(imagen, consulta):
+    candidatos = int((consulta.get('maxCandidates') or ['1'])[0])
+    return 1, {
+        'description': {
+            'tags': ['simulado', 'prueba'],
+            'captions': [
+                {'text': f"imagen simulada de {len(imagen)} bytes", 'confidence': 0.9 - 0.1 * i}
+                for i in range(candidatos)
+            ],
+        },
+        'requestId': f"simulado-{random.getrandbits(32):08x}",
+        'metadata': {'width': 1, 'height': 1, 'format': 'Png'},
+        'modelVersion': '2021-05-01',
+    }
+
+
+def _servicio(ruta):
+    if ruta.startswith('/language/'):
+        return 'language'
+    if ruta.startswith('/translate'):
+        return 'translator'
+    if ruta.startswith('/vision/'):
+        return 'vision'
+    if '/tokens/' in ruta:
+        return 'directline'
+    return None
+
+
+def crear_manejador(estado):
+    class Manejador(BaseHTTPRequestHandler):
+        # Keep-alive, como Azure: los clientes reutilizan sus conexiones
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _leer_cuerpo(self):
+            # msrest envía las imágenes con Transfer-Encoding: chunked
+            if 'chunked' in (self.headers.get('Transfer-Encoding') or '').lower():
+                partes = []
+                while True:
+                    tamano = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                    if tamano == 0:
+                        while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                            pass
+                        return b''.join(partes)
+                    partes.append(self.rfile.read(tamano))
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        def _responder(self, codigo, cuerpo, cabeceras=None):
+            datos = json.dumps(cuerpo).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(datos)))
+            for nombre, valor in (cabeceras or {}).items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            if self.path == '/estadisticas':
+                self._responder(200, estado.estadisticas())
+            elif self.path == '/configuracion':
+                self._responder(200, estado.configuracion())
+            else:
+                self._responder(404, {'error': {'code': 'NotFound'}})
+
+        def do_POST(self):
+            cuerpo = self._leer_cuerpo()
+            partes = urlsplit(self.path)
+            consulta = parse_qs(partes.query)
+
+            if partes.path == '/configuracion':
+                return self._responder(200, estado.configurar(**json.loads(cuerpo or b'{}')))
+
+            servicio = _servicio(partes.path)
+            if servicio is None:
+                return self._responder(404, {'error': {'code': 'NotFound', 'message': partes.path}})
+
+            estado.registrar(servicio, 'llamadas')
+            estado.esperar()
+
+            codigo = estado.fallo(servicio)
+            if codigo == 429:
+                estado.registrar(servicio, '429')
+                return self._responder(429, {
+                    'error': {'code': '429', 'message': 'Rate limit is exceeded (simulado).'}
+                }, {'Retry-After': str(int(estado.retry_after))})
+            if codigo == 500:
+                estado.registrar(servicio, 'errores')
+                return self._responder(500, {
+                    'error': {'code': 'InternalServerError', 'message': 'Error simulado'}
+                })
+
+            if servicio == 'directline':
+                credencial = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+                respuesta = atender_token(estado.directline, partes.path, credencial)
+                estado.registrar(servicio, 'elementos')
+                return self._responder(*respuesta)
+            if servicio == 'language':
+                elementos, respuesta = responder_sentimiento(json.loads(cuerpo))
+            elif servicio == 'translator':
+                elementos, respuesta = responder_traduccion(json.loads(cuerpo), consulta)
+            else:
+                elementos, respuesta = responder_descripcion(cuerpo, consulta)
+            estado.registrar(servicio, 'elementos', elementos)
+            self._responder(200, respuesta)
+
+    return Manejador
+
+
+def iniciar(puerto=3980, **configuracion):
+    """
+    Arranca el servidor simulado en un hilo.
+
+    Args:
+        puerto (int): Puerto local (0 elige uno libre)
+        **configuracion: Argumentos de EstadoAzure (latencia_ms, tasa_429...)
+
+    Returns:
+        tuple: (servidor, estado)
+    """
+    estado = EstadoAzure(**configuracion)
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), crear_manejador(estado))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor Azure simulado')
+    parser.add_argument('--puerto', type=int, default=3980)
+    parser.add_argument('--latencia-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=40)
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='fracción de respuestas 500')
+    parser.add_argument('--tasa-429', type=float, default=0.0, help='fracción de respuestas 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='segundos del Retry-After de los 429')
+    parser.add_argument('--tps', type=float, default=0, help='cuota de llamadas por segundo de cada servicio')
+    args = parser.parse_args()
+
+    servidor, _ = iniciar(
+        args.puerto, latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error, tasa_429=args.tasa_429, retry_after=args.retry_after, tps=args.tps
+    )
+    print(f"Azure simulado en http://127.0.0.1:{servidor.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
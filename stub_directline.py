@@ -0,0 +1,146 @@
+# === SERVIDOR DIRECT LINE SIMULADO ===
+"""
+Servidor local que imita los endpoints de tokens de Direct Line para probar
+`/api/directline/token` sin conectarse a Bot Framework.
+
+Uso:
+    python stub_directline.py --puerto 3979 --latencia-ms 150
+    DIRECTLINE_URL=http://127.0.0.1:3979/v3/directline DIRECT_LINE_SECRET=DLSECRET_prueba python main.py
+
+Endpoints:
+    POST /v3/directline/tokens/generate  Requiere 'Authorization: Bearer <secreto>'
+    POST /v3/directline/tokens/refresh   Requiere 'Authorization: Bearer <token>'
+    GET  /estadisticas                   Llamadas recibidas por endpoint
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class EstadoSimulado:
+    """Tokens emitidos y llamadas recibidas por el servidor simulado"""
+
+    def __init__(self, latencia_ms=0, expires_in=3600):
+        self.latencia_ms = latencia_ms
+        self.expires_in = expires_in
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.llamadas = {'generate': 0, 'refresh': 0, 'rechazadas': 0}
+
+    def emitir(self, conversacion):
+        token = f"token_{os.urandom(12).hex()}"
+        with self.lock:
+            self.tokens[token] = (conversacion, time.time() + self.expires_in)
+        return {
+            'conversationId': conversacion,
+            'token': token,
+            'expires_in': self.expires_in,
+            'streamUrl': f"wss://localhost/v3/directline/conversations/{conversacion}/stream"
+        }
+
+
+def crear_manejador(estado):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, codigo, cuerpo):
+            datos = json.dumps(cuerpo).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            if self.path == '/estadisticas':
+                with estado.lock:
+                    self._responder(200, dict(estado.llamadas, tokens=len(estado.tokens)))
+            else:
+                self._responder(404, {'error': {'code': 'NotFound'}})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            credencial = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+            if estado.latencia_ms:
+                time.sleep(estado.latencia_ms / 1000)
+
+            respuesta = atender_token(estado, self.path, credencial)
+            if respuesta is None:
+                respuesta = 404, {'error': {'code': 'NotFound'}}
+            self._responder(*respuesta)
+
+    return Manejador
+
+
+def atender_token(estado, ruta, credencial):
+    """
+    Atiende /tokens/generate y /tokens/refresh.
+
+    Args:
+        estado (EstadoSimulado): Tokens emitidos y contadores
+        ruta (str): Ruta de la petición
+        credencial (str): Secreto o token de la cabecera Authorization
+
+    Returns:
+        tuple o None: (código, cuerpo), o None si la ruta no es de tokens
+    """
+    if ruta.endswith('/tokens/generate'):
+        if not credencial:
+            return _rechazar(estado)
+        with estado.lock:
+            estado.llamadas['generate'] += 1
+        return 200, estado.emitir(f"conv_{os.urandom(6).hex()}")
+
+    if ruta.endswith('/tokens/refresh'):
+        with estado.lock:
+            conversacion, expira = estado.tokens.get(credencial, (None, 0))
+        if conversacion is None or expira < time.time():
+            return _rechazar(estado)
+        with estado.lock:
+            estado.llamadas['refresh'] += 1
+        return 200, estado.emitir(conversacion)
+
+    return None
+
+
+def _rechazar(estado):
+    with estado.lock:
+        estado.llamadas['rechazadas'] += 1
+    return 403, {'error': {'code': 'TokenInvalid', 'message': 'Token o secreto no válido'}}
+
+
+def iniciar(puerto=3979, latencia_ms=0, expires_in=3600):
+    """
+    Arranca el servidor simulado en un hilo.
+
+    Args:
+        puerto (int): Puerto local (0 elige uno libre)
+        latencia_ms (int): Retardo añadido a cada respuesta
+        expires_in (int): Vida de los tokens emitidos en segundos
+
+    Returns:
+        tuple: (servidor, estado)
+    """
+    estado = EstadoSimulado(latencia_ms, expires_in)
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), crear_manejador(estado))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor Direct Line simulado')
+    parser.add_argument('--puerto', type=int, default=3979)
+    parser.add_argument('--latencia-ms', type=int, default=150)
+    parser.add_argument('--expires-in', type=int, default=3600)
+    args = parser.parse_args()
+
+    servidor, _ = iniciar(args.puerto, args.latencia_ms, args.expires_in)
+    print(f"Direct Line simulado en http://127.0.0.1:{servidor.server_address[1]}/v3/directline")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
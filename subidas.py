@@ -0,0 +1,110 @@
+# === SUBIDA DE ARCHIVOS SIN DISCO ===
+"""
+Manejo de las subidas de imágenes sin pasar por disco.
+
+Werkzeug guarda por defecto en un archivo temporal toda subida mayor de
+500 KB. `SolicitudSubida` cambia ese comportamiento:
+
+    IMAGEN_MODO_SUBIDA=memoria  La subida se recibe siempre en un BytesIO
+                                (por defecto)
+    IMAGEN_MODO_SUBIDA=spool    La subida se recibe en memoria hasta
+                                IMAGEN_SPOOL_UMBRAL bytes y después en un
+                                archivo temporal anónimo con nombre único
+"""
+import os
+import io
+import tempfile
+
+from flask import Request, current_app
+
+
+def modo_subida():
+    return os.getenv('IMAGEN_MODO_SUBIDA', 'memoria').lower()
+
+
+class SolicitudSubida(Request):
+    """
+    Request de Flask que recibe los archivos subidos en memoria.
+    
+    El tamaño máximo de la petición puede ajustarse por ruta con
+    app.config['MAX_CONTENT_LENGTH_POR_RUTA'] = {'/ruta': bytes}.
+    """
+
+    @property
+    def max_content_length(self):
+        por_ruta = current_app.config.get('MAX_CONTENT_LENGTH_POR_RUTA') or {}
+        if self.path in por_ruta:
+            return por_ruta[self.path]
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if modo_subida() == 'spool':
+            umbral = int(os.getenv('IMAGEN_SPOOL_UMBRAL', str(1024 * 1024)))
+            return tempfile.SpooledTemporaryFile(max_size=umbral, mode='w+b', prefix='subida_')
+        return io.BytesIO()
+
+
+def vista_en_memoria(flujo):
+    """
+    Devuelve una vista sin copia del contenido de un flujo en memoria.
+
+    Args:
+        flujo: Objeto de archivo
+
+    Returns:
+        memoryview o None si el contenido no está en memoria
+    """
+    if isinstance(flujo, FlujoContado):
+        flujo = flujo.original
+
+    if hasattr(flujo, 'getbuffer'):
+        return flujo.getbuffer()
+
+    # SpooledTemporaryFile mantiene un BytesIO hasta superar el umbral
+    interno = getattr(flujo, '_file', None)
+    if isinstance(interno, io.BytesIO) and not getattr(flujo, '_rolled', True):
+        return interno.getbuffer()
+
+    return None
+
+
+class FlujoContado(io.RawIOBase):
+    """
+    Envoltorio de lectura que cuenta los bytes leídos de un flujo.
+
+    Envuelve la imagen que se envía a Azure para comprobar que se recorre
+    una única vez por intento, sin copiarse a disco y de vuelta a memoria.
+    """
+
+    def __init__(self, flujo):
+        self.original = flujo
+        self.bytes_leidos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        datos = self.original.read(size)
+        self.bytes_leidos += len(datos)
+        return datos
+
+    def readinto(self, buffer):
+        datos = self.read(len(buffer))
+        buffer[:len(datos)] = datos
+        return len(datos)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.original.seek(offset, whence)
+
+    def tell(self):
+        return self.original.tell()
+
+    def tamano(self):
+        """Devuelve el tamaño total del flujo sin leerlo"""
+        posicion = self.original.tell()
+        total = self.original.seek(0, io.SEEK_END)
+        self.original.seek(posicion)
+        return total
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pytest
+
+from agrupador import AgrupadorSolicitudes
+
+
+def _agrupador(lotes, **opciones):
+    def procesar(elementos):
+        lotes.append(list(elementos))
+        return [elemento * 2 for elemento in elementos]
+    return AgrupadorSolicitudes('prueba', procesar, **opciones)
+
+
+def _enviar_a_la_vez(agrupador, elementos):
+    resultados = {}
+    barrera = threading.Barrier(len(elementos))
+
+    def enviar(elemento):
+        barrera.wait()
+        resultados[elemento] = agrupador.enviar(elemento)
+
+    hilos = [threading.Thread(target=enviar, args=(elemento,)) for elemento in elementos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(5)
+    return resultados
+
+
+def test_llamadas_dentro_de_la_ventana_van_en_un_lote():
+    lotes = []
+    agrupador = _agrupador(lotes, ventana_ms=200, max_lote=10)
+    resultados = _enviar_a_la_vez(agrupador, list(range(5)))
+
+    assert resultados == {i: i * 2 for i in range(5)}
+    assert len(lotes) == 1 and sorted(lotes[0]) == list(range(5))
+    assert agrupador.metricas()['tamano_lote'] == {'5': 1}
+
+
+def test_max_lote_parte_los_lotes():
+    lotes = []
+    agrupador = _agrupador(lotes, ventana_ms=200, max_lote=3)
+    resultados = _enviar_a_la_vez(agrupador, list(range(7)))
+
+    assert resultados == {i: i * 2 for i in range(7)}
+    assert sorted(len(lote) for lote in lotes) == [1, 3, 3]
+
+
+def test_sin_ventana_cada_llamada_va_sola():
+    lotes = []
+    agrupador = _agrupador(lotes, ventana_ms=0)
+    assert agrupador.enviar(4) == 8
+    assert lotes == [[4]]
+    assert agrupador._cola is None
+
+
+def test_el_error_del_lote_llega_a_cada_llamada():
+    def fallar(elementos):
+        raise RuntimeError('sin servicio')
+
+    agrupador = AgrupadorSolicitudes('prueba', fallar, ventana_ms=10)
+    with pytest.raises(RuntimeError):
+        agrupador.enviar(1)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requiere fork')
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_el_hijo_de_un_fork_recrea_el_despachador():
+    lotes = []
+    agrupador = _agrupador(lotes, ventana_ms=10)
+    assert agrupador.enviar(1) == 2
+    cola = agrupador._cola
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # En el hijo no existe el hilo despachador del padre
+        try:
+            correcto = agrupador.enviar(3) == 6 and agrupador._cola is not cola
+            os.write(escritura, b'1' if correcto else b'0')
+        finally:
+            os._exit(0)
+    os.close(escritura)
+    os.waitpid(pid, 0)
+    assert os.read(lectura, 1) == b'1'
+    os.close(lectura)
+    assert agrupador._cola is cola
@@ -0,0 +1,81 @@
+import pytest
+
+import cache_resultados
+from cache_resultados import CacheMemoria, CacheSQLite, clave_cache, normalizar_texto
+from servicio_translator import traducir_textos
+
+
+class Reloj:
+    def __init__(self, monkeypatch):
+        self.ahora = 1_000_000.0
+        monkeypatch.setattr(cache_resultados.time, 'time', lambda: self.ahora)
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def crear_cache(request, tmp_path):
+    def crear(ttl=60, max_entradas=100):
+        if request.param == 'memoria':
+            return CacheMemoria(ttl, max_entradas)
+        return CacheSQLite(str(tmp_path / 'cache.sqlite3'), ttl, max_entradas)
+    return crear
+
+
+def test_las_entradas_caducan(crear_cache, monkeypatch):
+    reloj = Reloj(monkeypatch)
+    cache = crear_cache(ttl=60)
+    cache.guardar('sentimiento', 'k', {'sentimiento': 'positive'})
+    reloj.ahora += 59
+    assert cache.obtener('sentimiento', 'k') == {'sentimiento': 'positive'}
+    reloj.ahora += 2
+    assert cache.obtener('sentimiento', 'k') is None
+    assert cache.metricas()['servicios']['sentimiento'] == {'aciertos': 1, 'fallos': 1}
+
+
+def test_memoria_expulsa_la_menos_usada():
+    cache = CacheMemoria(60, 2)
+    cache.guardar('traduccion', 'a', 'A')
+    cache.guardar('traduccion', 'b', 'B')
+    cache.obtener('traduccion', 'a')
+    cache.guardar('traduccion', 'c', 'C')
+    assert cache.obtener('traduccion', 'b') is None
+    assert cache.obtener('traduccion', 'a') == 'A'
+    assert cache.obtener('traduccion', 'c') == 'C'
+
+
+def test_sqlite_expulsa_la_menos_usada(tmp_path, monkeypatch):
+    reloj = Reloj(monkeypatch)
+    monkeypatch.setattr(CacheSQLite, '_INTERVALO_EXPULSION', 3)
+    cache = CacheSQLite(str(tmp_path / 'cache.sqlite3'), 60, 2)
+    cache.guardar('traduccion', 'a', 'A')
+    reloj.ahora += 1
+    cache.guardar('traduccion', 'b', 'B')
+    reloj.ahora += 1
+    cache.obtener('traduccion', 'a')
+    reloj.ahora += 1
+    cache.guardar('traduccion', 'c', 'C')
+    assert cache.metricas()['entradas'] == 2
+    assert cache.obtener('traduccion', 'b') is None
+    assert cache.obtener('traduccion', 'a') == 'A'
+
+
+def test_normalizar_texto():
+    # 'é' compuesta y 'e' + acento combinante comparten clave
+    assert normalizar_texto('cafe\u0301  con\tleche\n') == 'café con leche'
+    assert normalizar_texto('cafe\u0301\ncon  leche', conservar_formato=True) == 'café\ncon  leche'
+
+
+def test_traduccion_de_varias_lineas_no_comparte_cache(azure_simulado, monkeypatch):
+    monkeypatch.setattr(cache_resultados, '_cache', CacheMemoria(60, 100))
+    assert traducir_textos(['hola mundo'], ['en'])[0]['en'] == {'traduccion': '[en] hola mundo'}
+    resultado = traducir_textos(['hola\nmundo'], ['en'])[0]['en']
+    assert resultado == {'traduccion': '[en] hola\nmundo'}
+    assert azure_simulado.estadisticas()['translator']['llamadas'] == 2
+    # Si solo cambia la forma Unicode sale de la caché
+    traducir_textos(['adiós\nmundo'], ['en'])
+    traducir_textos(['adio\u0301s\nmundo'], ['en'])
+    assert azure_simulado.estadisticas()['translator']['llamadas'] == 3
+
+
+def test_las_claves_distinguen_los_parametros():
+    assert clave_cache('traduccion', 'hola', 'en') != clave_cache('traduccion', 'hola', 'fr')
+    assert clave_cache('traduccion', 'hola', 'en') == clave_cache('traduccion', 'hola', 'en')
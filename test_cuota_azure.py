@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import cuota_azure
+from cuota_azure import CuotaMemoria, CuotaSQLite
+
+
+class Reloj:
+    def __init__(self, monkeypatch):
+        self.ahora = 1_000_000.0
+        monkeypatch.setattr(cuota_azure.time, 'time', lambda: self.ahora)
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def cuota(request, tmp_path):
+    if request.param == 'memoria':
+        return CuotaMemoria()
+    return CuotaSQLite(str(tmp_path / 'cuota.sqlite3'))
+
+
+def test_la_cubeta_se_repone_a_la_tasa(cuota, monkeypatch):
+    reloj = Reloj(monkeypatch)
+    # Ráfaga de 2 y 10 tokens por segundo
+    assert cuota.reservar('language', 10, 2, 0) == (True, 0.0)
+    assert cuota.reservar('language', 10, 2, 0) == (True, 0.0)
+    assert cuota.reservar('language', 10, 2, 0)[0] is False
+
+    reloj.ahora += 0.15
+    assert cuota.reservar('language', 10, 2, 0) == (True, 0.0)
+    reloj.ahora += 10
+    # Nunca se acumulan más tokens que la ráfaga
+    assert cuota.niveles()['language'] == (2, 2)
+
+
+def test_sin_tokens_se_reserva_en_negativo_y_se_espera(cuota, monkeypatch):
+    Reloj(monkeypatch)
+    cuota.reservar('translator', 10, 1, 1)
+    esperas = [cuota.reservar('translator', 10, 1, 1) for _ in range(3)]
+    # Cada llamada en espera sale un intervalo después de la anterior
+    assert [reservado for reservado, _ in esperas] == [True, True, True]
+    assert [round(espera, 3) for _, espera in esperas] == [0.1, 0.2, 0.3]
+    assert cuota.niveles()['translator'][0] == pytest.approx(-3)
+
+
+def test_espera_mayor_que_el_maximo_no_reserva(cuota, monkeypatch):
+    Reloj(monkeypatch)
+    cuota.reservar('vision', 1, 1, 0)
+    reservado, espera = cuota.reservar('vision', 1, 1, 0.5)
+    assert not reservado and espera == pytest.approx(1)
+    assert cuota.niveles()['vision'][0] == pytest.approx(0)
+
+
+def test_dos_workers_gastan_de_la_misma_cubeta(tmp_path):
+    ruta = str(tmp_path / 'cuota.sqlite3')
+    workers = [CuotaSQLite(ruta), CuotaSQLite(ruta)]
+    concedidas = []
+
+    def gastar(cuota):
+        for _ in range(20):
+            # Tasa casi nula: solo se pueden gastar los 10 tokens de la ráfaga
+            concedidas.append(cuota.reservar('language', 0.001, 10, 0)[0])
+
+    hilos = [threading.Thread(target=gastar, args=(cuota,)) for cuota in workers for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(10)
+
+    assert len(concedidas) == 80
+    assert sum(concedidas) == 10
+    assert workers[1].niveles()['language'][0] < 1
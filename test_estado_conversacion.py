@@ -0,0 +1,78 @@
+import pytest
+
+import estado_conversacion
+from estado_conversacion import AlmacenMemoria, AlmacenSQLite, EstadoConversacion, id_valido
+
+
+class Reloj:
+    def __init__(self, monkeypatch):
+        self.ahora = 1_000_000.0
+        monkeypatch.setattr(estado_conversacion.time, 'time', lambda: self.ahora)
+
+
+def _guardar(almacen, id, intencion='faq'):
+    estado = almacen.obtener(id)
+    estado.registrar(intencion)
+    almacen.guardar(estado)
+    return estado
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def almacen(request, tmp_path):
+    if request.param == 'memoria':
+        return AlmacenMemoria(60, 100)
+    return AlmacenSQLite(str(tmp_path / 'conversaciones.sqlite3'), 60, 100)
+
+
+def test_guarda_el_estado_de_cada_conversacion(almacen):
+    _guardar(almacen, 'a', 'welcome')
+    _guardar(almacen, 'a', 'faq')
+    estado = almacen.obtener('a')
+    assert (estado.bienvenida, estado.mensajes, estado.ultima_intencion) == (True, 2, 'faq')
+    assert almacen.obtener('b').mensajes == 0
+
+
+def test_conversacion_inactiva_se_olvida(almacen, monkeypatch):
+    reloj = Reloj(monkeypatch)
+    _guardar(almacen, 'a', 'welcome')
+    reloj.ahora += 59
+    assert almacen.obtener('a').bienvenida
+    reloj.ahora += 2
+    assert not almacen.obtener('a').bienvenida
+
+
+def test_memoria_expulsa_la_menos_activa(monkeypatch):
+    monkeypatch.setattr(AlmacenMemoria, '_PARTICIONES', 1)
+    almacen = AlmacenMemoria(60, 2)
+    for id in ('a', 'b'):
+        _guardar(almacen, id)
+    _guardar(almacen, 'a')
+    _guardar(almacen, 'c')
+    assert almacen.metricas()['conversaciones'] == 2
+    assert almacen.obtener('b').mensajes == 0
+    assert almacen.obtener('a').mensajes == 2
+
+
+def test_sqlite_se_comparte_entre_instancias(tmp_path):
+    ruta = str(tmp_path / 'conversaciones.sqlite3')
+    _guardar(AlmacenSQLite(ruta, 60, 100), 'a', 'welcome')
+    # Otro worker abre el mismo archivo
+    estado = AlmacenSQLite(ruta, 60, 100).obtener('a')
+    assert isinstance(estado, EstadoConversacion)
+    assert (estado.bienvenida, estado.mensajes) == (True, 1)
+
+
+@pytest.mark.parametrize('valor', [None, '', 'a' * 65, 'id con espacios', "x'; DROP TABLE", 42])
+def test_ids_rechazados(valor):
+    assert not id_valido(valor)
+
+
+def test_el_bot_cambia_un_id_no_valido_por_uno_nuevo(monkeypatch):
+    from servicio_bot import InnovVentasBot
+    monkeypatch.setattr(estado_conversacion, '_almacen', AlmacenMemoria(60, 100))
+    bot = InnovVentasBot()
+
+    respuesta = bot.generate_response('hola', '../../etc/passwd')
+    assert respuesta['conversation_id'] != '../../etc/passwd' and id_valido(respuesta['conversation_id'])
+    # Con el id devuelto la conversación continúa sin volver a dar la bienvenida
+    assert bot.generate_response('hola', respuesta['conversation_id'])['intent'] == 'faq'
@@ -0,0 +1,42 @@
+from intenciones import ComparadorIntenciones, COMPARADOR_FAQ, FAQS
+
+
+def _frase(mensaje, comparador=COMPARADOR_FAQ):
+    coincidencia = comparador.buscar(mensaje)
+    return coincidencia[0] if coincidencia else None
+
+
+def test_solo_palabras_completas():
+    assert _frase('Se apagó la pantalla') is None
+    assert _frase('¿Cómo hago el pago?') == 'pago'
+
+
+def test_sin_acentos_ni_mayusculas():
+    assert _frase('Adios, nos vemos') == 'adiós'
+    assert _frase('Quiero hacer una DEVOLUCION') == 'devolución'
+
+
+def test_frases_de_varias_palabras():
+    assert _frase('muy buenas tardes a todos') == 'buenas tardes'
+    assert _frase('tardes buenas') is None
+    assert _frase('hasta luego') == 'hasta luego'
+
+
+def test_gana_el_orden_de_la_tabla():
+    # 'pedido' va antes que 'problema' en FAQS aunque aparezca después en el mensaje
+    assert _frase('tengo un problema con mi pedido') == 'pedido'
+    assert _frase('hola, un problema') == 'hola'
+    comparador = ComparadorIntenciones([('b c', 'primera'), ('a b c', 'segunda'), ('c', 'tercera')])
+    assert comparador.buscar('a b c') == ('b c', 'primera')
+
+
+def test_frases_repetidas_conservan_la_primera():
+    comparador = ComparadorIntenciones([('Pago', 'uno'), ('pago', 'dos'), ('', 'vacía')])
+    assert len(comparador) == 1
+    assert comparador.buscar('pago') == ('Pago', 'uno')
+
+
+def test_la_tabla_entera_esta_compilada():
+    assert len(COMPARADOR_FAQ) == len(FAQS)
+    for frase, respuesta in FAQS.items():
+        assert COMPARADOR_FAQ.buscar(f'¿{frase.upper()}?') == (frase, respuesta)
@@ -0,0 +1,93 @@
+import pytest
+
+from limite_clientes import (
+    evaluar, identificar_cliente, LimitesMemoria, LimitesSQLite, SEGUNDOS_DIA
+)
+
+VENTANA = 60
+# Un instante al principio de una ventana y lejos del cambio de día
+INICIO = 1000 * SEGUNDOS_DIA + 3600
+
+
+def _consumir(contadores, ahora, limite, veces=1):
+    for _ in range(veces):
+        admitida, contadores, cabeceras = evaluar(contadores, ahora, limite, VENTANA)
+    return admitida, contadores, cabeceras
+
+
+def test_admite_hasta_el_limite_de_la_ventana():
+    admitida, contadores, cabeceras = _consumir(None, INICIO, (5, 0), veces=5)
+    assert admitida
+    assert cabeceras['RateLimit-Remaining'] == '0'
+
+    admitida, _, cabeceras = evaluar(contadores, INICIO + 1, (5, 0), VENTANA)
+    assert not admitida
+    assert int(cabeceras['Retry-After']) > 0
+
+
+def test_la_ventana_anterior_pesa_segun_lo_que_queda_de_ella():
+    _, contadores, _ = _consumir(None, INICIO, (10, 0), veces=10)
+    # A mitad de la ventana siguiente la anterior cuenta la mitad: 5 huecos
+    mitad = INICIO + VENTANA + VENTANA / 2
+    admitidas = 0
+    for _ in range(10):
+        admitida, contadores, _ = evaluar(contadores, mitad, (10, 0), VENTANA)
+        admitidas += admitida
+    assert admitidas == 5
+
+
+def test_tras_dos_ventanas_se_olvida_la_anterior():
+    _, contadores, _ = _consumir(None, INICIO, (3, 0), veces=3)
+    admitida, contadores, _ = _consumir(contadores, INICIO + 2 * VENTANA, (3, 0), veces=3)
+    assert admitida
+    assert contadores[2] == 0
+
+
+def test_retry_after_deja_sitio_a_una_peticion():
+    limite = (4, 0)
+    _, contadores, _ = _consumir(None, INICIO, limite, veces=4)
+    admitida, _, cabeceras = evaluar(contadores, INICIO + 10, limite, VENTANA)
+    assert not admitida
+    espera = int(cabeceras['Retry-After'])
+    admitida, _, _ = evaluar(contadores, INICIO + 10 + espera, limite, VENTANA)
+    assert admitida
+
+
+def test_cuota_diaria_hasta_el_cambio_de_dia():
+    limite = (0, 3)
+    _, contadores, _ = _consumir(None, INICIO, limite, veces=3)
+    admitida, _, cabeceras = evaluar(contadores, INICIO + 600, limite, VENTANA)
+    assert not admitida
+    assert int(cabeceras['Retry-After']) == SEGUNDOS_DIA - 3600 - 600
+
+    admitida, _, _ = evaluar(contadores, INICIO + SEGUNDOS_DIA, limite, VENTANA)
+    assert admitida
+
+
+def test_las_cabeceras_anuncian_el_limite_mas_cercano():
+    _, _, cabeceras = _consumir(None, INICIO, (100, 2), veces=1)
+    assert cabeceras['RateLimit-Limit'] == '2'
+    assert cabeceras['RateLimit-Remaining'] == '1'
+    assert cabeceras['RateLimit-Policy'] == f'100;w={VENTANA}, 2;w={SEGUNDOS_DIA}'
+
+
+@pytest.mark.parametrize('crear', [
+    lambda tmp_path: LimitesMemoria(100),
+    lambda tmp_path: LimitesSQLite(str(tmp_path / 'limites.sqlite3')),
+], ids=['memoria', 'sqlite'])
+def test_almacenes_cuentan_por_clave(crear, tmp_path):
+    almacen = crear(tmp_path)
+    for _ in range(3):
+        assert almacen.consumir('ip:1.2.3.4|/api/traducir', (3, 0), 3600)[0]
+    assert not almacen.consumir('ip:1.2.3.4|/api/traducir', (3, 0), 3600)[0]
+    assert almacen.consumir('ip:5.6.7.8|/api/traducir', (3, 0), 3600)[0]
+
+
+def test_identificar_cliente_por_el_ultimo_proxy(monkeypatch):
+    monkeypatch.setenv('LIMITE_PROXIES', '1')
+    # El primer salto lo escribe el cliente: no se puede usar para identificarlo
+    assert identificar_cliente(None, '6.6.6.6, 203.0.113.7:52144', '10.0.0.1') == 'ip:203.0.113.7'
+    # Con IPv6 el puerto va tras los corchetes; sin quitarlo cada puerto tendría su propio límite
+    assert identificar_cliente(None, '[2001:db8::1]:52144', '10.0.0.1') == 'ip:2001:db8::1'
+    assert identificar_cliente(None, '2001:db8::1', '10.0.0.1') == 'ip:2001:db8::1'
+    assert identificar_cliente('clave-desconocida', None, '10.0.0.1') == 'ip:10.0.0.1'
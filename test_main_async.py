@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+
+def _llamar(app, metodo, ruta, datos=None):
+    """Hace una petición HTTP a la aplicación ASGI; devuelve (código, JSON)"""
+    cuerpo = json.dumps(datos).encode('utf-8') if datos is not None else b''
+    mensajes = []
+    alcance = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': metodo, 'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(),
+        'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        'headers': [(b'host', b'testserver'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(cuerpo)).encode())],
+    }
+
+    async def recibir():
+        return {'type': 'http.request', 'body': cuerpo, 'more_body': False}
+
+    async def enviar(mensaje):
+        mensajes.append(mensaje)
+
+    asyncio.run(app(alcance, recibir, enviar))
+    codigo = next(m['status'] for m in mensajes if m['type'] == 'http.response.start')
+    contenido = b''.join(m.get('body', b'') for m in mensajes if m['type'] == 'http.response.body')
+    return codigo, json.loads(contenido)
+
+
+@pytest.fixture
+def app(azure_simulado, monkeypatch, tmp_path):
+    monkeypatch.setenv('TRABAJOS_RUTA', str(tmp_path / 'trabajos.sqlite3'))
+    from main_async import app
+    return app
+
+
+def test_sentimiento_por_lotes(app, azure_simulado):
+    codigo, datos = _llamar(app, 'POST', '/api/analizar-sentimiento/lote', {'textos': ['me encanta', '', 'qué mal']})
+    assert codigo == 200
+    assert [r['sentimiento'] for r in datos['resultados']] == ['positive', 'neutral', 'negative']
+    assert azure_simulado.estadisticas()['language']['llamadas'] == 1
+
+    codigo, _ = _llamar(app, 'POST', '/api/analizar-sentimiento/lote', {'textos': 'hola'})
+    assert codigo == 400
+
+
+@pytest.mark.parametrize('ruta', ['agrupadores', 'cache', 'chat', 'configuracion', 'backends', 'trabajos'])
+def test_rutas_de_estado(app, ruta):
+    codigo, datos = _llamar(app, 'GET', f'/api/estado/{ruta}')
+    assert codigo == 200
+    assert isinstance(datos, dict)
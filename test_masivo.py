@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+
+import pytest
+
+import masivo
+from masivo import LoteFallido, ejecutar, procesar, MARCA_ERROR_CSV
+
+
+@pytest.fixture
+def config_masivo(monkeypatch, azure_simulado):
+    monkeypatch.setenv('MASIVO_LOTE', '2')
+    monkeypatch.setenv('MASIVO_CONCURRENCIA', '1')
+    monkeypatch.setenv('MASIVO_REINTENTOS', '0')
+    return azure_simulado
+
+
+def _ndjson(ruta, textos):
+    ruta.write_text(''.join(json.dumps({'id': i, 'texto': texto}) + '\n' for i, texto in enumerate(textos)))
+    return str(ruta)
+
+
+def test_errores_de_fila_no_cortan_el_lote(config_masivo):
+    filas = [{'texto': ''}, {'texto': 'me encanta'}]
+    grupos = list(procesar(iter(filas), 'sentimiento'))
+    assert grupos[0][0]['error'] == 'Texto de entrada no válido'
+    assert grupos[0][1]['sentimiento'] == 'positive'
+
+
+def test_lote_solo_con_una_fila_no_valida(config_masivo):
+    # Antes se confundía con un fallo de la llamada y no se podía pasar de este lote
+    grupos = list(procesar(iter([{'texto': '   '}]), 'traducir', idiomas=['en']))
+    assert grupos[0][0]['error'] == 'en: Texto de entrada no válido'
+
+
+def test_fallo_de_la_llamada_se_reintenta_y_corta(config_masivo, monkeypatch):
+    monkeypatch.setenv('MASIVO_REINTENTOS', '1')
+    monkeypatch.setattr(masivo.time, 'sleep', lambda segundos: None)
+    config_masivo.configurar(tasa_error=1)
+
+    with pytest.raises(LoteFallido) as error:
+        list(procesar(iter([{'texto': 'hola'}]), 'sentimiento'))
+    assert error.value.numero == 1
+    assert config_masivo.estadisticas()['language']['llamadas'] == 2
+
+
+def test_reanudar_tras_un_lote_fallido(config_masivo, monkeypatch, tmp_path):
+    entrada = _ndjson(tmp_path / 'entrada.ndjson', [f'texto {i} genial' for i in range(9)])
+    salida = str(tmp_path / 'salida.ndjson')
+
+    llamar_servicio = masivo._llamar_servicio
+    llamadas = []
+
+    def con_caida(*args):
+        # Azure deja de responder a partir del tercer lote
+        llamadas.append(1)
+        if len(llamadas) == 3:
+            config_masivo.configurar(tasa_error=1)
+        return llamar_servicio(*args)
+
+    monkeypatch.setattr(masivo, '_llamar_servicio', con_caida)
+    with pytest.raises(LoteFallido):
+        ejecutar('sentimiento', entrada, salida)
+    control = json.loads(open(salida + '.progreso').read())
+    assert (control['filas'], control['lotes']) == (4, 2)
+
+    with pytest.raises(ValueError):
+        ejecutar('sentimiento', entrada, salida)
+
+    config_masivo.configurar(tasa_error=0)
+    resumen = ejecutar('sentimiento', entrada, salida, reanudar=True)
+    assert resumen == {'filas': 9, 'lotes': 5, 'errores': 0}
+    filas = [json.loads(linea) for linea in open(salida)]
+    assert [fila['id'] for fila in filas] == list(range(9))
+    assert all(fila['sentimiento'] == 'positive' for fila in filas)
+
+
+def test_traduccion_csv_conserva_columnas_y_orden(config_masivo, tmp_path):
+    entrada = tmp_path / 'entrada.csv'
+    entrada.write_text('id,texto\n1,hola\n2,"adiós, amigo"\n3,gracias\n')
+    salida = str(tmp_path / 'salida.csv')
+
+    ejecutar('traducir', str(entrada), salida, idiomas=['en', 'fr'])
+    filas = list(csv.DictReader(open(salida)))
+    assert [fila['id'] for fila in filas] == ['1', '2', '3']
+    assert filas[1]['traduccion_fr'] == '[fr] adiós, amigo'
+
+
+# --- API en streaming --------------------------------------------------------------
+
+@pytest.fixture
+def cliente(config_masivo):
+    from main import app
+    return app.test_client()
+
+
+def test_api_csv_desde_sin_cabecera(cliente):
+    cuerpo = 'id,texto\n1,bien\n2,mal\n3,hola\n'
+    respuesta = cliente.post('/api/masivo/sentimiento?desde=1', data=cuerpo, content_type='text/csv')
+    lineas = respuesta.get_data(as_text=True).splitlines()
+    assert respuesta.status_code == 200
+    assert [linea.split(',')[0] for linea in lineas] == ['2', '3']
+
+
+def test_api_ndjson_termina_con_linea_de_error(cliente, config_masivo):
+    config_masivo.configurar(tasa_error=1)
+    cuerpo = ''.join(json.dumps({'texto': f'texto {i}'}) + '\n' for i in range(5))
+    respuesta = cliente.post('/api/masivo/sentimiento?desde=2', data=cuerpo, content_type='application/x-ndjson')
+    lineas = respuesta.get_data(as_text=True).splitlines()
+    assert respuesta.status_code == 200
+    ultima = json.loads(lineas[-1])
+    assert set(ultima) == {'error', 'filas'}
+    assert ultima['filas'] == 2
+
+
+def test_api_csv_termina_con_linea_de_error(cliente, config_masivo):
+    config_masivo.configurar(tasa_error=1)
+    respuesta = cliente.post('/api/masivo/traducir?idiomas=en', data='texto\nhola\n', content_type='text/csv')
+    filas = list(csv.reader(io.StringIO(respuesta.get_data(as_text=True))))
+    assert filas[0] == ['texto', 'traduccion_en', 'error']
+    assert filas[-1][:2] == [MARCA_ERROR_CSV, '0']
@@ -0,0 +1,26 @@
+import metricas
+
+
+def test_metricas_se_leen_al_usarlas(monkeypatch):
+    monkeypatch.setenv('METRICAS', '0')
+    assert not metricas.activas()
+    monkeypatch.setenv('METRICAS', '1')
+    assert metricas.activas()
+
+
+def test_histograma_cuenta_por_bucket_y_respeta_el_interruptor(monkeypatch):
+    # Ni se registra en /metrics ni arranca el volcado periódico
+    monkeypatch.setattr(metricas, '_histogramas', dict(metricas._histogramas))
+    monkeypatch.setattr(metricas, '_asegurar_volcado', lambda: None)
+    histograma = metricas.Histograma('prueba_segundos', 'Histograma de prueba', ('ruta',))
+    monkeypatch.setenv('METRICAS', '0')
+    histograma.observar(0.01, '/a')
+    assert histograma.muestras() == {}
+
+    monkeypatch.setenv('METRICAS', '1')
+    histograma.observar(metricas.BUCKETS[0], '/a')
+    histograma.observar(metricas.BUCKETS[-1] * 10, '/a')
+    serie = histograma.muestras()[('/a',)]
+    assert serie[0] == 1
+    assert serie[len(metricas.BUCKETS)] == 1
+    assert serie[-1] == metricas.BUCKETS[0] + metricas.BUCKETS[-1] * 10
@@ -0,0 +1,218 @@
+import time
+import uuid
+
+import pytest
+
+import resiliencia
+from resiliencia import (
+    Backend, BackendNoDisponible, PlazoAgotado, llamar, plazo, tiempo_restante,
+    es_sobrecarga, segundos_retry_after, CERRADO, ABIERTO, SEMIABIERTO
+)
+
+
+class ErrorHTTP(Exception):
+    """Error con código y cabeceras, como los de azure-core"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def _backend(monkeypatch, **config):
+    nombre = f'prueba_{uuid.uuid4().hex[:8]}'
+    for clave, valor in config.items():
+        monkeypatch.setenv(f'{clave}_{nombre.upper()}', str(valor))
+    return Backend(nombre)
+
+
+def _fallar(backend, error=None):
+    sonda = backend.entrar()
+    backend.salir(0.01, error or ErrorHTTP(503), sonda)
+
+
+# --- Cortocircuito -----------------------------------------------------------------
+
+def test_circuito_se_abre_tras_los_fallos_seguidos(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=3, CIRCUITO_ABIERTO_S=60)
+    for _ in range(3):
+        _fallar(backend)
+    assert backend.estado == ABIERTO
+    with pytest.raises(BackendNoDisponible) as error:
+        backend.entrar()
+    assert error.value.motivo == 'circuito_abierto'
+
+
+def test_errores_del_cliente_no_abren_el_circuito(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=2)
+    for _ in range(5):
+        _fallar(backend, ErrorHTTP(400))
+    assert backend.estado == CERRADO
+
+
+def test_semiabierto_admite_una_sola_sonda(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=1, CIRCUITO_ABIERTO_S=0)
+    _fallar(backend)
+    assert backend.entrar() is True
+    assert backend.estado == SEMIABIERTO
+    with pytest.raises(BackendNoDisponible):
+        backend.entrar()
+
+
+def test_solo_la_sonda_cierra_el_circuito(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=1, CIRCUITO_ABIERTO_S=0)
+    # Una llamada que empezó antes de abrirse el circuito termina bien tarde
+    tardia = backend.entrar()
+    _fallar(backend)
+    sonda = backend.entrar()
+    backend.salir(0.01, None, tardia)
+    assert backend.estado == SEMIABIERTO
+    with pytest.raises(BackendNoDisponible):
+        backend.entrar()
+
+    backend.salir(0.01, None, sonda)
+    assert backend.estado == CERRADO
+
+
+def test_la_sonda_fallida_reabre_el_circuito(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=1, CIRCUITO_ABIERTO_S=0)
+    _fallar(backend)
+    sonda = backend.entrar()
+    backend.tiempo_abierto = 60
+    backend.salir(0.01, ErrorHTTP(503), sonda)
+    assert backend.estado == ABIERTO
+    with pytest.raises(BackendNoDisponible):
+        backend.entrar()
+
+
+def test_fallo_tardio_no_reabre_un_circuito_semiabierto(monkeypatch):
+    backend = _backend(monkeypatch, CIRCUITO_FALLOS=1, CIRCUITO_ABIERTO_S=0)
+    tardia = backend.entrar()
+    _fallar(backend)
+    sonda = backend.entrar()
+    backend.salir(0.01, ErrorHTTP(503), tardia)
+    assert backend.estado == SEMIABIERTO
+    backend.salir(0.01, None, sonda)
+    assert backend.estado == CERRADO
+
+
+# --- Limitador AIMD ----------------------------------------------------------------
+
+def test_sobrecarga_reduce_el_limite_a_la_mitad(monkeypatch):
+    backend = _backend(monkeypatch, RESILIENCIA_LIMITE_INICIAL=8, CIRCUITO_FALLOS=100)
+    _fallar(backend, ErrorHTTP(429))
+    assert backend.limite == 4
+    _fallar(backend, TimeoutError())
+    assert backend.limite == 2
+
+
+def test_exitos_aumentan_el_limite_en_uno_por_ventana(monkeypatch):
+    backend = _backend(monkeypatch, RESILIENCIA_LIMITE_INICIAL=4)
+    for _ in range(4):
+        backend.salir(0.01, None, backend.entrar())
+    assert 4.9 < backend.limite < 5.1
+
+
+def test_latencia_excesiva_cuenta_como_sobrecarga(monkeypatch):
+    backend = _backend(monkeypatch, RESILIENCIA_LIMITE_INICIAL=8, RESILIENCIA_LATENCIA_MAX_MS=100)
+    backend.salir(0.5, None, backend.entrar())
+    assert backend.limite == 4
+
+
+def test_limite_lleno_rechaza_tras_la_espera(monkeypatch):
+    backend = _backend(monkeypatch, RESILIENCIA_LIMITE_INICIAL=1, RESILIENCIA_ESPERA_MS=20)
+    backend.entrar()
+    inicio = time.monotonic()
+    with pytest.raises(BackendNoDisponible) as error:
+        backend.entrar()
+    assert error.value.motivo == 'saturado'
+    assert time.monotonic() - inicio >= 0.015
+
+
+# --- Reintentos y plazo ------------------------------------------------------------
+
+def test_llamar_reintenta_la_sobrecarga(monkeypatch):
+    nombre = f'prueba_{uuid.uuid4().hex[:8]}'
+    monkeypatch.setenv(f'REINTENTOS_BASE_MS_{nombre.upper()}', '1')
+    intentos = []
+
+    def funcion():
+        intentos.append(1)
+        if len(intentos) < 3:
+            raise ErrorHTTP(503)
+        return 'ok'
+
+    assert llamar(nombre, funcion) == 'ok'
+    assert len(intentos) == 3
+    assert resiliencia.obtener_backend(nombre).metricas()['reintentos'] == 2
+
+
+def test_llamar_no_reintenta_errores_del_cliente(monkeypatch):
+    intentos = []
+
+    def funcion():
+        intentos.append(1)
+        raise ErrorHTTP(404)
+
+    with pytest.raises(ErrorHTTP):
+        llamar(f'prueba_{uuid.uuid4().hex[:8]}', funcion)
+    assert len(intentos) == 1
+
+
+def test_retry_after_fija_la_espera(monkeypatch):
+    backend = _backend(monkeypatch, REINTENTOS_TOPE_MS=5000)
+    assert backend.espera_reintento(0, ErrorHTTP(429, {'Retry-After': '2'})) == 2
+    assert backend.espera_reintento(0, ErrorHTTP(429, {'retry-after-ms': '250'})) == 0.25
+    # Un Retry-After mayor que el tope no se reintenta
+    assert backend.espera_reintento(0, ErrorHTTP(429, {'Retry-After': '30'})) is None
+
+
+def test_retry_after_en_la_causa():
+    try:
+        try:
+            raise ErrorHTTP(429, {'Retry-After': '3'})
+        except ErrorHTTP as interno:
+            raise RuntimeError('envoltorio') from interno
+    except RuntimeError as e:
+        assert segundos_retry_after(e) == 3
+
+
+def test_no_se_reintenta_si_la_espera_supera_el_plazo(monkeypatch):
+    backend = _backend(monkeypatch)
+    with plazo(0.5):
+        assert backend.espera_reintento(0, ErrorHTTP(429, {'Retry-After': '1'})) is None
+    assert backend.metricas()['plazos_agotados'] == 1
+
+
+def test_plazo_vencido_no_llama_al_backend():
+    llamadas = []
+    with plazo(0):
+        with pytest.raises(PlazoAgotado):
+            llamar(f'prueba_{uuid.uuid4().hex[:8]}', lambda: llamadas.append(1))
+    assert llamadas == []
+
+
+def test_plazo_anidado_no_alarga_el_exterior():
+    with plazo(1):
+        with plazo(60):
+            assert tiempo_restante() <= 1
+        with plazo(0.1):
+            assert tiempo_restante() <= 0.1
+    assert tiempo_restante() is None
+
+
+# --- Clasificación de errores ------------------------------------------------------
+
+def test_errores_de_sobrecarga():
+    assert es_sobrecarga(ErrorHTTP(429))
+    assert es_sobrecarga(ErrorHTTP(503))
+    assert es_sobrecarga(TimeoutError())
+    assert not es_sobrecarga(ErrorHTTP(400))
+    assert not es_sobrecarga(ValueError('sin credenciales'))
+
+
+def test_errores_de_conexion_de_aiohttp_son_sobrecarga():
+    aiohttp = pytest.importorskip('aiohttp')
+    assert es_sobrecarga(aiohttp.ServerDisconnectedError())
+    assert es_sobrecarga(aiohttp.ClientPayloadError('cuerpo cortado'))
+    assert resiliencia.resultado_llamada(aiohttp.ServerDisconnectedError()) == 'conexion'
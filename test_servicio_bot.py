@@ -0,0 +1,31 @@
+import pytest
+
+import estado_conversacion
+from servicio_bot import InnovVentasBot
+
+
+@pytest.fixture
+def bot_prueba(monkeypatch):
+    monkeypatch.setattr(estado_conversacion, '_almacen', estado_conversacion.AlmacenMemoria(60, 100))
+    monkeypatch.setenv('CHAT_SENTIMIENTO', 'lazy')
+    return InnovVentasBot()
+
+
+def test_faq_sin_llamar_al_sentimiento(bot_prueba, monkeypatch):
+    def sin_azure(texto):
+        raise AssertionError('no debe analizarse el sentimiento')
+
+    monkeypatch.setattr(bot_prueba, 'analyze_sentiment', sin_azure)
+    respuesta = bot_prueba._respond('¿Cuáles son las formas de pago?')
+    assert respuesta['intent'] == 'faq' and respuesta['path'] == 'faq'
+    assert bot_prueba.get_stats()['sentiment_calls_skipped'] == 1
+
+
+def test_get_stats_no_comparte_las_rutas(bot_prueba):
+    bot_prueba._count('faq')
+    stats = bot_prueba.get_stats()
+    bot_prueba._count('faq')
+    bot_prueba._count('sentiment', 0.01)
+    # Se serializa fuera del lock: no puede cambiar mientras se recorre
+    assert stats['paths'] == {'faq': 1}
+    assert bot_prueba.get_stats()['paths'] == {'faq': 2, 'sentiment': 1}
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+import resiliencia
+import servicio_directline
+import stub_directline
+from servicio_directline import GestorTokens
+
+SECRETO = 'DLSECRET_prueba'
+
+
+@pytest.fixture
+def directline(monkeypatch):
+    """Direct Line simulado con latencia para que las peticiones coincidan en el tiempo"""
+    servidor, estado = stub_directline.iniciar(0, latencia_ms=100)
+    monkeypatch.setattr(
+        servicio_directline, 'DIRECTLINE_URL', f'http://127.0.0.1:{servidor.server_address[1]}/v3/directline'
+    )
+    monkeypatch.setattr(resiliencia, '_backends', {})
+    monkeypatch.setenv('REINTENTOS_MAX', '0')
+    monkeypatch.setenv('DIRECTLINE_PREGENERADOS', '0')
+    yield estado
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_token_guardado_no_llama_a_direct_line(directline):
+    gestor = GestorTokens()
+    primero, origen = gestor.obtener_token(SECRETO, 'cliente')
+    assert origen == 'generate'
+
+    segundo, origen = gestor.obtener_token(SECRETO, 'cliente')
+    assert origen == 'cache'
+    assert segundo['token'] == primero['token']
+    assert directline.llamadas == {'generate': 1, 'refresh': 0, 'rechazadas': 0}
+
+
+def test_se_renueva_cerca_de_caducar(directline, monkeypatch):
+    monkeypatch.setenv('DIRECTLINE_MARGEN_REFRESCO', '900')
+    directline.expires_in = 600
+    gestor = GestorTokens()
+    primero, _ = gestor.obtener_token(SECRETO, 'cliente')
+
+    # Le quedan menos de DIRECTLINE_MARGEN_REFRESCO segundos: se renueva con /tokens/refresh
+    segundo, origen = gestor.obtener_token(SECRETO, 'cliente')
+    assert origen == 'refresh'
+    assert segundo['token'] != primero['token']
+    assert segundo['conversationId'] == primero['conversationId']
+    assert directline.llamadas['refresh'] == 1
+
+
+def test_peticiones_simultaneas_de_un_cliente_se_agrupan(directline):
+    gestor = GestorTokens()
+    barrera = threading.Barrier(5)
+    tokens = []
+
+    def pedir():
+        barrera.wait()
+        tokens.append(gestor.obtener_token(SECRETO, 'cliente')[0]['token'])
+
+    hilos = [threading.Thread(target=pedir) for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert len(tokens) == 5 and len(set(tokens)) == 1
+    assert directline.llamadas['generate'] == 1
+    assert gestor.metricas()['agrupadas'] == 4
+
+
+def test_cliente_nuevo_usa_un_token_pregenerado(directline, monkeypatch):
+    monkeypatch.setenv('DIRECTLINE_PREGENERADOS', '2')
+    gestor = GestorTokens()
+    gestor.precalentar(SECRETO)
+    limite = time.monotonic() + 5
+    while gestor.metricas()['pregenerados_disponibles'] < 2 and time.monotonic() < limite:
+        time.sleep(0.02)
+    reserva = {entrada[0]['token'] for entrada in gestor._reserva}
+
+    resultado, origen = gestor.obtener_token(SECRETO, 'nuevo')
+    assert origen == 'pregenerado'
+    assert resultado['token'] in reserva
+    assert gestor.metricas()['pregenerados_usados'] == 1
+
+
+def test_solo_se_recuerdan_las_llamadas_del_ultimo_minuto(directline, monkeypatch):
+    gestor = GestorTokens()
+    gestor._llamadas.extend([time.monotonic() - 120] * 1000)
+    gestor.obtener_token(SECRETO, 'cliente')
+    assert len(gestor._llamadas) == 1
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from servicio_language import (
+    _analizar_lote, _dividir_en_lotes, analizar_sentimiento_lote,
+    MAX_DOCUMENTOS_POR_LLAMADA, MAX_CARACTERES_POR_LLAMADA
+)
+
+
+def test_lotes_por_numero_de_documentos():
+    lotes = _dividir_en_lotes([(i, 'hola') for i in range(2 * MAX_DOCUMENTOS_POR_LLAMADA + 3)])
+    assert [len(lote) for lote in lotes] == [MAX_DOCUMENTOS_POR_LLAMADA, MAX_DOCUMENTOS_POR_LLAMADA, 3]
+    assert [indice for lote in lotes for indice, _ in lote] == list(range(2 * MAX_DOCUMENTOS_POR_LLAMADA + 3))
+
+
+def test_lotes_por_caracteres():
+    mitad = 'a' * (MAX_CARACTERES_POR_LLAMADA // 2)
+    lotes = _dividir_en_lotes([(0, mitad), (1, mitad), (2, 'b'), (3, mitad)])
+    assert [[indice for indice, _ in lote] for lote in lotes] == [[0, 1], [2, 3]]
+    # Un texto que supera el límite por sí solo va en su propio lote
+    lotes = _dividir_en_lotes([(0, 'a'), (1, 'a' * (MAX_CARACTERES_POR_LLAMADA + 1)), (2, 'b')])
+    assert [len(lote) for lote in lotes] == [1, 1, 1]
+
+
+def test_respuesta_incompleta_deja_error_por_documento():
+    documento = SimpleNamespace(
+        is_error=False, sentiment='positive',
+        confidence_scores=SimpleNamespace(positive=0.9, neutral=0.1, negative=0.0)
+    )
+    cliente = SimpleNamespace(analyze_sentiment=lambda documents, **opciones: [documento])
+
+    resultados = _analizar_lote(cliente, [(4, 'bien'), (7, 'otro')])
+    assert [indice for indice, _ in resultados] == [4, 7]
+    assert resultados[0][1]['sentimiento'] == 'positive'
+    assert resultados[1][1]['sentimiento'] == 'error'
+
+
+def test_lote_largo_en_varias_llamadas(azure_simulado):
+    textos = [f'texto {i}' for i in range(2 * MAX_DOCUMENTOS_POR_LLAMADA + 1)]
+    textos[5] = ''
+    resultados = analizar_sentimiento_lote(textos)
+    assert len(resultados) == len(textos) and None not in resultados
+    assert resultados[5]['error'] == 'Texto de entrada no válido'
+    # 20 textos válidos: dos llamadas
+    assert azure_simulado.estadisticas()['language'] == {'llamadas': 2, '429': 0, 'errores': 0, 'elementos': 20}
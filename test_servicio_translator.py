@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+
+from servicio_translator import _traducir_lote
+
+
+class ClienteTraduccion:
+    """Cliente falso que devuelve los códigos de idioma normalizados, como Azure"""
+
+    def __init__(self, codigos):
+        self.codigos = codigos
+
+    def translate(self, content, to, **opciones):
+        return [
+            SimpleNamespace(translations=[
+                SimpleNamespace(to=codigo, text=f'{idioma}:{elemento["text"]}')
+                for codigo, idioma in zip(self.codigos, to)
+            ])
+            for elemento in content
+        ]
+
+
+def test_traducciones_se_asocian_por_posicion():
+    cliente = ClienteTraduccion(['EN', 'zh-Hans'])
+    [(indice, celdas)] = _traducir_lote(cliente, [(0, 'hola')], ['en', 'zh-hans'])
+    assert indice == 0
+    assert celdas == {'en': {'traduccion': 'en:hola'}, 'zh-hans': {'traduccion': 'zh-hans:hola'}}
+
+
+def test_traduccion_que_falta_es_error_de_celda():
+    cliente = ClienteTraduccion(['en'])
+    [(_, celdas)] = _traducir_lote(cliente, [(0, 'hola')], ['en', 'fr'])
+    assert celdas['en'] == {'traduccion': 'en:hola'}
+    assert 'error' in celdas['fr']
+
+
+@pytest.mark.parametrize('idiomas', [[['en']], [''], [None], 'en'])
+def test_api_traducir_rechaza_idiomas_no_validos(azure_simulado, idiomas):
+    from main import app
+    respuesta = app.test_client().post('/api/traducir', json={'textos': ['hola'], 'idiomas': idiomas})
+    assert respuesta.status_code == 400
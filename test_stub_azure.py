@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+import resiliencia
+import stub_azure
+from conftest import apuntar_a_servidor
+from servicio_language import analizar_sentimiento, analizar_sentimiento_lote
+from servicio_translator import traducir_textos
+from servicio_vision import describir_imagen
+
+
+@pytest.fixture
+def azure_con_429(azure_simulado, monkeypatch):
+    servidor, estado = stub_azure.iniciar(0, tasa_429=1.0, retry_after=2)
+    apuntar_a_servidor(monkeypatch, servidor)
+    yield estado
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_llamar_respeta_el_retry_after_del_simulador(azure_con_429, monkeypatch):
+    monkeypatch.setenv('REINTENTOS_MAX', '2')
+    esperas = []
+    monkeypatch.setattr(resiliencia.time, 'sleep', esperas.append)
+
+    with pytest.raises(Exception) as error:
+        traducir_textos(['hola'], ['en'], lanzar_errores=True)
+    assert getattr(error.value, 'status_code', None) == 429
+    assert esperas == [2, 2]
+    assert azure_con_429.estadisticas()['translator'] == {'llamadas': 3, '429': 3, 'errores': 0, 'elementos': 0}
+    assert resiliencia.obtener_backend('translator').metricas()['reintentos'] == 2
+
+
+def test_cuota_por_segundo():
+    estado = stub_azure.EstadoAzure(tps=2)
+    codigos = [estado.fallo('language') for _ in range(5)]
+    # Aunque cambie el segundo a mitad de la ráfaga alguna llamada supera la cuota
+    assert codigos.count(429) >= 1
+    assert codigos.count(None) >= 2
+    assert estado.fallo('translator') is None
+
+
+def test_tasa_de_errores():
+    estado = stub_azure.EstadoAzure(tasa_error=1.0)
+    assert estado.fallo('vision') == 500
+    estado.configurar(tasa_error=0)
+    assert estado.fallo('vision') is None
+
+
+# --- Respuestas que entienden los SDK ----------------------------------------------
+
+def test_sentimiento_con_el_sdk(azure_simulado):
+    assert analizar_sentimiento('me encanta')['sentimiento'] == 'positive'
+    resultados = analizar_sentimiento_lote(['odio esperar', 'hola'])
+    assert [r['sentimiento'] for r in resultados] == ['negative', 'neutral']
+    assert azure_simulado.estadisticas()['language']['elementos'] == 3
+
+
+def test_traduccion_con_el_sdk(azure_simulado):
+    resultados = traducir_textos(['hola', 'adiós'], ['en', 'fr'])
+    assert resultados[1]['fr'] == {'traduccion': '[fr] adiós'}
+
+
+def test_descripcion_con_el_sdk(azure_simulado):
+    detalles = {}
+    descripcion = describir_imagen(io.BytesIO(b'no es una imagen'), detalles)
+    # El preprocesado no la entiende y se envía tal cual
+    assert descripcion == 'imagen simulada de 16 bytes'
+    assert 'error' not in detalles
+
+
+def test_api_contra_el_simulador(azure_simulado):
+    from main import app
+    respuesta = app.test_client().post('/api/analizar-sentimiento', json={'texto': 'qué mal'})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['resultado']['sentimiento'] == 'negative'
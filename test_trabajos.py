@@ -0,0 +1,189 @@
+import io
+import socket
+import threading
+import time
+import zipfile
+
+import pytest
+import requests
+
+import trabajos
+from trabajos import ColaLlena, validar_callback, RECIBIENDO, PENDIENTE, EN_CURSO, CANCELADO, COMPLETADO, ERROR
+
+
+def _tomar(almacen, propietario='w1:0', latido_max=300, intentos_max=3):
+    return almacen.tomar(propietario, latido_max, intentos_max)
+
+
+def test_toma_por_prioridad_y_antiguedad(almacen_trabajos):
+    baja = almacen_trabajos.crear('sentimiento', ['a'], prioridad=1)
+    primera = almacen_trabajos.crear('sentimiento', ['b'], prioridad=7)
+    segunda = almacen_trabajos.crear('sentimiento', ['c'], prioridad=7)
+
+    assert [_tomar(almacen_trabajos)['id'] for _ in range(3)] == [primera, segunda, baja]
+    assert _tomar(almacen_trabajos) is None
+
+
+def test_un_trabajo_solo_lo_toma_un_hilo(almacen_trabajos):
+    almacen_trabajos.crear('sentimiento', ['a'])
+    assert _tomar(almacen_trabajos, 'w1:0') is not None
+    assert _tomar(almacen_trabajos, 'w2:0') is None
+
+
+def test_guardar_y_terminar(almacen_trabajos):
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a', 'b'])
+    _tomar(almacen_trabajos)
+    assert almacen_trabajos.guardar(id_trabajo, 'w1:0', [(0, {'sentimiento': 'positivo'})])
+    assert almacen_trabajos.indices_hechos(id_trabajo) == {0}
+    assert almacen_trabajos.obtener(id_trabajo, con_resultados=False)['progreso'] == 1
+
+    assert almacen_trabajos.terminar(id_trabajo, 'w1:0', COMPLETADO)
+    assert almacen_trabajos.obtener(id_trabajo, con_resultados=False)['estado'] == COMPLETADO
+
+
+def test_cancelar_pendiente_y_en_curso(almacen_trabajos):
+    pendiente = almacen_trabajos.crear('sentimiento', ['a'], prioridad=1)
+    en_curso = almacen_trabajos.crear('sentimiento', ['a', 'b'], prioridad=9)
+    _tomar(almacen_trabajos)
+
+    assert almacen_trabajos.cancelar(pendiente) == CANCELADO
+    assert almacen_trabajos.cancelar(en_curso) == EN_CURSO
+    # El hilo se entera al guardar el siguiente trozo
+    assert not almacen_trabajos.guardar(en_curso, 'w1:0', [(0, {})])
+    assert almacen_trabajos.cancelar('no-existe') is None
+
+
+def test_latido_caducado_devuelve_el_trabajo_a_la_cola(almacen_trabajos):
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a', 'b'])
+    _tomar(almacen_trabajos, 'muerto:0')
+    almacen_trabajos.guardar(id_trabajo, 'muerto:0', [(0, {})])
+    time.sleep(0.05)
+
+    trabajo = _tomar(almacen_trabajos, 'vivo:0', latido_max=0.01)
+    assert trabajo['id'] == id_trabajo
+    # Continúa desde el último trozo guardado; el hilo anterior ya no puede escribir
+    assert almacen_trabajos.indices_hechos(id_trabajo) == {0}
+    assert not almacen_trabajos.guardar(id_trabajo, 'muerto:0', [(1, {})])
+    assert not almacen_trabajos.terminar(id_trabajo, 'muerto:0', COMPLETADO)
+
+
+def test_trabajo_interrumpido_demasiadas_veces_falla(almacen_trabajos):
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a'])
+    _tomar(almacen_trabajos, 'w1:0', intentos_max=1)
+    time.sleep(0.05)
+
+    assert _tomar(almacen_trabajos, 'w2:0', latido_max=0.01, intentos_max=1) is None
+    trabajo = almacen_trabajos.obtener(id_trabajo, con_resultados=False)
+    assert trabajo['estado'] == ERROR
+
+
+def test_liberar_no_gasta_un_intento(almacen_trabajos):
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a'])
+    otro = almacen_trabajos.crear('sentimiento', ['b'])
+    _tomar(almacen_trabajos, '1234:0')
+    _tomar(almacen_trabajos, '12345:0')
+
+    assert almacen_trabajos.liberar('1234:') == 1
+    assert almacen_trabajos.obtener(id_trabajo, con_resultados=False)['estado'] == PENDIENTE
+    assert almacen_trabajos.obtener(otro, con_resultados=False)['estado'] == EN_CURSO
+    # Con un solo intento permitido se puede volver a tomar
+    assert _tomar(almacen_trabajos, 'w2:0', intentos_max=1)['id'] == id_trabajo
+
+
+def test_cola_llena(almacen_trabajos):
+    almacen_trabajos.crear('sentimiento', ['a'], pendientes_max=1)
+    with pytest.raises(ColaLlena):
+        almacen_trabajos.crear('sentimiento', ['b'], pendientes_max=1)
+
+
+def test_imagenes_se_guardan_de_una_en_una(almacen_trabajos):
+    leidas = []
+
+    def imagenes():
+        for datos in (b'uno', b'dos'):
+            # Cuando se abre una imagen la anterior ya está guardada
+            leidas.append(len(almacen_trabajos._conexion().execute('SELECT * FROM trabajos_archivos').fetchall()))
+            yield io.BytesIO(datos)
+
+    id_trabajo = almacen_trabajos.crear('imagen', ['a.jpg', 'b.jpg'], archivos=imagenes())
+    assert leidas == [0, 1]
+    assert almacen_trabajos.archivo(id_trabajo, 1) == b'dos'
+    assert _tomar(almacen_trabajos)['id'] == id_trabajo
+
+
+def test_imagenes_a_medias_no_dejan_trabajo(almacen_trabajos):
+    def imagenes():
+        yield b'uno'
+        raise zipfile.BadZipFile('zip cortado')
+
+    with pytest.raises(zipfile.BadZipFile):
+        almacen_trabajos.crear('imagen', ['a.jpg', 'b.jpg'], archivos=imagenes())
+    assert sum(almacen_trabajos.profundidad()['por_estado'].values()) == 0
+    assert _tomar(almacen_trabajos) is None
+
+
+def test_cancelar_mientras_se_guardan_las_imagenes(almacen_trabajos):
+    estados = []
+
+    def cancelar_al_leer():
+        yield b'uno'
+        [(id_trabajo,)] = almacen_trabajos._conexion().execute('SELECT id FROM trabajos').fetchall()
+        estados.append(almacen_trabajos.cancelar(id_trabajo))
+        yield b'dos'
+
+    id_trabajo = almacen_trabajos.crear('imagen', ['a.jpg', 'b.jpg'], archivos=cancelar_al_leer())
+    assert estados == [RECIBIENDO]
+    assert almacen_trabajos.obtener(id_trabajo, con_resultados=False)['estado'] == CANCELADO
+    with pytest.raises(FileNotFoundError):
+        almacen_trabajos.archivo(id_trabajo, 0)
+    assert _tomar(almacen_trabajos) is None
+
+
+def test_purgar_terminados(almacen_trabajos):
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a'])
+    _tomar(almacen_trabajos)
+    almacen_trabajos.terminar(id_trabajo, 'w1:0', COMPLETADO)
+    assert almacen_trabajos.purgar(3600) == 0
+    assert almacen_trabajos.purgar(-1) == 1
+    assert almacen_trabajos.obtener(id_trabajo) is None
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/callback',
+    'http://169.254.169.254/latest/meta-data',
+    'ftp://example.com/callback',
+])
+def test_callbacks_rechazados(url):
+    with pytest.raises(ValueError):
+        validar_callback(url)
+
+
+def test_callback_se_envia_a_la_ip_validada(almacen_trabajos, monkeypatch):
+    # El DNS responde una IP pública al validar y una interna en cualquier consulta posterior
+    consultas = []
+
+    def resolver(host, puerto, *args, **kwargs):
+        consultas.append(host)
+        ip = '93.184.216.34' if len(consultas) == 1 else '169.254.169.254'
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (ip, puerto))]
+
+    enviadas = []
+
+    def enviar(sesion, peticion, **kwargs):
+        enviadas.append((peticion, sesion.get_adapter(peticion.url)))
+        respuesta = requests.Response()
+        respuesta.status_code = 204
+        return respuesta
+
+    monkeypatch.setattr(trabajos.socket, 'getaddrinfo', resolver)
+    monkeypatch.setattr(requests.Session, 'send', enviar)
+    url = 'https://cliente.example:8443/avisos'
+    id_trabajo = almacen_trabajos.crear('sentimiento', ['a'], callback=url)
+    trabajos._enviar_callback(almacen_trabajos, id_trabajo, url, threading.Event())
+
+    [(peticion, adaptador)] = enviadas
+    assert peticion.url == 'https://93.184.216.34:8443/avisos'
+    assert peticion.headers['Host'] == 'cliente.example:8443'
+    assert adaptador.poolmanager.connection_pool_kw['assert_hostname'] == 'cliente.example'
+    assert consultas == ['cliente.example']
+    assert almacen_trabajos.obtener(id_trabajo)['callback']['estado'] == 'entregado'
@@ -0,0 +1,916 @@
+# === TRABAJOS EN SEGUNDO PLANO ===
+"""
+Cola persistente de trabajos largos (sentimiento, traducción y análisis de
+imágenes) para no ocupar un hilo de gunicorn durante minutos.
+
+El cliente envía el trabajo a POST /api/jobs y recibe su id al momento. La
+cola vive en un archivo SQLite compartido por todos los workers del host:
+cada worker arranca unos pocos hilos que toman el trabajo pendiente de mayor
+prioridad (y, a igual prioridad, el más antiguo), lo procesan por trozos y
+guardan los resultados de cada trozo. El cliente consulta el estado y los
+resultados en GET /api/jobs/<id> o recibe el trabajo terminado en la URL de
+callback que indicó.
+
+Mientras procesa un trabajo, el hilo renueva su latido al guardar cada
+trozo. Si un worker muere, otro recupera sus trabajos cuando el latido
+caduca y continúa desde el último trozo guardado.
+
+Variables de entorno:
+    TRABAJOS_RUTA: Archivo SQLite de la cola (por defecto:
+        trabajos.sqlite3 en el directorio temporal)
+    TRABAJOS_HILOS: Hilos que procesan trabajos en cada worker; '0' no
+        procesa ninguno en el servidor web (por defecto: 2)
+    TRABAJOS_SONDEO_MS: Cada cuánto busca trabajo un hilo desocupado
+        (por defecto: 1000)
+    TRABAJOS_LOTE: Textos por trozo (por defecto: 100)
+    TRABAJOS_PLAZO_S: Plazo de las llamadas a Azure de cada trozo
+        (por defecto: 60)
+    TRABAJOS_LATIDO_S: Segundos sin latido tras los que otro worker
+        recupera un trabajo en curso (por defecto: 300)
+    TRABAJOS_INTENTOS_MAX: Veces que se empieza un trabajo antes de darlo
+        por fallido (por defecto: 3)
+    TRABAJOS_PENDIENTES_MAX: Trabajos pendientes como máximo; con la cola
+        llena se responde 503 (por defecto: 1000)
+    TRABAJOS_RETENCION_S: Tiempo que se guardan los trabajos terminados
+        (por defecto: 86400)
+    TRABAJOS_CALLBACK_SECRETO: Si se define, cada callback lleva la firma
+        HMAC-SHA256 del cuerpo en la cabecera X-Firma-Trabajo
+    TRABAJOS_CALLBACK_PERMITIDOS: Hosts (separados por comas) a los que se
+        permiten callbacks; sin ella se admite cualquier host con IP pública
+"""
+import io
+import os
+import hmac
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import ipaddress
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import Indicador, TRABAJOS_DURACION, TRABAJOS_ESPERA
+from resiliencia import plazo
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('sentimiento', 'traduccion', 'imagen')
+
+# Trabajo con imágenes que todavía se están guardando: aún no se puede tomar
+RECIBIENDO = 'recibiendo'
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+TERMINADOS = (COMPLETADO, ERROR, CANCELADO)
+
+PRIORIDAD_POR_DEFECTO = 5
+
+
+class ColaLlena(Exception):
+    """La cola tiene ya TRABAJOS_PENDIENTES_MAX trabajos pendientes"""
+
+    def __init__(self, pendientes):
+        super().__init__(f'La cola de trabajos está llena ({pendientes} pendientes)')
+        self.pendientes = pendientes
+
+
+def _ahora_iso(instante):
+    if instante is None:
+        return None
+    return datetime.fromtimestamp(instante, timezone.utc).isoformat(timespec='seconds')
+
+
+class AlmacenTrabajos:
+    """Cola de trabajos en un archivo SQLite compartido por todos los workers del host"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS trabajos ('
+                'id TEXT PRIMARY KEY, tipo TEXT NOT NULL, estado TEXT NOT NULL, '
+                'prioridad INTEGER NOT NULL, entrada TEXT NOT NULL, opciones TEXT NOT NULL, '
+                'total INTEGER NOT NULL, progreso INTEGER NOT NULL DEFAULT 0, error TEXT, '
+                'callback TEXT, callback_estado TEXT, propietario TEXT, '
+                'intentos INTEGER NOT NULL DEFAULT 0, cancelar INTEGER NOT NULL DEFAULT 0, '
+                'creado REAL NOT NULL, iniciado REAL, terminado REAL, latido REAL)'
+            )
+            conexion.execute('CREATE INDEX IF NOT EXISTS trabajos_cola ON trabajos (estado, prioridad DESC, creado)')
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS trabajos_resultados ('
+                'trabajo TEXT NOT NULL, indice INTEGER NOT NULL, datos TEXT NOT NULL, '
+                'PRIMARY KEY (trabajo, indice))'
+            )
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS trabajos_archivos ('
+                'trabajo TEXT NOT NULL, indice INTEGER NOT NULL, datos BLOB NOT NULL, '
+                'PRIMARY KEY (trabajo, indice))'
+            )
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def _transaccion(self, funcion, *args):
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer: dos
+        # hilos no pueden tomar el mismo trabajo
+        conexion = self._conexion()
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            resultado = funcion(conexion, *args)
+            conexion.execute('COMMIT')
+            return resultado
+        except BaseException:
+            conexion.execute('ROLLBACK')
+            raise
+
+    def crear(self, tipo, entrada, opciones=None, prioridad=PRIORIDAD_POR_DEFECTO,
+              callback=None, archivos=None, pendientes_max=None):
+        """
+        Añade un trabajo a la cola.
+
+        Args:
+            tipo (str): 'sentimiento', 'traduccion' o 'imagen'
+            entrada (list): Textos, o nombres de las imágenes
+            opciones (dict): Opciones del tipo de trabajo (p. ej. idiomas)
+            prioridad (int): 0 a 9; los de mayor prioridad salen antes
+            callback (str): URL a la que se envía el trabajo terminado
+            archivos: Iterable con el contenido de las imágenes (bytes o archivos
+                abiertos), en el orden de `entrada`; se consume de uno en uno
+            pendientes_max (int): Rechaza el trabajo si ya hay tantos pendientes
+
+        Returns:
+            str: Id del trabajo
+
+        Raises:
+            ColaLlena: Si la cola ya tiene `pendientes_max` trabajos pendientes
+        """
+        id_trabajo = uuid.uuid4().hex
+
+        def insertar(conexion):
+            if pendientes_max is not None:
+                pendientes = conexion.execute(
+                    'SELECT COUNT(*) FROM trabajos WHERE estado IN (?, ?)', (PENDIENTE, RECIBIENDO)
+                ).fetchone()[0]
+                if pendientes >= pendientes_max:
+                    raise ColaLlena(pendientes)
+            conexion.execute(
+                'INSERT INTO trabajos (id, tipo, estado, prioridad, entrada, opciones, total, callback, creado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (id_trabajo, tipo, PENDIENTE if archivos is None else RECIBIENDO, prioridad,
+                 json.dumps(entrada, ensure_ascii=False), json.dumps(opciones or {}), len(entrada),
+                 callback, time.time())
+            )
+
+        self._transaccion(insertar)
+        if archivos is None:
+            return id_trabajo
+
+        conexion = self._conexion()
+        try:
+            # Cada imagen se lee (o se descomprime) y se guarda por separado:
+            # en memoria hay una sola y el bloqueo de escritura dura un INSERT
+            for indice, datos in enumerate(archivos):
+                if hasattr(datos, 'read'):
+                    datos = datos.read()
+                conexion.execute(
+                    'INSERT INTO trabajos_archivos (trabajo, indice, datos) VALUES (?, ?, ?)',
+                    (id_trabajo, indice, datos)
+                )
+                del datos
+        except BaseException:
+            self._transaccion(self._borrar, id_trabajo)
+            raise
+        self._transaccion(self._abrir, id_trabajo)
+        return id_trabajo
+
+    @staticmethod
+    def _abrir(conexion, id_trabajo):
+        # Si se canceló mientras se guardaban sus imágenes ya no se procesa
+        if conexion.execute('SELECT cancelar FROM trabajos WHERE id = ?', (id_trabajo,)).fetchone()['cancelar']:
+            conexion.execute(
+                'UPDATE trabajos SET estado = ?, terminado = ? WHERE id = ?', (CANCELADO, time.time(), id_trabajo)
+            )
+            conexion.execute('DELETE FROM trabajos_archivos WHERE trabajo = ?', (id_trabajo,))
+        else:
+            conexion.execute('UPDATE trabajos SET estado = ? WHERE id = ?', (PENDIENTE, id_trabajo))
+
+    @staticmethod
+    def _borrar(conexion, id_trabajo):
+        conexion.execute('DELETE FROM trabajos_resultados WHERE trabajo = ?', (id_trabajo,))
+        conexion.execute('DELETE FROM trabajos_archivos WHERE trabajo = ?', (id_trabajo,))
+        conexion.execute('DELETE FROM trabajos WHERE id = ?', (id_trabajo,))
+
+    def tomar(self, propietario, latido_max, intentos_max):
+        """
+        Marca como en curso el siguiente trabajo y lo devuelve. Antes
+        devuelve a la cola los trabajos cuyo latido ha caducado.
+
+        Args:
+            propietario (str): Identificador del hilo que lo procesará
+            latido_max (float): Segundos sin latido tras los que se recupera un trabajo
+            intentos_max (int): Intentos tras los que un trabajo recuperado se da por fallido
+
+        Returns:
+            dict o None: Trabajo tomado (id, tipo, entrada, opciones, creado)
+        """
+        def tomar_siguiente(conexion):
+            ahora = time.time()
+            caducados = conexion.execute(
+                'SELECT id, intentos FROM trabajos WHERE estado = ? AND latido < ?',
+                (EN_CURSO, ahora - latido_max)
+            ).fetchall()
+            for fila in caducados:
+                if fila['intentos'] >= intentos_max:
+                    conexion.execute(
+                        'UPDATE trabajos SET estado = ?, error = ?, propietario = NULL, terminado = ? WHERE id = ?',
+                        (ERROR, f"El trabajo se interrumpió {fila['intentos']} veces", ahora, fila['id'])
+                    )
+                    conexion.execute('DELETE FROM trabajos_archivos WHERE trabajo = ?', (fila['id'],))
+                else:
+                    conexion.execute(
+                        'UPDATE trabajos SET estado = ?, propietario = NULL WHERE id = ?', (PENDIENTE, fila['id'])
+                    )
+            if caducados:
+                logger.warning("Se recuperaron %d trabajos sin latido", len(caducados))
+
+            fila = conexion.execute(
+                'SELECT id, tipo, entrada, opciones, creado FROM trabajos WHERE estado = ? '
+                'ORDER BY prioridad DESC, creado LIMIT 1', (PENDIENTE,)
+            ).fetchone()
+            if fila is None:
+                return None
+            conexion.execute(
+                'UPDATE trabajos SET estado = ?, propietario = ?, intentos = intentos + 1, '
+                'iniciado = COALESCE(iniciado, ?), latido = ? WHERE id = ?',
+                (EN_CURSO, propietario, ahora, ahora, fila['id'])
+            )
+            return {
+                'id': fila['id'],
+                'tipo': fila['tipo'],
+                'entrada': json.loads(fila['entrada']),
+                'opciones': json.loads(fila['opciones']),
+                'creado': fila['creado'],
+            }
+
+        return self._transaccion(tomar_siguiente)
+
+    def guardar(self, id_trabajo, propietario, resultados):
+        """
+        Guarda los resultados de un trozo y renueva el latido del trabajo.
+
+        Args:
+            id_trabajo (str): Id del trabajo
+            propietario (str): Hilo que lo procesa
+            resultados (list): Pares (índice, resultado)
+
+        Returns:
+            bool: False si hay que dejar de procesarlo (se pidió cancelarlo
+            o ya lo ha recuperado otro worker)
+        """
+        def guardar_trozo(conexion):
+            fila = conexion.execute(
+                'SELECT propietario, cancelar FROM trabajos WHERE id = ?', (id_trabajo,)
+            ).fetchone()
+            if fila is None or fila['propietario'] != propietario:
+                return False
+            conexion.executemany(
+                'INSERT OR REPLACE INTO trabajos_resultados (trabajo, indice, datos) VALUES (?, ?, ?)',
+                ((id_trabajo, indice, json.dumps(resultado, ensure_ascii=False)) for indice, resultado in resultados)
+            )
+            conexion.execute(
+                'UPDATE trabajos SET latido = ?, progreso = '
+                '(SELECT COUNT(*) FROM trabajos_resultados WHERE trabajo = ?) WHERE id = ?',
+                (time.time(), id_trabajo, id_trabajo)
+            )
+            return not fila['cancelar']
+
+        return self._transaccion(guardar_trozo)
+
+    def terminar(self, id_trabajo, propietario, estado, error=None):
+        """
+        Marca un trabajo en curso como terminado y borra sus imágenes.
+
+        Returns:
+            bool: False si el trabajo ya no pertenecía a `propietario`
+        """
+        def marcar(conexion):
+            cursor = conexion.execute(
+                'UPDATE trabajos SET estado = ?, error = ?, terminado = ?, propietario = NULL '
+                'WHERE id = ? AND propietario = ?',
+                (estado, error, time.time(), id_trabajo, propietario)
+            )
+            if cursor.rowcount:
+                conexion.execute('DELETE FROM trabajos_archivos WHERE trabajo = ?', (id_trabajo,))
+            return cursor.rowcount > 0
+
+        return self._transaccion(marcar)
+
+    def cancelar(self, id_trabajo):
+        """
+        Cancela un trabajo. Uno pendiente se cancela al momento; uno en curso
+        se detiene al terminar el trozo que está procesando y uno cuyas
+        imágenes aún se están guardando, al terminar de guardarlas.
+
+        Returns:
+            str o None: Estado del trabajo tras la petición, o None si no existe
+        """
+        def marcar(conexion):
+            fila = conexion.execute('SELECT estado FROM trabajos WHERE id = ?', (id_trabajo,)).fetchone()
+            if fila is None:
+                return None
+            if fila['estado'] == PENDIENTE:
+                conexion.execute(
+                    'UPDATE trabajos SET estado = ?, terminado = ? WHERE id = ?', (CANCELADO, time.time(), id_trabajo)
+                )
+                conexion.execute('DELETE FROM trabajos_archivos WHERE trabajo = ?', (id_trabajo,))
+                return CANCELADO
+            if fila['estado'] in (EN_CURSO, RECIBIENDO):
+                conexion.execute('UPDATE trabajos SET cancelar = 1 WHERE id = ?', (id_trabajo,))
+            return fila['estado']
+
+        return self._transaccion(marcar)
+
+    def liberar(self, prefijo):
+        """
+        Devuelve a la cola los trabajos en curso de los hilos cuyo
+        propietario empieza por `prefijo`, sin gastar un intento.
+
+        Returns:
+            int: Trabajos devueltos
+        """
+        def devolver(conexion):
+            return conexion.execute(
+                'UPDATE trabajos SET estado = ?, propietario = NULL, intentos = MAX(intentos - 1, 0) '
+                'WHERE estado = ? AND substr(propietario, 1, ?) = ?',
+                (PENDIENTE, EN_CURSO, len(prefijo), prefijo)
+            ).rowcount
+
+        return self._transaccion(devolver)
+
+    def purgar(self, retencion):
+        """
+        Borra los trabajos terminados hace más de `retencion` segundos y los
+        que se quedaron a medio recibir (el proceso murió mientras se guardaban)
+        """
+        def borrar(conexion):
+            limite = time.time() - retencion
+            ids = [fila['id'] for fila in conexion.execute(
+                f"SELECT id FROM trabajos WHERE (estado IN ({', '.join('?' * len(TERMINADOS))}) AND terminado < ?) "
+                "OR (estado = ? AND creado < ?)",
+                (*TERMINADOS, limite, RECIBIENDO, limite)
+            )]
+            for id_trabajo in ids:
+                self._borrar(conexion, id_trabajo)
+            return len(ids)
+
+        return self._transaccion(borrar)
+
+    def archivo(self, id_trabajo, indice):
+        """Devuelve el contenido de una imagen de un trabajo"""
+        fila = self._conexion().execute(
+            'SELECT datos FROM trabajos_archivos WHERE trabajo = ? AND indice = ?', (id_trabajo, indice)
+        ).fetchone()
+        if fila is None:
+            raise FileNotFoundError(f'La imagen {indice} del trabajo {id_trabajo} ya no existe')
+        return fila['datos']
+
+    def indices_hechos(self, id_trabajo):
+        """Devuelve los índices de entrada que ya tienen resultado guardado"""
+        return {fila[0] for fila in self._conexion().execute(
+            'SELECT indice FROM trabajos_resultados WHERE trabajo = ?', (id_trabajo,)
+        )}
+
+    def marcar_callback(self, id_trabajo, estado):
+        """Guarda cómo terminó el envío del callback de un trabajo"""
+        self._conexion().execute('UPDATE trabajos SET callback_estado = ? WHERE id = ?', (estado, id_trabajo))
+
+    def obtener(self, id_trabajo, con_resultados=True):
+        """
+        Devuelve la vista pública de un trabajo.
+
+        Args:
+            id_trabajo (str): Id del trabajo
+            con_resultados (bool): Incluir los resultados guardados hasta ahora
+
+        Returns:
+            dict o None: Estado, progreso, posición en la cola y resultados
+        """
+        conexion = self._conexion()
+        fila = conexion.execute('SELECT * FROM trabajos WHERE id = ?', (id_trabajo,)).fetchone()
+        if fila is None:
+            return None
+
+        vista = {
+            'id': fila['id'],
+            'tipo': fila['tipo'],
+            'estado': fila['estado'],
+            'prioridad': fila['prioridad'],
+            'progreso': fila['progreso'],
+            'total': fila['total'],
+            'creado': _ahora_iso(fila['creado']),
+            'iniciado': _ahora_iso(fila['iniciado']),
+            'terminado': _ahora_iso(fila['terminado']),
+        }
+        if fila['estado'] == PENDIENTE:
+            # Trabajos que saldrán antes que este
+            vista['posicion'] = conexion.execute(
+                'SELECT COUNT(*) FROM trabajos WHERE estado = ? AND '
+                '(prioridad > ? OR (prioridad = ? AND creado < ?))',
+                (PENDIENTE, fila['prioridad'], fila['prioridad'], fila['creado'])
+            ).fetchone()[0] + 1
+        if fila['estado'] in (EN_CURSO, RECIBIENDO) and fila['cancelar']:
+            vista['cancelando'] = True
+        if fila['error']:
+            vista['error'] = fila['error']
+        if fila['callback']:
+            vista['callback'] = {'url': fila['callback'], 'estado': fila['callback_estado']}
+        if fila['tipo'] == 'traduccion':
+            vista['idiomas'] = json.loads(fila['opciones']).get('idiomas', [])
+        if con_resultados:
+            vista['resultados'] = [
+                json.loads(datos) for (datos,) in conexion.execute(
+                    'SELECT datos FROM trabajos_resultados WHERE trabajo = ? ORDER BY indice', (id_trabajo,)
+                )
+            ]
+        return vista
+
+    def profundidad(self):
+        """
+        Devuelve el estado de la cola.
+
+        Returns:
+            dict: Trabajos por estado, pendientes por prioridad y antigüedad
+            (en segundos) del pendiente más antiguo
+        """
+        conexion = self._conexion()
+        por_estado = {estado: 0 for estado in (RECIBIENDO, PENDIENTE, EN_CURSO) + TERMINADOS}
+        por_estado.update(conexion.execute('SELECT estado, COUNT(*) FROM trabajos GROUP BY estado').fetchall())
+        por_prioridad = dict(conexion.execute(
+            'SELECT prioridad, COUNT(*) FROM trabajos WHERE estado = ? GROUP BY prioridad ORDER BY prioridad DESC',
+            (PENDIENTE,)
+        ).fetchall())
+        mas_antiguo = conexion.execute(
+            'SELECT MIN(creado) FROM trabajos WHERE estado = ?', (PENDIENTE,)
+        ).fetchone()[0]
+        return {
+            'por_estado': por_estado,
+            'pendientes_por_prioridad': {str(prioridad): total for prioridad, total in por_prioridad.items()},
+            'espera_max_s': round(time.time() - mas_antiguo, 1) if mas_antiguo is not None else 0.0,
+        }
+
+
+# --- Callbacks ---------------------------------------------------------------------
+
+def validar_callback(url):
+    """
+    Comprueba que se puede enviar un callback a `url`: http(s) y un host
+    permitido, o que solo resuelva a IPs públicas (nunca a la red interna
+    de App Service ni al servicio de metadatos).
+
+    Returns:
+        str o None: IP comprobada a la que hay que conectarse, o None si el
+        host está en TRABAJOS_CALLBACK_PERMITIDOS
+
+    Raises:
+        ValueError: Si la URL no se admite
+    """
+    partes = urlsplit(url)
+    if partes.scheme not in ('http', 'https') or not partes.hostname:
+        raise ValueError('La URL de callback debe ser http o https')
+
+    permitidos = {host.strip().lower() for host in os.getenv('TRABAJOS_CALLBACK_PERMITIDOS', '').split(',') if host.strip()}
+    if permitidos:
+        if partes.hostname.lower() not in permitidos:
+            raise ValueError(f"El host '{partes.hostname}' no está en TRABAJOS_CALLBACK_PERMITIDOS")
+        return None
+
+    try:
+        direcciones = socket.getaddrinfo(partes.hostname, partes.port or (443 if partes.scheme == 'https' else 80))
+    except socket.gaierror:
+        raise ValueError(f"No se pudo resolver el host '{partes.hostname}'")
+    for *_, direccion in direcciones:
+        if not ipaddress.ip_address(direccion[0].split('%')[0]).is_global:
+            raise ValueError(f"El host '{partes.hostname}' no tiene una IP pública")
+    return direcciones[0][4][0]
+
+
+class _AdaptadorHostFijo(HTTPAdapter):
+    """Conecta por HTTPS a una IP pero valida el certificado (y envía el SNI) del host original"""
+
+    def __init__(self, host, **kwargs):
+        self._host = host
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['server_hostname'] = self._host
+        kwargs['assert_hostname'] = self._host
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _publicar(url, ip, cuerpo, cabeceras):
+    """
+    Envía el callback conectándose a la IP ya validada: si `requests` volviera
+    a resolver el host, un DNS que cambia entre las dos consultas (DNS
+    rebinding) lo llevaría a la red interna o al servicio de metadatos.
+    """
+    if ip is None:
+        return requests.post(url, data=cuerpo, headers=cabeceras, timeout=10, allow_redirects=False)
+
+    partes = urlsplit(url)
+    destino = f'[{ip}]' if ':' in ip else ip
+    host = partes.hostname if partes.port is None else f'{partes.hostname}:{partes.port}'
+    if partes.port is not None:
+        destino += f':{partes.port}'
+    auth = (partes.username, partes.password or '') if partes.username else None
+    with requests.Session() as sesion:
+        # Sin proxies del entorno: el adaptador solo fija el host en las conexiones directas
+        sesion.trust_env = False
+        if partes.scheme == 'https':
+            sesion.mount('https://', _AdaptadorHostFijo(partes.hostname))
+        return sesion.post(
+            partes._replace(netloc=destino).geturl(), data=cuerpo, headers=dict(cabeceras, Host=host),
+            auth=auth, timeout=10, allow_redirects=False
+        )
+
+
+def _enviar_callback(almacen, id_trabajo, url, parar, intentos=3):
+    vista = almacen.obtener(id_trabajo)
+    cuerpo = json.dumps(vista, ensure_ascii=False).encode('utf-8')
+    cabeceras = {'Content-Type': 'application/json', 'X-Trabajo-Id': id_trabajo}
+    secreto = os.getenv('TRABAJOS_CALLBACK_SECRETO')
+    if secreto:
+        cabeceras['X-Firma-Trabajo'] = 'sha256=' + hmac.new(secreto.encode('utf-8'), cuerpo, hashlib.sha256).hexdigest()
+
+    estado = None
+    for intento in range(intentos):
+        try:
+            # Se vuelve a validar: el DNS del host puede haber cambiado desde el envío
+            respuesta = _publicar(url, validar_callback(url), cuerpo, cabeceras)
+            estado = f'HTTP {respuesta.status_code}'
+            if respuesta.status_code < 300:
+                almacen.marcar_callback(id_trabajo, 'entregado')
+                return
+            if respuesta.status_code < 500 and respuesta.status_code != 429:
+                break
+        except ValueError as e:
+            estado = str(e)
+            break
+        except requests.RequestException as e:
+            estado = type(e).__name__
+        if intento + 1 < intentos and parar.wait(2 ** intento):
+            break
+
+    logger.warning("No se pudo entregar el callback del trabajo %s: %s", id_trabajo, estado)
+    almacen.marcar_callback(id_trabajo, f'fallido: {estado}')
+
+
+# --- Ejecución ---------------------------------------------------------------------
+
+def _trozos(elementos, tamano):
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+
+def _pasos_sentimiento(almacen, trabajo, hechos, config):
+    from servicio_language import analizar_sentimiento_lote
+
+    textos = trabajo['entrada']
+    for indices in _trozos([i for i in range(len(textos)) if i not in hechos], config['lote']):
+        with plazo(config['plazo']):
+            resultados = analizar_sentimiento_lote([textos[i] for i in indices])
+        yield list(zip(indices, resultados))
+
+
+def _pasos_traduccion(almacen, trabajo, hechos, config):
+    from servicio_translator import traducir_textos
+
+    textos = trabajo['entrada']
+    idiomas = trabajo['opciones']['idiomas']
+    # El trozo se mide en traducciones (textos x idiomas)
+    tamano = max(1, config['lote'] // len(idiomas))
+    for indices in _trozos([i for i in range(len(textos)) if i not in hechos], tamano):
+        with plazo(config['plazo']):
+            filas = traducir_textos([textos[i] for i in indices], idiomas)
+        yield list(zip(indices, filas))
+
+
+def _pasos_imagen(almacen, trabajo, hechos, config):
+    from servicio_vision import describir_imagenes
+
+    nombres = trabajo['entrada']
+    pendientes = [i for i in range(len(nombres)) if i not in hechos]
+    # Cada imagen se lee de la cola solo cuando un hilo la va a analizar
+    imagenes = [
+        (nombres[i], lambda i=i: io.BytesIO(almacen.archivo(trabajo['id'], i)))
+        for i in pendientes
+    ]
+    for resultado in describir_imagenes(imagenes, concurrencia=config['imagen_concurrencia'],
+                                        timeout=config['imagen_timeout']):
+        resultado['indice'] = pendientes[resultado['indice']]
+        yield [(resultado['indice'], resultado)]
+
+
+_PASOS = {
+    'sentimiento': _pasos_sentimiento,
+    'traduccion': _pasos_traduccion,
+    'imagen': _pasos_imagen,
+}
+
+
+def _leer_config():
+    return {
+        'hilos': int(os.getenv('TRABAJOS_HILOS', '2')),
+        'sondeo': float(os.getenv('TRABAJOS_SONDEO_MS', '1000')) / 1000.0,
+        'lote': max(1, int(os.getenv('TRABAJOS_LOTE', '100'))),
+        'plazo': float(os.getenv('TRABAJOS_PLAZO_S', '60')),
+        'latido_max': float(os.getenv('TRABAJOS_LATIDO_S', '300')),
+        'intentos_max': int(os.getenv('TRABAJOS_INTENTOS_MAX', '3')),
+        'retencion': float(os.getenv('TRABAJOS_RETENCION_S', '86400')),
+        'imagen_concurrencia': int(os.getenv('IMAGEN_LOTE_CONCURRENCIA', '4')),
+        'imagen_timeout': float(os.getenv('IMAGEN_LOTE_TIMEOUT', '30')),
+    }
+
+
+class ProcesadorTrabajos:
+    """
+    Hilos de un proceso que toman trabajos de la cola y los ejecutan.
+
+    Args:
+        almacen (AlmacenTrabajos): Cola de la que se toman los trabajos
+        config (dict): Configuración leída de las variables TRABAJOS_*
+    """
+
+    def __init__(self, almacen, config):
+        self.almacen = almacen
+        self.config = config
+        self.prefijo = f'{socket.gethostname()}:{os.getpid()}:'
+        self._parar = threading.Event()
+        self._despertar = threading.Event()
+        self._ultima_purga = 0.0
+        self._hilos = [
+            threading.Thread(target=self._bucle, name=f'trabajos-{i}', daemon=True)
+            for i in range(config['hilos'])
+        ]
+        self._callbacks = ThreadPoolExecutor(max_workers=2, thread_name_prefix='trabajos-callback')
+
+    def iniciar(self):
+        for hilo in self._hilos:
+            hilo.start()
+        logger.info("Procesando trabajos con %d hilos", len(self._hilos))
+
+    def despertar(self):
+        """Avisa a los hilos desocupados de que hay un trabajo nuevo"""
+        self._despertar.set()
+
+    def detener(self, espera=1.0):
+        """
+        Detiene los hilos y devuelve a la cola los trabajos que no hayan
+        terminado en `espera` segundos.
+        """
+        self._parar.set()
+        self._despertar.set()
+        limite = time.monotonic() + espera
+        for hilo in self._hilos:
+            if hilo.is_alive():
+                hilo.join(max(0.0, limite - time.monotonic()))
+        try:
+            devueltos = self.almacen.liberar(self.prefijo)
+        except sqlite3.Error as e:
+            logger.warning("No se pudieron devolver los trabajos a la cola: %s", e)
+            devueltos = 0
+        if devueltos:
+            logger.info("Se devolvieron %d trabajos a la cola", devueltos)
+        self._callbacks.shutdown(wait=False)
+
+    def _bucle(self):
+        propietario = self.prefijo + threading.current_thread().name
+        while not self._parar.is_set():
+            try:
+                self._purgar()
+                trabajo = self.almacen.tomar(propietario, self.config['latido_max'], self.config['intentos_max'])
+            except sqlite3.Error as e:
+                logger.warning("Error al leer la cola de trabajos: %s", e)
+                trabajo = None
+            if trabajo is None:
+                self._despertar.wait(self.config['sondeo'])
+                self._despertar.clear()
+                continue
+            try:
+                self._ejecutar(trabajo, propietario)
+            except sqlite3.Error as e:
+                # El latido caducará y otro hilo lo recuperará
+                logger.warning("Error al guardar el trabajo %s: %s", trabajo['id'], e)
+
+    def _purgar(self):
+        ahora = time.monotonic()
+        if ahora - self._ultima_purga < 60:
+            return
+        self._ultima_purga = ahora
+        borrados = self.almacen.purgar(self.config['retencion'])
+        if borrados:
+            logger.info("Se borraron %d trabajos antiguos", borrados)
+
+    def _ejecutar(self, trabajo, propietario):
+        inicio = time.time()
+        TRABAJOS_ESPERA.observar(max(0.0, inicio - trabajo['creado']), trabajo['tipo'])
+        estado, error = COMPLETADO, None
+        try:
+            hechos = self.almacen.indices_hechos(trabajo['id'])
+            for resultados in _PASOS[trabajo['tipo']](self.almacen, trabajo, hechos, self.config):
+                if not self.almacen.guardar(trabajo['id'], propietario, resultados) or self._parar.is_set():
+                    estado = CANCELADO
+                    break
+        except Exception as e:
+            logger.exception("Error al procesar el trabajo %s", trabajo['id'])
+            estado, error = ERROR, f'Error al procesar el trabajo: {str(e)}'
+
+        if self._parar.is_set():
+            # El worker se está deteniendo: `detener` lo devuelve a la cola
+            return
+        if not self.almacen.terminar(trabajo['id'], propietario, estado, error):
+            # Otro worker lo recuperó al caducar el latido
+            logger.warning("El trabajo %s pasó a otro worker", trabajo['id'])
+            return
+
+        TRABAJOS_DURACION.observar(time.time() - inicio, trabajo['tipo'], estado)
+        logger.info("Trabajo terminado", extra={'trabajo': trabajo['id'], 'tipo': trabajo['tipo'], 'estado': estado})
+        vista = self.almacen.obtener(trabajo['id'], con_resultados=False)
+        if vista and 'callback' in vista:
+            self._callbacks.submit(_enviar_callback, self.almacen, trabajo['id'], vista['callback']['url'], self._parar)
+
+
+# --- Instancias del proceso --------------------------------------------------------
+
+_almacen = None
+_procesador = None
+_lock = threading.Lock()
+_lock_procesador = threading.Lock()
+
+
+def _ruta():
+    return os.getenv('TRABAJOS_RUTA') or os.path.join(tempfile.gettempdir(), 'trabajos.sqlite3')
+
+
+def obtener_almacen():
+    """
+    Devuelve la cola de trabajos, creándola la primera vez.
+
+    Returns:
+        AlmacenTrabajos
+    """
+    global _almacen
+    if _almacen is not None:
+        return _almacen
+
+    with _lock:
+        if _almacen is None:
+            _almacen = AlmacenTrabajos(_ruta())
+    return _almacen
+
+
+def iniciar_procesador():
+    """
+    Arranca los hilos que procesan trabajos en este proceso (una sola vez
+    por proceso). Con TRABAJOS_HILOS=0 no arranca ninguno.
+
+    Returns:
+        ProcesadorTrabajos o None
+    """
+    global _procesador
+    if _procesador is not None:
+        return _procesador
+
+    config = _leer_config()
+    if config['hilos'] <= 0:
+        return None
+    almacen = obtener_almacen()
+    with _lock_procesador:
+        if _procesador is None:
+            procesador = ProcesadorTrabajos(almacen, config)
+            procesador.iniciar()
+            _procesador = procesador
+    return _procesador
+
+
+def detener_procesador():
+    """Detiene los hilos de este proceso y devuelve sus trabajos a la cola"""
+    if _procesador is not None:
+        _procesador.detener()
+
+
+def encolar(tipo, entrada, opciones=None, prioridad=PRIORIDAD_POR_DEFECTO, callback=None, archivos=None):
+    """
+    Valida y añade un trabajo a la cola, y despierta a los hilos de este proceso.
+
+    Args:
+        tipo (str): 'sentimiento', 'traduccion' o 'imagen'
+        entrada (list): Textos, o nombres de las imágenes
+        opciones (dict): {'idiomas': [...]} para las traducciones
+        prioridad (int): 0 a 9 (por defecto: 5)
+        callback (str): URL a la que se envía el trabajo terminado
+        archivos: Iterable con el contenido de las imágenes (bytes o archivos
+            abiertos), que se guardan de una en una
+
+    Returns:
+        str: Id del trabajo
+
+    Raises:
+        ValueError: Si el trabajo no es válido
+        ColaLlena: Si hay demasiados trabajos pendientes
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de trabajo no válido: {tipo!r} (se admite {', '.join(TIPOS)})")
+    if not isinstance(entrada, list) or not entrada:
+        raise ValueError('El trabajo no tiene elementos que procesar')
+    if isinstance(prioridad, bool) or not isinstance(prioridad, int) or not 0 <= prioridad <= 9:
+        raise ValueError('La prioridad debe ser un entero entre 0 y 9')
+    if tipo == 'traduccion':
+        idiomas = (opciones or {}).get('idiomas')
+        if not isinstance(idiomas, list) or not idiomas or not all(isinstance(i, str) and i for i in idiomas):
+            raise ValueError('No se proporcionó una lista de idiomas de destino')
+        opciones = {'idiomas': list(dict.fromkeys(idiomas))}
+    if callback:
+        validar_callback(callback)
+
+    id_trabajo = obtener_almacen().crear(
+        tipo, entrada, opciones, prioridad, callback or None, archivos,
+        pendientes_max=int(os.getenv('TRABAJOS_PENDIENTES_MAX', '1000'))
+    )
+    procesador = iniciar_procesador()
+    if procesador is not None:
+        procesador.despertar()
+    return id_trabajo
+
+
+def _por_estado():
+    # /metrics no crea la cola si todavía no se ha enviado ningún trabajo
+    if _almacen is None and not os.path.exists(_ruta()):
+        return {}
+    try:
+        return obtener_almacen().profundidad()['por_estado']
+    except sqlite3.Error:
+        return {}
+
+
+# Se lee al generar /metrics; la cola es del host, lo atienda el worker que lo atienda
+Indicador(
+    'trabajos_cola', 'Trabajos en la cola por estado', ('estado',),
+    lambda: {(estado,): total for estado, total in _por_estado().items()}
+)
+
+
+def _reiniciar_tras_fork():
+    # Los hilos no existen en el hijo: cada worker arranca los suyos
+    global _procesador, _lock, _lock_procesador
+    _procesador = None
+    _lock = threading.Lock()
+    _lock_procesador = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+if __name__ == '__main__':
+    # Procesar la cola en un proceso aparte, p. ej. con TRABAJOS_HILOS=0 en
+    # el servidor web: python trabajos.py --hilos 4
+    import argparse
+
+    from configuracion import cargar_entorno
+    from registro import configurar_registro
+
+    parser = argparse.ArgumentParser(description='Procesa la cola de trabajos en segundo plano')
+    parser.add_argument('--hilos', type=int, default=4, help='Trabajos procesados a la vez')
+    args = parser.parse_args()
+
+    cargar_entorno()
+    configurar_registro()
+    procesador = ProcesadorTrabajos(obtener_almacen(), dict(_leer_config(), hilos=max(1, args.hilos)))
+    procesador.iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        procesador.detener(espera=10.0)